@@ -1,19 +1,50 @@
-import autogen
-import pygame
-import threading 
 import random
 import datetime
 import time
+import sys
 import random
-class User:
+from fetchgpt import CommandRuntime, ToolGate, make_async_tools, startup
+from fetchgpt.fastpath import CommandFastPath, LocalPlanner, parse_command
+from fetchgpt.memo import ToolMemo
+from fetchgpt.offline import OfflineModelClient
+from fetchgpt.progress import ProgressFeed, install_progress_stream
+from fetchgpt.ratelimit import RateLimitedModelClient, configure_rate_limits
+from fetchgpt.routing import CommandClassifier, ModelRouter, RouteTier, agent_cost
+from fetchgpt.speculation import SpeculativeExecutor
+from fetchgpt.tools import READ_ONLY_TOOLS, as_tools, count_model_turns
+from fetchgpt import world as sim
+from fetchgpt.events import EventLog
+from fetchgpt.log import DEBUG, INFO, Logger, Rotation, new_episode_id
+from fetchgpt.scenario import load_scenario, requested_items
+from fetchgpt.world import Graph, ItemLocationManager, Room, World, randomize_entities
+from fetchgpt.scheduler import JobScheduler, SimulatedClock
+# --headless skips the window, image loading, drawing and frame sleeps and runs the generated task straight away;
+# --seed N makes the scenario repeatable, so a headless run logs the same episode as a windowed one
+HEADLESS = "--headless" in sys.argv
+# --scenario FILE[:N] replays the Nth scenario (from 0) of a scenario file or event log: placements, command and seed
+SCENARIO = load_scenario(sys.argv[sys.argv.index("--scenario") + 1]) if "--scenario" in sys.argv else None
+SEED = int(sys.argv[sys.argv.index("--seed") + 1]) if "--seed" in sys.argv else (SCENARIO.seed if SCENARIO else None)
+if SEED is None:
+    SEED = random.randrange(2 ** 32)  # Every run is seeded and logs its seed, so any episode can be replayed
+random.seed(SEED)
+# --offline uses the scripted stand-in model; --frames N quits after N main-loop ticks (startup benchmarks)
+MAX_FRAMES = int(sys.argv[sys.argv.index("--frames") + 1]) if "--frames" in sys.argv else None
+# --urgent "COMMAND" submits a delivery as an urgent job once the robot is on its way, preempting the task's trip
+URGENT_COMMAND = sys.argv[sys.argv.index("--urgent") + 1] if "--urgent" in sys.argv else None
+# Every sprite image is loaded and scaled once; the scaled sprites are kept as an atlas here between launches
+ASSET_CACHE_DIR = ".cache/sprites"
+if not HEADLESS:
+    # pygame, the renderer and the sprite cache are only imported when there is a window to draw
+    import pygame
+    from fetchgpt.assets import AssetCache
+    from fetchgpt.render import DirtyRects, FrameClock, StaticMapLayer, TextCache, sprite_anchors
+    assets = AssetCache(cache_dir=ASSET_CACHE_DIR)
+class User(sim.User):
     def __init__(self, node_id, preferred_side='left', image_path=None, target_size=(50, 50)):
-        self.node_id = node_id
-        self.preferred_side = preferred_side  # 'left' or 'right'
+        super().__init__(node_id, preferred_side)
         self.image_path = image_path
         self.target_size = target_size
-        self.image = pygame.image.load(image_path).convert_alpha() if image_path else None
-        if self.image:
-            self.image = pygame.transform.scale(self.image, target_size)
+        self.image = assets.image(image_path, target_size) if image_path and not HEADLESS else None
 
     def draw(self, screen, position):
         if self.image:
@@ -25,13 +56,11 @@ class User:
                 
             image_position = (position[0] + offset_x, position[1] - self.target_size[1] // 2)
             screen.blit(self.image, image_position)
-class Item:
+class Item(sim.Item):
     def __init__(self, item_id, image_path=None, target_size=(50, 50)):
-        self.item_id = item_id
+        super().__init__(item_id)
         self.image_path = image_path
-        self.image = pygame.image.load(image_path).convert_alpha() if image_path else None
-        if self.image:
-            self.image = pygame.transform.scale(self.image, target_size)  # Resize the image
+        self.image = assets.image(image_path, target_size) if image_path and not HEADLESS else None
 
     def draw(self, screen, position, is_held=False):
         if self.image:
@@ -43,56 +72,6 @@ class Item:
                 # The y-coordinate is decreased by the image's height to move it above
                 offset_position = (position[0] - self.image.get_width() // 2, position[1] - self.image.get_height())
                 screen.blit(self.image, offset_position)
-class ItemLocationManager:
-    def __init__(self):
-        self.item_locations = {}  # Key: item_id, Value: node_id
-
-    def update_item_location(self, item_id, node_id):
-        self.item_locations[item_id] = node_id
-
-    def remove_item(self, item_id):
-        if item_id in self.item_locations:
-            del self.item_locations[item_id]
-    def get_item_location(self, item_id):
-
-        # Retrieve the item's location
-        location = self.item_locations.get(item_id, None)
-        
-        # Log the retrieval action
-        if robot.logger:
-            if location:
-                robot.logger.log(f"Retrieved location for item '{item_id}': {location}")
-            else:
-                robot.logger.log(f"Location for item '{item_id}' not found.")
-        
-        return location
-    def get_all_items(self):
-        """Returns a dictionary of all item IDs and their locations."""
-        return self.item_locations
-class Logger:
-    def __init__(self, log_file="simulation_log.txt"):
-        self.log_file = log_file
-        with open(self.log_file, "w") as file:
-            file.write("Simulation Log\n")
-
-    def log(self, message):
-        with open(self.log_file, "a") as file:
-            file.write(f"{message}\n")
-
-    def log_action(self, action, details=""):
-        """Logs an action with an optional detailed description."""
-        action_message = f"Action: {action}"
-        if details:
-            action_message += f", Details: {details}"
-        self.log(action_message)
-
-    def log_error(self, error_message):
-        """Logs an error message."""
-        self.log(f"ERROR: {error_message}")
-
-    def log_info(self, info_message):
-        """Logs an informational message."""
-        self.log(f"INFO: {info_message}")
 class BlockedNode:
     def __init__(self):
         self.node_id = None  # Initially, no node is blocked
@@ -102,177 +81,21 @@ class BlockedNode:
 
     def is_node_blocked(self, node_id):
         return self.node_id == node_id
-class Robot:
-    def __init__(self, start_node, graph, image_path=None, logger=None):
-        self.current_node = start_node
-        self.graph = graph
-        self.logger = logger
-        self.x, self.y = self.graph.get_node_coordinates(start_node)
-        self.path = []
-        self.blocked_nodes = []
-        self.blockage_encountered = False
-        self.image = pygame.image.load(image_path).convert_alpha() if image_path else None
-        if self.image:
-            # Optionally, scale the image
-            self.image = pygame.transform.scale(self.image, (50, 50))  # Resize to 50x50 or any appropriate size
-        self.held_item = None  # Initialize held_item as None
-    def move_to_node(self, target_node):
-        # No need to find a path; just check if the next node is blocked or not.
-        if target_node in self.graph.blocked_nodes:
-            # If trying to move to a blocked node, log the event and do not update position.
-            if self.logger:
-                self.logger.log(f"Attempted to move to blocked node {target_node}.")
-            return f"Node {target_node} blocked"
-        elif target_node in self.graph.get_all_nodes():
-            # Update the robot's current position to the target node if it is not blocked.
-            self.current_node = target_node
-            self.x, self.y = self.graph.get_node_coordinates(target_node)
-            if self.logger:
-                self.logger.log(f"Moved to node {target_node}.")
-            return f"Moved to {target_node}"
-
-    def move_to_coordinates(self, x, y):
-        """Updates the robot's position based on coordinates. Not typically used with graph navigation."""
-        self.x, self.x = x, y
-        if self.logger:
-            self.logger.log(f"Robot moved to new coordinates: ({x}, {y})")
-
-    def current_position(self):
-        """Returns the current position of the robot."""
-        return self.current_node
-
-    def current_room(self):
-        """Determines the current room based on the robot's node."""
-        for room_name, room_nodes in self.graph.nodes.items():
-            if self.current_node in room_nodes:
-                return room_name
-        return "Unknown room"
-
-    def pick_up_item(self, item_manager, item_id):
-        """Attempts to pick up a specified item.
-
-        Args:
-            item_manager (ItemLocationManager): The manager controlling item locations.
-            item_id (str): The ID of the item to pick up.
-
-        Returns:
-            str: A message indicating the result of the pick-up attempt.
-        """
-        if item_manager.get_item_location(item_id) == self.current_node:
-            self.held_item = items[item_id]  # Assume item is identified by its ID for simplicity
-            item_manager.remove_item(item_id)
-            if self.logger:
-                self.logger.log(f"Picked up item {item_id} at {self.current_node}")
-            return f"Picked up item {item_id}"
-        else:
-            if self.logger:
-                self.logger.log(f"Failed to pick up item {item_id} at {self.current_node}")
-            return f"Failed to pick up item {item_id}. Item not at robot's current location."
-
-    def drop_off_item(self, item_manager, item_id, node_id):
-        if self.held_item == items[item_id]:
-            self.held_item = None  # The robot is no longer holding the item
-            item_manager.update_item_location(item_id, node_id)
-            if self.logger:
-                self.logger.log(f"Dropped off item {item_id} at {node_id}")
-
-class Graph:
-    def __init__(self, blocked_nodes=None):
-        self.nodes = {}
-        self.edges = {}
-        self.blocked_nodes = blocked_nodes if blocked_nodes else []
-
-    def add_blocked_node(self, node_id):
-        if node_id not in self.blocked_nodes:
-            self.blocked_nodes.append(node_id)
-    def add_node(self, room_name, node_id, coordinates):
-        if room_name not in self.nodes:
-            self.nodes[room_name] = {}
-        self.nodes[room_name][node_id] = coordinates
-
-    def add_edge(self, node1, node2, weight=1):
-        if node1 not in self.edges:
-            self.edges[node1] = {}
-        if node2 not in self.edges:
-            self.edges[node2] = {}
-        self.edges[node1][node2] = weight
-        self.edges[node2][node1] = weight
-    
-    def find_path(self, start, end):
-        if start == end:
-            return [start]
-        visited = {start}
-        queue = [[start]]
-        while queue:
-            path = queue.pop(0)
-            node = path[-1]
-            for adjacent in self.edges.get(node, {}):
-                if adjacent not in visited:
-                    new_path = list(path)
-                    new_path.append(adjacent)
-                    queue.append(new_path)
-                    if adjacent == end:
-                        return new_path
-                    visited.add(adjacent)
-        return []
-    def find_path_avoiding_blocked_nodes(self, start, end, blocked_nodes):
-        if start == end:
-            return [start]
-        visited = {start}
-        queue = [[start]]
-        while queue:
-            path = queue.pop(0)
-            node = path[-1]
-            if node in blocked_nodes:
-                continue  # Skip this node as it's blocked, but continue searching other paths
-            for adjacent in self.edges.get(node, {}):
-                if adjacent not in visited and adjacent not in blocked_nodes:
-                    new_path = list(path)
-                    new_path.append(adjacent)
-                    queue.append(new_path)
-                    if adjacent == end:
-                        return new_path  # Return this path as soon as end node is reached
-                    visited.add(adjacent)
-        return None  # Return None if no path is found avoiding the blocked nodes
-    def get_node_coordinates(self, node_id):
-        for room, nodes in self.nodes.items():
-            if node_id in nodes:
-                return nodes[node_id]
-        return None
-    def get_all_nodes(self):
-        """Retrieves all nodes from the graph."""
-        return {node for room_nodes in self.nodes.values() for node in room_nodes}
-class Room:
-    def __init__(self, name, x1, y1, x2, y2, graph):
-        self.name = name
-        self.bounds = (x1, y1, x2, y2)
-        self.graph = graph
-        self.nodes = []
-
-    def is_inside(self, x, y, margin=0):
-        """Check if a given point is inside the room considering an optional margin."""
-        x1, y1, x2, y2 = self.bounds
-        return (x1 - margin) <= x <= (x2 + margin) and (y1 - margin) <= y <= (y2 + margin)
-
-    def add_node(self, node_id, coordinates):
-        """Adds a node to the room and the associated graph."""
-        self.nodes.append(node_id)
-        self.graph.add_node(self.name, node_id, coordinates)
-
-    def add_edge(self, node1, node2, weight=1):
-        """Adds an edge between two nodes within the room in the graph."""
-        if node1 in self.nodes and node2 in self.nodes:
-            self.graph.add_edge(node1, node2, weight)
-
-    def get_node_coordinates(self, node_id):
-        """Get the coordinates of a specific node within the room."""
-        return self.graph.get_node_coordinates(node_id)
+class Robot(sim.Robot):
+    def __init__(self, start_node, graph, image_path=None, logger=None, items=None, events=None):
+        super().__init__(start_node, graph, logger=logger, items=items, events=events)
+        self.image = assets.image(image_path, (50, 50)) if image_path and not HEADLESS else None
 
 
 def initialize_pygame():
     """Initializes the Pygame environment, including display settings and resources."""
     global screen, font
-    pygame.init()
+    if HEADLESS:
+        screen = font = None  # Nothing is drawn
+        return
+    # Only the display and fonts; the mixer, joystick and other subsystems are never used
+    pygame.display.init()
+    pygame.font.init()
     SCREEN_WIDTH, SCREEN_HEIGHT = 1920, 1080
     screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
     font = pygame.font.Font(None, 36)  # Basic font for text rendering
@@ -313,8 +136,7 @@ def create_rooms_and_graph():
 
 def initialize_robot(start_node="lr1"):
     """Initializes the robot at a given start node."""
-    global robot, logger
-    logger = Logger()  
+    global robot
     image_path = r'C:\Users\oeini\OneDrive\Documents\GitHub\current\robot-llm\143b8e1550deda3eadf5a8c0045cbb0f-robot-toy-flat-removebg-preview.png'
     robot = Robot(start_node, graph, image_path, logger)  
 
@@ -382,8 +204,8 @@ def draw_dashboard():
     global robot, font, SCREEN_HEIGHT, graph, me  # Ensure all necessary globals are referenced
     """Draws the dashboard area with information about the robot's status."""
     pygame.draw.rect(screen, (0, 0, 0), [0, SCREEN_HEIGHT - DASHBOARD_HEIGHT, SCREEN_WIDTH, DASHBOARD_HEIGHT])
-    current_room_text = font.render(f"Current Room: {get_current_robot_room()}", True, (255, 255, 255))
-    current_position_text = font.render(f"Position: {get_current_robot_position()}", True, (255, 255, 255))
+    current_room_text = text_cache.render(font, f"Current Room: {get_current_robot_room()}", True, (255, 255, 255))
+    current_position_text = text_cache.render(font, f"Position: {get_current_robot_position()}", True, (255, 255, 255))
     screen.blit(current_room_text, (10, SCREEN_HEIGHT - DASHBOARD_HEIGHT + 10))
     screen.blit(current_position_text, (10, SCREEN_HEIGHT - DASHBOARD_HEIGHT + 50))
     
@@ -393,7 +215,7 @@ def draw_dashboard():
     y_offset = 10
 
     # Displaying the user's location
-    user_node_text = font.render(f"User Node: {me.node_id}", True, WHITE)
+    user_node_text = text_cache.render(font, f"User Node: {me.node_id}", True, WHITE)
     screen.blit(user_node_text, (start_x, SCREEN_HEIGHT - DASHBOARD_HEIGHT + y_offset))
 def handle_events():
     """Handles events such as input and quitting."""
@@ -417,23 +239,54 @@ def handle_key_press(key):
     if key == pygame.K_RETURN:
         pass  
 
-def execute_command_async(command):
-
-    def thread_target():
-
-        global user, robot_agent
-        if command.strip():  
-            response = user.initiate_chat(robot_agent, message=command)
-
+async def run_chat(command):
+    """Runs one command on the command runtime's event loop, on the tier the router picks for it."""
+    progress.push(f"You: {command}")
+    events.emit("command", command=command)
+    started = time.monotonic()
+    response = await router.run(command)
+    events.emit("response", command=command, response=getattr(response, "summary", response),
+                seconds=round(time.monotonic() - started, 3))
+    if isinstance(response, str):
+        progress.push(f"Robot: {response}")  # Handled locally, so no agent messages were shown
+    return response
+
+async def chat_with(agent, command):
+    """Runs one model conversation about command with the given assistant agent."""
+    global user
+    world_snapshot.new_conversation()
+    tool_memo.new_conversation()
+    async with speculator.speculating(command):
+        chat_result = await user.a_initiate_chat(agent, message=command)
+    turns = count_model_turns(chat_result)
+    logger.log_info(f"Model turns for '{command}' with {agent.name}: {turns}", category="model")
+    events.emit("model_turns", command=command, agent=agent.name, turns=turns)
+    return chat_result
 
+def execute_command_async(command):
+    """Queues a command on the command runtime; it starts once every earlier command has finished."""
     if command.strip():
-        command_thread = threading.Thread(target=thread_target)
-        command_thread.start()
+        return command_runtime.submit(command)
+def job_delivered(job):
+    """Checks the item manager to see whether a scheduled delivery job reached its destination."""
+    destination = me.node_id if job.destination == 'me' else job.destination
+    return item_manager.get_all_items().get(job.item_id) == destination
+def submit_urgent(command):
+    """
+    Submits a delivery command to the scheduler as urgent jobs with a deadline.
+    Returns the jobs, or None if the command is not a delivery to a single destination.
+    """
+    deliveries = parse_command(command, items)
+    if not deliveries or len({destination for _, destination in deliveries}) > 1:
+        logger.log_error(f"Urgent command is not a delivery to one destination: {command}")
+        return None
+    return scheduler.submit_batch([item_id for item_id, _ in deliveries], deliveries[0][1],
+                                  priority=URGENT_PRIORITY, deadline=sim_clock() + URGENT_DEADLINE)
 def draw_conversation(screen, font, conversation_log):
     start_y = 20  # Starting Y position to draw from
-    line_height = 20  # Vertical space between lines
+    line_height = font.get_linesize()  # Vertical space between lines
     for i, message in enumerate(conversation_log):
-        text_surface = font.render(message, True, (255, 255, 255))
+        text_surface = text_cache.render(font, message, True, (255, 255, 255))
         screen.blit(text_surface, (20, start_y + i * line_height))
 def log_info(message):
     """Logs informational messages to the log file."""
@@ -452,70 +305,26 @@ def log_error(error_message):
 
 def move_robot(next_node):
     """Global function to move the robot to the next node."""
-    global robot  # Ensure global access to the robot instance
-    return robot.move_to_node(next_node)
+    return world.move_robot(next_node)
+def execute_path(nodes):
+    """Global function to move the robot along a whole path in one call, stopping at the first blocked node."""
+    return world.execute_path(nodes)
 def get_current_position():
-    global robot  # Assuming 'robot' is an instance of the Robot class
-    position = robot.current_position()
-    logger.log(f"Current position retrieved: {position}")
-    return position
+    return world.get_current_position()
 
 def get_robot_current_room():
     """Get the name of the room where the robot currently is."""
-    global robot  # Assuming 'robot' is an instance of the Robot class
-    return robot.current_room()
+    return world.get_robot_current_room()
 
 def get_path(start_node, target_node):
     """Global function to find a path from the start node to the target node."""
-    global graph  # Ensure 'graph' is accessible
-    assert start_node in graph.get_all_nodes(), "Start must be a valid node identifier."
-    assert target_node in graph.get_all_nodes(), "Target must be a valid node identifier."
-
-    # Pass the logger to the find_path method
-    path = graph.find_path(start_node, target_node)
-
-    logger.log(f"get_path: Path from {start_node} to {target_node}: {path}")
-    return path
+    return world.get_path(start_node, target_node)
 def get_alternative_path(start_node, target_node, blocked_nodes):
     """Global function to find an alternative path avoiding certain nodes."""
-    global graph
-    # Ensure start_node is updated correctly, possibly from global state or passed directly
-    start_node = robot.current_node  # Assume global access to robot
-    # Pass the logger to the method
-    path = graph.find_path_avoiding_blocked_nodes(start_node, target_node, blocked_nodes)
-    logger.log(f"get_alternative_path: Alternative path from {start_node} to {target_node} avoiding {blocked_nodes}: {path}")
-    return path
+    return world.get_alternative_path(start_node, target_node, blocked_nodes)
 def get_node_info(room_name):
-    """
-    Retrieves information about the specified room, including its nodes and the connecting edges between those nodes.
-
-    Args:
-    room_name (str): The name of the room for which information is requested.
-
-    Returns:
-    dict: A dictionary containing the nodes within the specified room and the edges connecting those nodes.
-    """
-    global graph  # Ensure the 'graph' instance is globally accessible.
-
-    # Initialize an empty dictionary for room info
-    room_info = {}
-
-    # Check if the room exists in the graph
-    if room_name in graph.nodes:
-        # Extract node names and their connecting edges within the room
-        node_names = list(graph.nodes[room_name].keys())
-        edges = {}
-        for node in node_names:
-            if node in graph.edges:
-                # Only include edges that are within the same room
-                edges[node] = {edge: graph.edges[node][edge] for edge in graph.edges[node] if edge in node_names}
-        
-        room_info = {
-            'nodes': node_names,
-            'edges': edges
-        }
-    
-    return room_info
+    """Retrieves the nodes of the specified room and the edges between them."""
+    return world.get_node_info(room_name)
 def draw_edges(graph, screen):
     for start_node, connections in graph.edges.items():
         start_pos = graph.get_node_coordinates(start_node)
@@ -534,24 +343,22 @@ global item_manager
 
 def pick_up_item_robot(item_id):
     """Global function to command the robot to pick up an item."""
-    global robot
-    return robot.pick_up_item(item_manager, item_id)
+    return world.pick_up_item_robot(item_id)
 
 def drop_off_item_robot(item_id, node_id):
     """Global function to command the robot to drop off an item."""
-    global robot
-    return robot.drop_off_item(item_manager, item_id, node_id)
+    return world.drop_off_item_robot(item_id, node_id)
 
 def get_item_location(item_id):
     """Global function to get the location of an item."""
-    global item_manager
-    return item_manager.get_item_location(item_id)
-
+    return world.get_item_location(item_id)
 
 def get_user_node():
     """Retrieves the node at which the user is currently located."""
-    global me  
-    return me.node_id
+    return world.get_user_node()
+def get_world_snapshot(item_ids=None):
+    """Global function returning the robot, user, item and known blocked-node state in one compact string."""
+    return world.get_world_snapshot(item_ids)
 def draw_item_on_map(screen, robot, item_manager, items, graph, user):
     node_item_counts = {}  # Track the number of items per node
 
@@ -589,39 +396,6 @@ def draw_item_on_map(screen, robot, item_manager, items, graph, user):
 
             # Increment the item count for this node
             node_item_counts[node_id] += 1
-def randomize_entities(graph, items, num_blocked):
-    all_nodes = list(graph.get_all_nodes())
-
-    # Initialize the list for blocked nodes
-    blocked_nodes = []
-
-    # Assign blocked nodes using random integers
-    while len(blocked_nodes) < num_blocked:
-        index = random.randint(0, len(all_nodes) - 1)
-        blocked_node = all_nodes.pop(index)
-        blocked_nodes.append(blocked_node)
-
-    # Filter out nodes ending with '5' or '6' for other entities
-    eligible_nodes = [node for node in all_nodes if not node.endswith('5') and not node.endswith('6')]
-
-    # Assign the robot node using a random integer
-    robot_index = random.randint(0, len(eligible_nodes) - 1)
-    robot_node = eligible_nodes.pop(robot_index)
-
-    # Assign the user node using a random integer
-    user_index = random.randint(0, len(eligible_nodes) - 1)
-    user_node = eligible_nodes.pop(user_index)
-
-    # Assign item nodes using random integers
-    item_nodes = {}
-    for item_id in items.keys():
-        item_index = random.randint(0, len(eligible_nodes) - 1)
-        item_node = eligible_nodes.pop(item_index)
-        item_nodes[item_id] = item_node
-
-    # Return the assigned nodes
-    return robot_node, user_node, item_nodes, blocked_nodes
-
 # AutoGen configuration
 config_list = [
     {
@@ -631,8 +405,25 @@ config_list = [
         "timeout": 300
     }
 ]
+# "offline" swaps the API model for the scripted stand-in in fetchgpt.offline; no key or network needed
+MODEL_BACKEND = "offline" if "--offline" in sys.argv else "openai"
+if MODEL_BACKEND == "offline":
+    config_list = [{"model": "offline", "model_client_cls": "OfflineModelClient"}]
+# API requests from every conversation share one process-wide budget; throttling backs them all off together
+RATE_LIMITS = {"rpm": 500, "tpm": 30000}
+if MODEL_BACKEND == "openai":
+    rate_limiter = configure_rate_limits(**RATE_LIMITS)
+    for config in config_list:
+        config["model_client_cls"] = "RateLimitedModelClient"
+# Commands the router judges easy go to this cheaper model first
+SMALL_MODEL = "gpt-3.5-turbo-0125"
+small_config_list = [dict(config, model=SMALL_MODEL) for config in config_list]
+if MODEL_BACKEND == "offline":
+    # Stand-in for a weaker model: it gives up at the first blocked node
+    small_config_list = [dict(config_list[0], give_up_on_blocked=True)]
+# Declared as tools rather than legacy functions so the model can make several calls per turn
 llm_config = {
-    "functions": [
+    "tools": as_tools([
         {
             "name": "move_robot",
             "description": "Moves the robot to the next specified node within the environment.",
@@ -644,6 +435,17 @@ llm_config = {
                 "required": ["next_node"]
             }
         },
+        {
+            "name": "execute_path",
+            "description": "Moves the robot along a path of adjacent nodes, such as a get_path result, in one call. Stops at the first blocked node and reports where the robot stopped and which node was blocked.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "nodes": {"type": "array", "items": {"type": "string"}, "description": "Node identifiers to visit in order; a leading entry equal to the current node is skipped."}
+                },
+                "required": ["nodes"]
+            }
+        },
         {
             "name": "get_current_position",
             "description": "Returns the robot's current node, providing a reference point for navigation decisions.",
@@ -717,17 +519,27 @@ llm_config = {
                 "required": ["item_id"]
             }
         },
-    ],
+        {
+            "name": "get_world_snapshot",
+            "description": "Returns in one call the robot's node and room, the held item, the user's node, the locations of the given items and the blocked nodes discovered so far. Replies 'unchanged' when nothing changed since the last snapshot.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "item_ids": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Identifiers of the items whose locations to include; all items if omitted."
+                    }
+                },
+                "required": []
+            }
+        },
+    ]),
     "config_list": config_list, "max_retries": 20, "timeout": 100,
+    "stream": MODEL_BACKEND == "openai",  # Tokens show up in the window as they arrive
+    "cache_seed": None if MODEL_BACKEND == "offline" else 41,  # The offline model is stateful; never replay it from cache
 }
-# Initialize AutoGen agents
-user = autogen.UserProxyAgent(name="User", 
-human_input_mode="NEVER",
-is_termination_msg=lambda x: x.get("content", "") and x.get("content", "").rstrip().endswith("TERMINATE"), 
-max_consecutive_auto_reply=45)
-robot_agent = autogen.AssistantAgent(name="Robot", 
-llm_config=llm_config, 
-system_message = """
+ROBOT_SYSTEM_MESSAGE = """
 **Robot Navigation Agent**
 Role: You take on the role of autonomous robotic agent tasked with navigation and item retrieval in a dynamic 2D environment. You use functions to 
 perceive, navigate, and interact with your environment.
@@ -745,7 +557,11 @@ Inputs:
 Task:
 -Decision-Making: Determine the sequence of actions required to complete the delivery tasks, adapting to any new obstacles.
 -Path Planning: Generate optimal paths to move between nodes, retrieve items, and deliver them to the user.
+-Path Execution: Follow a planned path with a single execute_path call rather than one move_robot call per node. If it stops at a blocked node, plan an alternative path from where it stopped.
 -Obstacle Handling: Remember ALL blocked nodes encountered and Adjust your route dynamically in response to blocked nodes. If node is blocked, remember the node you tried to move from to use to find an alternative path
+-Orientation: Call get_world_snapshot once with the items you need instead of querying your position, the user's node and each item location separately. It answers "unchanged" if nothing changed since your last snapshot.
+-Repeated Lookups: A lookup answered with "unchanged since last call" returned the same result as the last time you made that exact call in this conversation.
+-Parallel Calls: Request independent lookups, such as several item locations and the user's node, together in one turn.
 
 Output:
 -Plan Action Sequence: The series of steps you plan to execute.
@@ -754,46 +570,102 @@ Output:
 -Obstacle Response: Your strategy for addressing any encountered obstacles.
 
 Once the task is complete, respond with "TERMINATE".
-""")
-
-# Register functions with the UserProxyAgent
-# Ensure each referenced function is defined and correctly implemented in the project
-user.register_function(
-    function_map={
-        "move_robot": move_robot,
-        "get_current_position": get_current_position,
-        "get_path": get_path,
-        "get_alternative_path": get_alternative_path,  
-        "pick_up_item_robot": pick_up_item_robot,
-        "drop_off_item_robot": drop_off_item_robot,
-        "get_item_location": get_item_location,
-        "get_user_node": get_user_node
-    }
-)
+"""
+# The agents, and with them autogen and the model client, are created by the first command that needs a model
+user = robot_agent = planner_agent = None
+
+
+def create_agents():
+    """Builds the AutoGen agents, registers the tools with them and connects them to the progress feed."""
+    global user, robot_agent, planner_agent
+    import autogen
+
+    user = autogen.UserProxyAgent(name="User", human_input_mode="NEVER",
+        is_termination_msg=lambda x: x.get("content", "") and x.get("content", "").rstrip().endswith("TERMINATE"),
+        max_consecutive_auto_reply=45)
+    robot_agent = autogen.AssistantAgent(name="Robot", llm_config=llm_config, system_message=ROBOT_SYSTEM_MESSAGE)
+    planner_agent = autogen.AssistantAgent(name="Planner", llm_config=dict(llm_config, config_list=small_config_list),
+                                           system_message=ROBOT_SYSTEM_MESSAGE)
+    for agent in (robot_agent, planner_agent):
+        if MODEL_BACKEND == "offline":
+            agent.register_model_client(model_client_cls=OfflineModelClient)
+        elif MODEL_BACKEND == "openai":
+            agent.register_model_client(model_client_cls=RateLimitedModelClient)
+    # Register functions with the UserProxyAgent
+    # Ensure each referenced function is defined and correctly implemented in the project
+    user.register_function(
+        function_map=make_async_tools({
+            "move_robot": move_robot,
+            "execute_path": execute_path,
+            "get_current_position": get_current_position,
+            "get_path": get_path,
+            "get_alternative_path": get_alternative_path,  
+            "pick_up_item_robot": pick_up_item_robot,
+            "drop_off_item_robot": drop_off_item_robot,
+            "get_item_location": get_item_location,
+            "get_user_node": get_user_node,
+            "get_world_snapshot": get_world_snapshot
+        }, read_only=READ_ONLY_TOOLS, gate=tool_gate)
+    )
+    install_progress_stream(progress)
+    progress.watch(robot_agent)
+    progress.watch(planner_agent)
+    user.register_function(function_map=speculator.wrap(user.function_map))
+    user.register_function(function_map=tool_memo.wrap(user.function_map))
+    user.register_function(function_map=progress.wrap(user.function_map))
+
+
+def get_agent(name):
+    """The "robot" or "planner" agent; the first call creates all of them."""
+    if user is None:
+        create_agents()
+    return robot_agent if name == "robot" else planner_agent
+
+
 # Initialize the robot at a given start node
-logger = Logger()  
+# Each run logs to its own files in LOG_DIR, named by episode id, so no run overwrites another's history;
+# files are split into segments by size and age, and closed segments are listed in the index
+LOG_DIR = "logs"
+EPISODE_ID = new_episode_id()
+LOG_ROTATION = Rotation(max_bytes=16 * 1024 * 1024, max_seconds=3600, compress=False, index_file=f"{LOG_DIR}/index.jsonl")
+# Per-hop moves, path queries, item lookups and memo hits are DEBUG detail, off by default; turn a category on
+# with e.g. LOG_CATEGORIES = {"planning": DEBUG}. The event log records all of it either way.
+LOG_LEVEL = INFO
+LOG_CATEGORIES = {}
+logger = Logger(f"{LOG_DIR}/{EPISODE_ID}.log", rotation=LOG_ROTATION, level=LOG_LEVEL, categories=LOG_CATEGORIES)
+# Typed events (moves, path queries, commands, ...) for analysis; the .log file stays the readable view
+events = EventLog(f"{LOG_DIR}/{EPISODE_ID}.events.jsonl", episode=EPISODE_ID, rotation=LOG_ROTATION)
 MAX_MESSAGES = 5  # Maximum number of messages to display
-conversation_log = []  # Holds the most recent conversation lines
+# Agent messages, streamed tokens and tool calls reach the window through this feed; it never blocks either side
+progress = ProgressFeed(max_lines=MAX_MESSAGES, width=100)
+conversation_log = progress.lines  # Holds the most recent conversation lines
 
 setup_simulation()
 # Pygame window, colors, and fonts initialization
 SCREEN_WIDTH, SCREEN_HEIGHT, DASHBOARD_HEIGHT = 1920, 1080, 150
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-font = pygame.font.Font(None, 36)  # Basic font for text rendering
+CACHE_TEXT = True  # Keep rendered labels and conversation lines instead of re-rasterizing them every frame
+if not HEADLESS:
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    font = pygame.font.Font(None, 36)  # Basic font for text rendering
+    text_cache = TextCache(enabled=CACHE_TEXT)
 WHITE, RED, BLACK = (255, 255, 255), (255, 0, 0), (0, 0, 0)
 user_image_path = r'C:\Users\oeini\OneDrive\Documents\GitHub\Current\robot-llm\pngtree-man-in-shirt-smiles-and-gives-thumbs-up-to-show-approval-png-image_10094381.png'
 robot_image_path = r'C:\Users\oeini\OneDrive\Documents\\GitHub\current\robot-llm\143b8e1550deda3eadf5a8c0045cbb0f-robot-toy-flat-removebg-preview.png'
 me = User(node_id='li3', preferred_side='left', image_path=user_image_path)
 
-item_manager = ItemLocationManager()
+item_manager = ItemLocationManager(logger)
 items = {
     'water': Item('water', r'C:\Users\oeini\OneDrive\Documents\GitHub\Current\robot-llm\IMAGES\removed\3105807.png', target_size=(25, 25)),
     'banana': Item('banana', r'C:\Users\oeini\OneDrive\Documents\GitHub\Current\robot-llm\IMAGES\removed\banana-removebg-preview.png', target_size=(25, 25)),
 }
+FLOORPLAN = "2-rm-2-job"  # Name scenario files use for the house create_rooms_and_graph builds
 num_blocked_nodes = 1
 
 # Randomize nodes for all entities and blocked nodes
 robot_node, user_node, item_nodes, blocked_nodes = randomize_entities(graph, items, num_blocked_nodes)
+if SCENARIO:
+    # Replaying: the recorded placements; the draws above still run, so a seeded replay continues like the original
+    robot_node, user_node, item_nodes, blocked_nodes = SCENARIO.placements(graph, FLOORPLAN, items)
 # Based on the user_node value, set the preferred side
 if user_node[-1] in ['1', '3']:
     preferred_side = 'left'
@@ -803,14 +675,54 @@ else:
     preferred_side = 'left'  # Default or based on additional logic
 
 # Update your entities with these nodes
-robot = Robot(robot_node, graph, robot_image_path, logger)
+robot = Robot(robot_node, graph, robot_image_path, logger, items=items, events=events)
 me = User(node_id=user_node, preferred_side=preferred_side, image_path=user_image_path)
+if not HEADLESS:
+    assets.save()
 
 # Update item locations in the item manager
 for item_id, node_id in item_nodes.items():
     item_manager.update_item_location(item_id, node_id)
 # Set the blocked node in the graph
 graph.blocked_nodes = blocked_nodes
+# The tool functions act on this world; its snapshot is served by the get_world_snapshot tool
+world = World(graph, robot, me, item_manager, items, logger=logger, events=events,
+              on_move=lambda node: sim_clock.tick())  # Every hop attempt costs simulated travel time
+world_snapshot = world.snapshot
+# Commands matching the delivery grammar are carried out by the local planner without the LLM
+FAST_PATH = True
+# The planner and speculative hops take their turn on the world through the same gate as the tools
+tool_gate = ToolGate()
+planner = LocalPlanner(robot, graph, item_manager, lambda: me.node_id, move=move_robot, logger=logger)
+fast_path = CommandFastPath(items, planner, logger=logger, enabled=FAST_PATH)
+# Optionally drive ahead along the most likely next path while the model is deliberating
+SPECULATE = False
+HOP_SECONDS = 0.5  # Drive time per hop while speculating
+speculator = SpeculativeExecutor(robot, graph, item_manager, lambda: me.node_id, items, move=world.move_robot,
+                                 gate=tool_gate, hop_seconds=HOP_SECONDS, enabled=SPECULATE, logger=logger)
+# Repeated read-only calls within a conversation are answered from memo until the world or its blocked nodes change
+MEMOIZE = True
+tool_memo = ToolMemo(lambda: robot.state_version, lambda: graph.blocked_nodes, logger=logger, enabled=MEMOIZE)
+# Each command starts on the cheapest tier the classifier allows and escalates when that tier fails
+route_tiers = [
+    RouteTier("small", lambda command: chat_with(get_agent("planner"), command), cost=lambda: agent_cost(planner_agent)),
+    RouteTier("large", lambda command: chat_with(get_agent("robot"), command), cost=lambda: agent_cost(robot_agent)),
+]
+if FAST_PATH:
+    route_tiers.insert(0, RouteTier("local", tool_gate.writer(fast_path.try_execute)))
+router = ModelRouter(route_tiers, CommandClassifier(items, robot, graph, item_manager, lambda: me.node_id), logger=logger)
+# Commands are executed one at a time, in submission order, on the asyncio command runtime
+COMMAND_TIMEOUT = 600  # Seconds before a command's conversation is cancelled
+command_runtime = CommandRuntime(run_chat, timeout=COMMAND_TIMEOUT, logger=logger).start()
+# Deliveries are submitted as structured jobs; the scheduler orders and merges them into trips
+SECONDS_PER_HOP = 3  # Simulated travel time between adjacent nodes
+sim_clock = SimulatedClock(SECONDS_PER_HOP)
+# A preempted trip puts down whatever the robot carries, so its job can pick the item up again later
+# Typing "urgent: <delivery>" (or --urgent) submits it at this priority, which preempts a routine trip
+URGENT_PRIORITY = 10
+URGENT_DEADLINE = 120  # Simulated seconds an urgent delivery is given
+scheduler = JobScheduler(command_runtime, clock=sim_clock, is_delivered=job_delivered, urgent_priority=URGENT_PRIORITY,
+                         logger=logger, on_preempted=tool_gate.writer(world.put_down_held_item))
 running = True
 active = False  
 logger.log("Initial Locations:")
@@ -837,19 +749,56 @@ second_random_item = item_ids[second_random_index]
 
 # Prepare the command text with the first random item
 text = f"Bring {first_random_item} to me then {second_random_item}"
+if SCENARIO and SCENARIO.command:
+    text = SCENARIO.command
 logger.log(f"Task: {text}")
-
-# Input box setup for command input
-input_box = pygame.Rect(100, SCREEN_HEIGHT - 40, 140, 32)
-color_inactive = pygame.Color('lightskyblue3')
-color_active = pygame.Color('dodgerblue2')
-color = color_inactive
-
+events.start_episode(robot_node, user_node, item_nodes, blocked_nodes, text, SEED, floorplan=graph.edges,
+                      floorplan_name=FLOORPLAN)
+# Pressing Enter on the generated task submits its deliveries to the scheduler as structured jobs
+task_text = text
+task_jobs = [first_random_item, second_random_item]
+if SCENARIO and SCENARIO.command:
+    task_jobs = requested_items(text, items)
+
+SPRITE_MARGIN = 70  # Distance from a robot, user or item anchor point that its sprite can reach
+TICK_RATE = 60  # Main loop ticks per second; events and world changes are handled every tick
+MAX_FPS = 30  # Frame cap; 0 draws on every tick that has changes
+
+if HEADLESS:
+    # No window to type into: hand the task to the scheduler as if it had been entered, then exit once it is done
+    startup.mark("command")
+    scheduler.submit_batch(task_jobs, destination='me')
+    if URGENT_COMMAND:
+        # Wait for the trip's first hop so the urgent job has a trip to preempt
+        while not sim_clock() and not scheduler.wait_idle(0.01):
+            pass
+        submit_urgent(URGENT_COMMAND)
+    scheduler.wait_idle()
+    startup.mark("done")
+    running = False
+else:
+    # Input box setup for command input
+    input_box = pygame.Rect(100, SCREEN_HEIGHT - 40, 140, 32)
+    color_inactive = pygame.Color('lightskyblue3')
+    color_active = pygame.Color('dodgerblue2')
+    color = color_inactive
+    # Floorplan drawn once and reused until the blocked nodes or the topology change
+    static_map = StaticMapLayer(graph, [library, office, guest_room, gym, living_room, study_room], (SCREEN_WIDTH, SCREEN_HEIGHT), background=BLACK)
+    # Screen areas redrawn when their part of the world changes
+    dirty = DirtyRects((SCREEN_WIDTH, SCREEN_HEIGHT))
+    dashboard_rect = pygame.Rect(0, SCREEN_HEIGHT - DASHBOARD_HEIGHT, SCREEN_WIDTH, DASHBOARD_HEIGHT)
+    conversation_rect = pygame.Rect(0, 0, SCREEN_WIDTH, 20 + MAX_MESSAGES * font.get_linesize())
+    frame_clock = FrameClock(TICK_RATE, MAX_FPS)
 while running:
-    events = pygame.event.get()
-    for event in events:
+    frame_clock.tick()
+    window_events = pygame.event.get()
+    for event in window_events:
+        if event.type in (pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN):
+            frame_clock.mark("input")
         if event.type == pygame.QUIT:
             running = False
+        elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+            dirty.add_full()  # The window contents were lost
         elif event.type == pygame.MOUSEBUTTONDOWN:
             if input_box.collidepoint(event.pos):
                 active = not active
@@ -859,7 +808,15 @@ while running:
         elif event.type == pygame.KEYDOWN:
             if active:
                 if event.key == pygame.K_RETURN:
-                    if text.strip():  # Check if 'text' contains more than just whitespace
+                    if task_jobs and text == task_text:
+                        scheduler.submit_batch(task_jobs, destination='me')
+                        task_jobs = []
+                        text = ''
+                    elif text.lower().startswith("urgent:"):
+                        # Urgent deliveries go to the scheduler, ahead of (and preempting) routine trips
+                        submit_urgent(text.split(":", 1)[1])
+                        text = ''
+                    elif text.strip():  # Check if 'text' contains more than just whitespace
                         execute_command_async(text)
                         text = ''  # Clear the text input after executing the command
                     active = False  # Deactivate the input box after executing a command
@@ -867,25 +824,59 @@ while running:
                     text = text[:-1]
                 else:
                     text += event.unicode
-    screen.fill(BLACK)
-    draw_nodes(graph, robot)  
-    draw_edges(graph, screen)
-    draw_room(library)  
-    draw_room(office)  
-    draw_room(guest_room)
-    draw_room(gym)  
-    draw_room(living_room)  
-    draw_room(study_room)
-    draw_user_on_map(screen, me, graph)
-    draw_item_on_map(screen, robot, item_manager, items, graph, me)
-    draw_robot(robot, screen)  
-    draw_dashboard()  
-    txt_surface = font.render(text, True, color)
-    width = max(200, txt_surface.get_width() + 10)
-    input_box.w = width
-    screen.blit(txt_surface, (input_box.x + 5, input_box.y + 5))
-    pygame.draw.rect(screen, color, input_box, 2)
-
-    pygame.display.flip()   
-    time.sleep(0.5)
-pygame.quit()   
\ No newline at end of file
+    # Only what changed since the last frame is redrawn and presented; an idle frame draws nothing
+    if dirty.changed("map", static_map.key):
+        dirty.add_full()
+    if dirty.changed("world", (robot.state_version, me.node_id)):
+        dirty.add_sprites(sprite_anchors(graph, robot, me, item_manager), SPRITE_MARGIN)
+        frame_clock.mark("world")
+        dirty.add(dashboard_rect)
+    if progress.drain():
+        dirty.add(conversation_rect)
+    if dirty.changed("input", (text, tuple(color))):
+        dirty.add(dashboard_rect)
+    if frame_clock.render_due():
+        rects = dirty.collect()
+        if rects:
+            frame_started = time.perf_counter()
+            screen.set_clip(rects[0].unionall(rects[1:]))
+            screen.blit(static_map.render(), (0, 0))
+            draw_user_on_map(screen, me, graph)
+            draw_item_on_map(screen, robot, item_manager, items, graph, me)
+            draw_robot(robot, screen)  
+            draw_conversation(screen, font, conversation_log)
+            draw_dashboard()  
+            txt_surface = text_cache.render(font, text, True, color)
+            width = max(200, txt_surface.get_width() + 10)
+            input_box.w = width
+            screen.blit(txt_surface, (input_box.x + 5, input_box.y + 5))
+            pygame.draw.rect(screen, color, input_box, 2)
+            screen.set_clip(None)
+            pygame.display.update(rects)
+            dirty.record(time.perf_counter() - frame_started, rects)
+            frame_clock.presented()
+            if frame_clock.frames == 1:
+                startup.mark("frame")  # The window now takes commands
+        else:
+            frame_clock.discard()
+    # Idle ticks present nothing, so --frames counts ticks to be sure to finish
+    if MAX_FRAMES and frame_clock.ticks >= MAX_FRAMES:
+        running = False
+logger.log(scheduler.report())
+logger.log(router.report())
+if MEMOIZE:
+    logger.log(tool_memo.report())
+if SPECULATE:
+    logger.log(speculator.report())
+if MODEL_BACKEND == "openai":
+    logger.log(rate_limiter.report())
+if not HEADLESS:
+    logger.log(dirty.report())
+    logger.log(frame_clock.report())
+    logger.log(text_cache.report())
+    logger.log(assets.report())
+command_runtime.stop()
+logger.close()
+events.close()
+if not HEADLESS:
+    pygame.quit()   
\ No newline at end of file
@@ -0,0 +1,3 @@
+"""Shared runtime pieces for the robot delivery simulator scripts."""
+
+from .runtime import CommandHandle, CommandRuntime, EventLoopThread, ToolGate, make_async_tools
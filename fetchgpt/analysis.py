@@ -0,0 +1,507 @@
+import ast
+import gzip
+import json
+import os
+import re
+import statistics
+import sys
+import time
+from collections import deque
+
+from .events import read_events
+from .scenario import requested_items
+
+# A rotated segment, e.g. 20240312-141503-9f2c1a.events.003.jsonl.gz: (stem, segment, extension)
+_SEGMENT = re.compile(r"^(.*)\.(\d{3})(\.[^.]+(?:\.gz)?)$")
+_ITEM_LINE = re.compile(r"^  - (\S+): (\S+)$")
+_BLOCKED_LINE = re.compile(r"^  - Node \d+: (\S+)$")
+# Text log lines that become events, see text_log_events
+_TEXT_EVENTS = (
+    ("move", re.compile(r"^Moved to node (\S+)\.$")),
+    ("blocked", re.compile(r"^Attempted to move to blocked node (\S+)\.$")),
+    ("execute_path", re.compile(r"^execute_path: (\[.*\]): (?:Arrived|Stopped) at \S+ after (\d+) hops")),
+    ("path", re.compile(r"^get_path: Path from (\S+) to (\S+): (.*)$")),
+    ("alternative", re.compile(r"^get_alternative_path: Alternative path from (\S+) to (\S+) avoiding (\[.*?\]): (.*)$")),
+    ("picked_up", re.compile(r"^Picked up item (\S+) at (\S+)$")),
+    ("failed_pick_up", re.compile(r"^Failed to pick up item (\S+) at (\S+?)(?::.*)?$")),
+    ("drop_off", re.compile(r"^Dropped off item (\S+) at (\S+)$")),
+    ("model_turns", re.compile(r"^INFO: Model turns for '(.*)' with (.+): (\d+)$")),
+    ("command", re.compile(r"^INFO: Command \d+ queued: (.*)$")),
+)
+
+
+def load_floorplan(path):
+    """The floorplan in path as ``{node: [adjacent nodes]}``.
+
+    path is a JSON file holding that mapping, or a simulation script: its floorplan is
+    read from the ``add_edge("a", "b")`` calls in the source, without running it.
+    """
+    if not path.endswith(".py"):
+        with open(path) as file:
+            return json.load(file)
+    with open(path) as file:
+        tree = ast.parse(file.read(), path)
+    floorplan = {}
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "add_edge"
+                and len(node.args) >= 2 and all(isinstance(arg, ast.Constant) for arg in node.args[:2])):
+            first, second = node.args[0].value, node.args[1].value
+            floorplan.setdefault(first, []).append(second)
+            floorplan.setdefault(second, []).append(first)
+    return floorplan
+
+
+def _hops_from(floorplan, start, blocked):
+    """Breadth-first search from start around the blocked nodes: ``{node: previous node}``, start maps to None."""
+    previous = {start: None}
+    queue = deque([start])
+    while queue:
+        node = queue.popleft()
+        for adjacent in floorplan.get(node, ()):
+            if adjacent not in previous and adjacent not in blocked:
+                previous[adjacent] = node
+                queue.append(adjacent)
+    return previous
+
+
+def _walk_back(previous, node):
+    """The nodes from the search start to node, or None if node was not reached."""
+    if node not in previous:
+        return None
+    path = []
+    while node is not None:
+        path.append(node)
+        node = previous[node]
+    return path[::-1]
+
+
+def optimal_route(floorplan, blocked, robot, user, item_nodes):
+    """The shortest route that brings every item in item_nodes to the user: ``(hops, nodes)``.
+
+    The robot carries one item at a time, so after the first item every delivery is a
+    round trip from the user's node; only the first item is worth choosing. Blocked
+    nodes are the real ones, known up front. Returns ``(None, None)`` if an item or the
+    user cannot be reached.
+    """
+    blocked = set(blocked)
+    from_robot = _hops_from(floorplan, robot, blocked)
+    from_user = _hops_from(floorplan, user, blocked)
+    legs = {}  # item node -> (path from the user, length)
+    for node in set(item_nodes):
+        path = _walk_back(from_user, node)
+        if path is None or node not in from_robot:
+            return None, None
+        legs[node] = (path, len(path) - 1)
+    if not legs:
+        return 0, [robot]
+    first_path = {node: _walk_back(from_robot, node) for node in legs}
+    first = min(item_nodes, key=lambda node: len(first_path[node]) - 1 - legs[node][1])
+    route = first_path[first] + legs[first][0][-2::-1]
+    for node in item_nodes:
+        if node == first:
+            first = None  # Only skip the first item once, in case two items share a node
+            continue
+        path = legs[node][0]
+        route += path[1:] + path[-2::-1]
+    return len(route) - 1, route
+
+
+class EpisodeTrace:
+    """One episode rebuilt from its events, scored against the best possible route.
+
+    Feed it the episode's events in order with ``add``, then call ``score``. The same
+    events come from an event log (``read_events``) or a text log (``text_log_events``).
+
+    A path query is wasted if it found no path, repeats a query whose answer has not
+    been used yet, or the robot never tries the first hop of its answer afterwards. A
+    blocked-node rediscovery is a hop attempt into a node the robot had already found
+    blocked. Hops driven speculatively ahead of the model, or back again, are only
+    counted; the route holds the hops the model asked for.
+
+    A pick-up or drop-off away from the end of the route means hops are missing, as in
+    an INFO-level text log of a fast-path run; the route then cannot be rebuilt and the
+    hop figures are None.
+    """
+    def __init__(self, source, scenario):
+        self.source = source
+        self.scenario = scenario  # The episode event
+        self.commands = []
+        self.route = [scenario["robot"]]
+        self.route_complete = True
+        self.known_blocked = set()
+        self.blocked_attempts = 0
+        self.speculative_hops = 0
+        self.rediscoveries = 0
+        self.path_queries = 0
+        self.wasted_queries = 0
+        self.pending_queries = {}  # (start, target, avoiding) -> first hop of a query not followed yet
+        self.model_turns = 0
+        self.delivered = []  # Items dropped off at the user's node
+
+    def add(self, event):
+        event_type = event["type"]
+        if event.get("speculative"):
+            self.speculative_hops += 1
+        elif event_type in ("move", "blocked"):
+            hop = (event["from_node"], event["node"])
+            for key in [key for key, first_hop in self.pending_queries.items() if first_hop == hop]:
+                del self.pending_queries[key]
+            if event_type == "move":
+                self.route.append(event["node"])
+            else:
+                self.blocked_attempts += 1
+                if event["node"] in self.known_blocked:
+                    self.rediscoveries += 1
+                self.known_blocked.add(event["node"])
+        elif event_type == "path_query":
+            self.path_queries += 1
+            path = event["path"] or []
+            key = (event["start"], event["target"], tuple(event["avoiding"] or ()))
+            if len(path) < 2 or key in self.pending_queries:
+                self.wasted_queries += 1
+            else:
+                self.pending_queries[key] = (path[0], path[1])
+        elif event_type in ("pick_up", "drop_off"):
+            if event["node"] != self.route[-1]:
+                self.route_complete = False  # The hops that got the robot there are not in the log
+            if event_type == "drop_off" and event["node"] == self.scenario["user"]:
+                self.delivered.append(event["item"])
+        elif event_type == "model_turns":
+            self.model_turns += event["turns"]
+        elif event_type == "command":
+            self.commands.append(event["command"])
+
+    def score(self, floorplan=None):
+        """The episode's figures as a dict; ``excess_hops`` is None unless the episode is complete, its
+        route could be rebuilt and it has an optimal route, ``hops`` and ``route`` None if the route
+        could not be rebuilt, ``optimal_hops`` None without a floorplan or a reachable route."""
+        scenario = self.scenario
+        floorplan = scenario.get("floorplan") or floorplan
+        task = scenario["task"] or " ".join(self.commands)
+        requested = requested_items(task, scenario["items"]) or list(dict.fromkeys(self.delivered))
+        optimal_hops = optimal_nodes = None
+        if floorplan:
+            item_nodes = [scenario["items"][item_id] for item_id in requested if item_id in scenario["items"]]
+            optimal_hops, optimal_nodes = optimal_route(floorplan, scenario["blocked"], scenario["robot"],
+                                                        scenario["user"], item_nodes)
+        hops = len(self.route) - 1 if self.route_complete else None
+        deliveries = len(self.delivered)
+        complete = all(item_id in self.delivered for item_id in requested)
+        return {
+            "episode": scenario.get("episode"),
+            "source": self.source,
+            "task": task,
+            "requested": requested,
+            "delivered": self.delivered,
+            "complete": complete,
+            "hops": hops,
+            "optimal_hops": optimal_hops,
+            # Only a finished episode can be compared with the optimal route
+            "excess_hops": (hops - optimal_hops if complete and hops is not None and optimal_hops is not None
+                            else None),
+            "route": self.route if self.route_complete else None,
+            "optimal_route": optimal_nodes,
+            "blocked_attempts": self.blocked_attempts,
+            "blocked_rediscoveries": self.rediscoveries,
+            "speculative_hops": self.speculative_hops,
+            "path_queries": self.path_queries,
+            "wasted_path_queries": self.wasted_queries + len(self.pending_queries),
+            "model_turns": self.model_turns,
+            "turns_per_delivery": self.model_turns / deliveries if deliveries else None,
+        }
+
+
+def text_log_events(lines, source="log"):
+    """Events rebuilt from the lines of a text simulation log, in the event log's shape.
+
+    The scenario comes from the Initial Locations block and the Task line. Hops are
+    ``Moved to node`` lines when the log was written at DEBUG level; at the default INFO
+    level they are taken from the ``execute_path`` lines instead, so single ``move_robot``
+    hops are missing, and path queries are only in DEBUG logs. Use the event log for
+    exact figures.
+    """
+    scenario = {"type": "episode", "episode": source, "robot": None, "user": None, "items": {}, "blocked": [],
+                "task": None, "seed": None, "floorplan": None, "floorplan_name": None}
+    section = None
+    current = None
+    moved = False  # A "Moved to node" line since the last execute_path line
+    held_blocked = []  # Blocked attempts waiting for the hops before them; see execute_path below
+
+    def flush_blocked():
+        for node in held_blocked:
+            yield {"type": "blocked", "node": node, "from_node": current}
+        held_blocked.clear()
+
+    for line in lines:
+        line = line.rstrip("\n")
+        if scenario["task"] is None:
+            if line.startswith("Robot initial node: "):
+                scenario["robot"] = current = line.split(": ", 1)[1]
+            elif line.startswith("User initial node: "):
+                scenario["user"] = line.split(": ", 1)[1]
+            elif line == "Items initial nodes:":
+                section = "items"
+            elif line == "Blocked nodes:":
+                section = "blocked"
+            elif section == "items" and _ITEM_LINE.match(line):
+                item_id, node = _ITEM_LINE.match(line).groups()
+                scenario["items"][item_id] = node
+            elif section == "blocked" and _BLOCKED_LINE.match(line):
+                scenario["blocked"].append(_BLOCKED_LINE.match(line).group(1))
+            elif line.startswith("Task: "):
+                scenario["task"] = line[len("Task: "):]
+                yield scenario
+            continue
+        for kind, pattern in _TEXT_EVENTS:
+            match = pattern.match(line)
+            if match:
+                break
+        else:
+            continue
+        if kind == "blocked":
+            # An execute_path walk logs its blocked attempt before the summary line its hops come from
+            held_blocked.append(match.group(1))
+            continue
+        if kind == "execute_path":
+            nodes, hops = ast.literal_eval(match.group(1)), int(match.group(2))
+            if not moved:
+                for node in nodes[:hops]:
+                    yield {"type": "move", "node": node, "from_node": current}
+                    current = node
+            moved = False
+            yield from flush_blocked()
+            continue
+        yield from flush_blocked()
+        if kind == "move":
+            yield {"type": "move", "node": match.group(1), "from_node": current}
+            current = match.group(1)
+            moved = True
+        elif kind == "path":
+            yield {"type": "path_query", "kind": "path", "start": match.group(1), "target": match.group(2),
+                   "avoiding": None, "path": ast.literal_eval(match.group(3))}
+        elif kind == "alternative":
+            yield {"type": "path_query", "kind": "alternative", "start": match.group(1), "target": match.group(2),
+                   "avoiding": ast.literal_eval(match.group(3)), "path": ast.literal_eval(match.group(4)) or []}
+        elif kind in ("picked_up", "failed_pick_up"):
+            yield {"type": "pick_up", "item": match.group(1), "node": match.group(2), "ok": kind == "picked_up"}
+        elif kind == "drop_off":
+            yield {"type": "drop_off", "item": match.group(1), "node": match.group(2)}
+        elif kind == "model_turns":
+            yield {"type": "model_turns", "command": match.group(1), "agent": match.group(2),
+                   "turns": int(match.group(3))}
+        else:
+            yield {"type": "command", "command": match.group(1)}
+    yield from flush_blocked()
+
+
+def _episode_files(paths):
+    """The episodes in paths as lists of their files, oldest segment first.
+
+    Directories are searched for event logs (``*events*.jsonl[.gz]``) and text logs
+    (``*.log[.gz]``); a text log is skipped when the same episode has an event log.
+    Rotated segments of one log are kept together.
+    """
+    groups = {}
+    for path in paths:
+        if os.path.isdir(path):
+            names = [os.path.join(path, name) for name in sorted(os.listdir(path))
+                     if re.search(r"events.*\.jsonl(\.gz)?$|\.log(\.gz)?$", name)]
+        else:
+            names = [path]
+        for name in names:
+            match = _SEGMENT.match(name)
+            if match:
+                stem, segment, extension = match.groups()
+            else:
+                stem, extension = os.path.splitext(name.removesuffix(".gz"))
+                segment = 0
+            groups.setdefault((stem, extension.removesuffix(".gz")), []).append((int(segment), name))
+    event_stems = {stem.removesuffix(".events") for stem, extension in groups if extension == ".jsonl"}
+    return [[name for _, name in sorted(files)] for (stem, extension), files in sorted(groups.items())
+            if extension == ".jsonl" or stem not in event_stems]
+
+
+def _read_text_lines(files):
+    for path in files:
+        with (gzip.open if path.endswith(".gz") else open)(path, "rt") as file:
+            yield from file
+
+
+def analyze_episode(files, floorplan=None):
+    """Scores for every episode in one log, given as the list of its segment files."""
+    if ".jsonl" in files[0]:
+        events = (event for path in files for event in read_events(path))
+    else:
+        events = text_log_events(_read_text_lines(files), source=files[0])
+    scores = []
+    trace = None
+    for event in events:
+        if event["type"] == "episode":
+            if trace:
+                scores.append(trace.score(floorplan))
+            trace = EpisodeTrace(files[0], event)
+        elif trace:
+            trace.add(event)
+    if trace:
+        scores.append(trace.score(floorplan))
+    return scores
+
+
+def _analyze_job(job):
+    return analyze_episode(*job)
+
+
+def analyze(paths, floorplan=None, processes=None):
+    """Yields the scores of every episode under paths (files or directories), as they are ready.
+
+    Episodes are analyzed in ``processes`` worker processes (all CPUs by default, 1 to
+    stay in this process); results arrive in no particular order.
+    """
+    jobs = [(files, floorplan) for files in _episode_files(paths)]
+    processes = processes or os.cpu_count() or 1
+    if processes == 1 or len(jobs) < 2:
+        for job in jobs:
+            yield from _analyze_job(job)
+        return
+    from multiprocessing import Pool
+
+    with Pool(min(processes, len(jobs))) as pool:
+        for scores in pool.imap_unordered(_analyze_job, jobs, chunksize=max(1, len(jobs) // (processes * 16))):
+            yield from scores
+
+
+def _percentile(values, fraction):
+    return sorted(values)[min(len(values) - 1, int(len(values) * fraction))] if values else None
+
+
+def summarize(scores):
+    """Totals and distributions over episode scores, e.g. from ``analyze``."""
+    summary = {"episodes": 0, "complete": 0, "scored": 0, "hops": 0, "optimal_hops": 0, "blocked_attempts": 0,
+               "blocked_rediscoveries": 0, "path_queries": 0, "wasted_path_queries": 0, "model_turns": 0,
+               "deliveries": 0}
+    excess = []
+    for score in scores:
+        summary["episodes"] += 1
+        summary["complete"] += score["complete"]
+        for key in ("blocked_attempts", "blocked_rediscoveries", "path_queries", "wasted_path_queries",
+                    "model_turns"):
+            summary[key] += score[key]
+        summary["deliveries"] += len(score["delivered"])
+        if score["excess_hops"] is not None:
+            summary["scored"] += 1
+            summary["hops"] += score["hops"]
+            summary["optimal_hops"] += score["optimal_hops"]
+            excess.append(score["excess_hops"])
+    summary["excess_hops"] = {"total": sum(excess), "mean": statistics.fmean(excess) if excess else None,
+                              "median": statistics.median(excess) if excess else None,
+                              "p90": _percentile(excess, 0.9), "max": max(excess, default=None)}
+    summary["turns_per_delivery"] = summary["model_turns"] / summary["deliveries"] if summary["deliveries"] else None
+    return summary
+
+
+def report(summary):
+    """A readable report of a ``summarize`` result."""
+    excess = summary["excess_hops"]
+    lines = [f"{summary['episodes']} episodes, {summary['complete']} complete, "
+             f"{summary['scored']} complete ones scored against the optimal route"]
+    if summary["scored"]:
+        lines.append(f"  Hops: {summary['hops']} taken, {summary['optimal_hops']} optimal, "
+                     f"{excess['total']} excess ({excess['mean']:.2f} mean, {excess['median']} median, "
+                     f"{excess['p90']} p90, {excess['max']} max per episode)")
+    lines.append(f"  Path queries: {summary['path_queries']}, {summary['wasted_path_queries']} wasted")
+    lines.append(f"  Blocked nodes: {summary['blocked_attempts']} attempts, "
+                 f"{summary['blocked_rediscoveries']} rediscoveries")
+    per_delivery = summary["turns_per_delivery"]
+    lines.append(f"  Model turns: {summary['model_turns']} for {summary['deliveries']} deliveries"
+                 + (f", {per_delivery:.2f} per delivery" if per_delivery is not None else ""))
+    return "\n".join(lines)
+
+
+def benchmark(episodes=1000, processes=None):
+    """Analyzes synthetic event logs with one process and with all of them. Returns a report string.
+
+    The episodes are run on a grid floorplan by a scripted robot that plans with
+    ``get_path``, falls back to ``get_alternative_path`` on a blocked node and now and
+    then forgets what it found blocked or asks for a path it does not use.
+    """
+    import random
+    import tempfile
+
+    from .events import EventLog
+    from .world import Graph, World
+
+    graph = Graph()
+    for row in range(8):
+        for column in range(8):
+            graph.add_node("grid", f"n{row}{column}", (column * 100, row * 100))
+            if column:
+                graph.add_edge(f"n{row}{column - 1}", f"n{row}{column}")
+            if row:
+                graph.add_edge(f"n{row - 1}{column}", f"n{row}{column}")
+    item_ids = ["water", "banana", "comb", "broom"]
+    rng = random.Random(7)
+    report_lines = []
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        for n in range(episodes):
+            events = EventLog(os.path.join(directory, f"episode{n:05d}.events.jsonl"), episode=f"bench-{n}")
+            world = World.random(graph, item_ids, num_blocked=8, rng=rng, events=events)
+            wanted = rng.sample(item_ids, 2)
+            task = f"Bring {wanted[0]} to me then {wanted[1]}"
+            events.start_episode(world.robot.current_node, world.user.node_id, dict(world.item_manager.item_locations),
+                                 world.graph.blocked_nodes, task, n, floorplan=graph.edges)
+            events.emit("command", command=task)
+            for item_id in wanted:
+                for target in (world.get_item_location(item_id), world.user.node_id):
+                    for _ in range(10):
+                        if world.robot.current_node == target:
+                            break
+                        if rng.random() < 0.2:
+                            world.get_path(world.robot.current_node, rng.choice(sorted(graph.edges)))
+                        known = [] if rng.random() < 0.3 else world.robot.blocked_nodes
+                        path = (world.get_alternative_path(world.robot.current_node, target, known) if known
+                                else world.get_path(world.robot.current_node, target))
+                        if not path:
+                            break
+                        world.execute_path(path)
+                    if target != world.user.node_id:
+                        world.pick_up_item_robot(item_id)
+                world.drop_off_item_robot(item_id, world.robot.current_node)
+            events.emit("model_turns", command=task, agent="Planner", turns=rng.randint(4, 16))
+            events.close()
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        report_lines.append(f"{episodes} episodes, {size / 1e6:.1f} MB of event logs written in "
+                            f"{time.perf_counter() - started:.1f} s")
+        for workers in dict.fromkeys((1, processes or os.cpu_count() or 1)):
+            started = time.perf_counter()
+            summary = summarize(analyze([directory], processes=workers))
+            seconds = time.perf_counter() - started
+            report_lines.append(f"  {workers} process(es): {summary['episodes']} episodes in {seconds * 1000:.0f} ms, "
+                                f"{summary['episodes'] / seconds:.0f} episodes/s, {size / seconds / 1e6:.0f} MB/s")
+        report_lines.append(report(summary))
+    return "\n".join(report_lines)
+
+
+if __name__ == "__main__":
+    # python -m fetchgpt.analysis [--floorplan 8-rm.py] [--processes N] [--json] LOG_OR_DIRECTORY ...
+    # python -m fetchgpt.analysis --benchmark [episodes]
+    arguments = sys.argv[1:]
+    if arguments[:1] == ["--benchmark"]:
+        print(benchmark(int(arguments[1]) if len(arguments) > 1 else 1000))
+        sys.exit()
+    options = {}
+    while arguments and arguments[0] in ("--floorplan", "--processes", "--json"):
+        option = arguments.pop(0)
+        options[option] = True if option == "--json" else arguments.pop(0)
+    floorplan = load_floorplan(options["--floorplan"]) if "--floorplan" in options else None
+    processes = int(options["--processes"]) if "--processes" in options else None
+    scores = analyze(arguments or ["logs"], floorplan=floorplan, processes=processes)
+    if "--json" in options:
+        # One JSON line per episode on stdout, the report on stderr
+        def printed(scores):
+            for score in scores:
+                print(json.dumps(score))
+                yield score
+        print(report(summarize(printed(scores))), file=sys.stderr)
+    else:
+        print(report(summarize(scores)))
@@ -0,0 +1,138 @@
+import json
+import os
+import time
+
+import pygame
+
+ATLAS_IMAGE = "atlas.png"
+ATLAS_INDEX = "atlas.json"
+
+
+class AssetCache:
+    """Loads each image file once and keeps every scaled variant that has been asked for.
+
+    ``image(path, size)`` decodes ``path`` on first use and scales it once per size; later
+    calls, e.g. a second ``User`` built from the same PNG, get the same Surface back.
+    ``save`` packs every scaled variant into one texture atlas and, with ``cache_dir``
+    set, writes it there with an index. Later launches then load that one small image
+    instead of decoding the large originals; an entry is only used while its source
+    file's modification time is unchanged.
+
+    Returned surfaces are shared: blit them, never draw on them. Needs a display mode
+    to be set before the first ``image`` call.
+
+    Args:
+        cache_dir (str): directory for the pre-scaled atlas, None to keep everything in memory.
+    """
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+        self.atlas = None
+        self._sources = {}
+        self._scaled = {}
+        self._index = None
+        self._stored = set()
+        self.decoded = 0
+        self.scaled = 0
+        self.from_atlas = 0
+        self.hits = 0
+        self.seconds = 0.0
+
+    def image(self, path, size=None):
+        """The image at path scaled to size (width, height), or at its own size if size is None."""
+        started = time.perf_counter()
+        key = _key(path, size)
+        surface = self._scaled.get(key)
+        if surface is not None:
+            self.hits += 1
+        else:
+            surface = self._load_stored(key, path)
+            if surface is None:
+                surface = self._source(path)
+                if size is not None and surface.get_size() != tuple(size):
+                    surface = pygame.transform.scale(surface, size)
+                    self.scaled += 1
+            self._scaled[key] = surface
+        self.seconds += time.perf_counter() - started
+        return surface
+
+    def _source(self, path):
+        surface = self._sources.get(path)
+        if surface is None:
+            surface = self._sources[path] = pygame.image.load(path).convert_alpha()
+            self.decoded += 1
+        return surface
+
+    def _load_stored(self, key, path):
+        """The variant from the on-disk atlas, if it is there and its source has not changed since."""
+        if self._index is None:
+            self._index = self._read_index()
+        entry = self._index.get(key)
+        mtime = _mtime(path)
+        # A source that is gone cannot vouch for the stored copy, even if it was gone at save time too.
+        if entry is None or mtime is None or entry["mtime"] != mtime:
+            return None
+        if self.atlas is None:
+            try:
+                self.atlas = pygame.image.load(os.path.join(self.cache_dir, ATLAS_IMAGE)).convert_alpha()
+            except (OSError, pygame.error):
+                self._index = {}
+                return None
+        self._stored.add(key)
+        self.from_atlas += 1
+        return self.atlas.subsurface(entry["rect"])
+
+    def _read_index(self):
+        if not self.cache_dir:
+            return {}
+        try:
+            with open(os.path.join(self.cache_dir, ATLAS_INDEX)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def pack(self, width=1024):
+        """Copies every scaled variant into one atlas Surface. Returns it with ``{key: rect}``."""
+        # Shelf packing, tallest first: sprites fill rows left to right, a row is as tall as its first sprite.
+        variants = sorted(self._scaled.items(), key=lambda item: item[1].get_height(), reverse=True)
+        rects = {}
+        x = y = row_height = 0
+        for key, surface in variants:
+            w, h = surface.get_size()
+            if x and x + w > width:
+                x, y, row_height = 0, y + row_height, 0
+            rects[key] = pygame.Rect(x, y, w, h)
+            x += w
+            row_height = max(row_height, h)
+        atlas = pygame.Surface((width, max(y + row_height, 1)), pygame.SRCALPHA)
+        for key, surface in variants:
+            # MAX onto a transparent atlas copies the pixels exactly instead of alpha-blending them.
+            atlas.blit(surface, rects[key], special_flags=pygame.BLEND_RGBA_MAX)
+        return atlas, rects
+
+    def save(self):
+        """Writes the atlas and its index to cache_dir if any variant is not stored there yet."""
+        if not self.cache_dir or set(self._scaled) <= self._stored:
+            return False
+        atlas, rects = self.pack()
+        index = {key: {"mtime": _mtime(key.rsplit("|", 1)[0]), "rect": list(rect)} for key, rect in rects.items()}
+        os.makedirs(self.cache_dir, exist_ok=True)
+        pygame.image.save(atlas, os.path.join(self.cache_dir, ATLAS_IMAGE))
+        with open(os.path.join(self.cache_dir, ATLAS_INDEX), "w") as f:
+            json.dump(index, f)
+        self._stored = set(rects)
+        return True
+
+    def report(self):
+        return (f"Assets: {self.decoded} files decoded, {self.scaled} variants scaled, {self.from_atlas} from the "
+                f"stored atlas, {self.hits} repeat loads served from memory, {self.seconds * 1000:.1f} ms loading")
+
+
+def _key(path, size):
+    return f"{os.path.abspath(path)}|{size[0]}x{size[1]}" if size is not None else f"{os.path.abspath(path)}|source"
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
@@ -0,0 +1,184 @@
+import gzip
+import json
+import os
+import re
+import time
+
+from .log import BufferedWriter, new_episode_id
+
+# 2 added the floorplan to the episode event, 3 the speculative flag to move and blocked, 4 the floorplan name
+SCHEMA_VERSION = 4
+# Fields each event type carries besides the envelope (seq, t, episode, type). Node and item
+# ids are strings; paths and node lists are lists of node ids, [] when there is no path.
+EVENT_FIELDS = {
+    # Scenario at the start of an episode: robot/user node, {item: node}, blocked nodes, task text, RNG seed
+    # and the floorplan as {node: [adjacent nodes]} and by name (a script's FLOORPLAN), each None if unknown
+    "episode": ("schema", "robot", "user", "items", "blocked", "task", "seed", "floorplan", "floorplan_name"),
+    "command": ("command",),
+    # response is the reply text or conversation summary; seconds is the command's run time
+    "response": ("command", "response", "seconds"),
+    "model_turns": ("command", "agent", "turns"),
+    # speculative hops are driven ahead of the model or back again; a confirmed one is emitted again as a plain move
+    "move": ("node", "from_node", "speculative"),
+    "blocked": ("node", "from_node", "speculative"),
+    # kind is "path" or "alternative"; avoiding is None for "path"
+    "path_query": ("kind", "start", "target", "avoiding", "path"),
+    "item_lookup": ("item", "node"),
+    "pick_up": ("item", "node", "ok"),
+    "drop_off": ("item", "node"),
+}
+_FIELD_SETS = {event_type: frozenset(fields) for event_type, fields in EVENT_FIELDS.items()}
+
+
+class EventLog(BufferedWriter):
+    """Typed simulation events written as JSON lines, one object per event.
+
+    Every event is ``{"seq", "t", "episode", "type", ...fields}``: ``seq`` counts from 0
+    in file order, ``t`` is ``clock()`` (``time.monotonic`` seconds) when ``emit`` was
+    called and ``episode`` identifies the run. The fields of each type are listed in
+    EVENT_FIELDS and checked on ``emit``. Encoding happens on the writer thread, so an
+    emit costs the caller about as much as a Logger line; list and dict values are
+    copied first, so callers may keep changing them.
+
+    Args:
+        log_file (str): path of the JSONL file, truncated on creation.
+        episode (str): episode id; a new one if omitted.
+        clock: timestamp source, must be monotonic.
+        **kwargs: BufferedWriter options, e.g. a Rotation.
+    """
+    def __init__(self, log_file="simulation_events.jsonl", episode=None, clock=time.monotonic, **kwargs):
+        super().__init__(log_file, **kwargs)
+        self.episode = episode or new_episode_id()
+        self.clock = clock
+        self._seq = 0
+
+    def emit(self, event_type, **fields):
+        expected = _FIELD_SETS.get(event_type)
+        if expected is None or fields.keys() != expected:
+            raise ValueError(f"{event_type!r} event needs fields {EVENT_FIELDS.get(event_type)}, got {tuple(fields)}")
+        for name, value in fields.items():
+            if isinstance(value, (list, tuple)):
+                fields[name] = list(value)
+            elif isinstance(value, dict):
+                fields[name] = dict(value)
+        self._put((self.clock(), event_type, fields))
+
+    def start_episode(self, robot, user, items, blocked, task, seed=None, floorplan=None, floorplan_name=None):
+        """Emits the ``episode`` event describing the scenario; call it before any other event.
+
+        floorplan is ``Graph.edges`` or any ``{node: adjacent nodes}`` mapping; it makes the
+        event log enough to score the episode without the script that ran it. floorplan_name
+        lets a replay of the episode refuse to run on another house.
+        """
+        if floorplan is not None:
+            floorplan = {node: sorted(adjacent) for node, adjacent in floorplan.items()}
+        self.emit("episode", schema=SCHEMA_VERSION, robot=robot, user=user, items=items, blocked=blocked, task=task,
+                  seed=seed, floorplan=floorplan, floorplan_name=floorplan_name)
+
+    def _encode(self, record):
+        t, event_type, fields = record
+        seq, self._seq = self._seq, self._seq + 1
+        event = {"seq": seq, "t": round(t, 6), "episode": self.episode, "type": event_type}
+        event.update(fields)
+        return json.dumps(event, separators=(",", ":"), default=str) + "\n"
+
+
+def read_events(path, types=None, chunk_bytes=1 << 20):
+    """Yields the events in a JSONL event log as dicts, in file order.
+
+    The file is read in chunks and each chunk is parsed with one ``json.loads`` call.
+    With ``types`` only those event types are returned: a regex finds their lines and
+    nothing else is parsed, so a filtered read runs at close to disk speed when the
+    types are rare. A last line cut short by a crash is ignored. Gzipped segments
+    (``.gz``) are read the same way.
+    """
+    marker = re.compile(b'"type":"(?:' + b"|".join(re.escape(t.encode()) for t in types) + b')"') if types else None
+    wanted = set(types) if types else None
+    with (gzip.open if path.endswith(".gz") else open)(path, "rb") as file:
+        rest = b""
+        while True:
+            chunk = file.read(chunk_bytes)
+            if not chunk:
+                break
+            chunk = rest + chunk
+            end = chunk.rfind(b"\n")
+            if end < 0:
+                rest = chunk
+                continue
+            rest = chunk[end + 1:]
+            yield from _parse_lines(chunk[:end], marker, wanted, path)
+        if rest.strip():
+            try:
+                yield from _parse_lines(rest, marker, wanted, path)
+            except ValueError:
+                pass
+
+
+def _parse_lines(block, marker, wanted, path):
+    if marker:
+        lines = []
+        for match in marker.finditer(block):
+            end = block.find(b"\n", match.end())
+            lines.append(block[block.rfind(b"\n", 0, match.start()) + 1:end if end >= 0 else len(block)])
+        if not lines:
+            return []
+        block = b"\n".join(lines)
+    try:
+        events = json.loads(b"[" + block.replace(b"\n", b",") + b"]")
+    except ValueError:
+        # Blank or broken lines: parse line by line to skip the blanks and name the broken one.
+        events = []
+        for line in block.split(b"\n"):
+            if line.strip():
+                try:
+                    events.append(json.loads(line))
+                except ValueError as error:
+                    raise ValueError(f"{path}: bad event line {line[:80]!r}: {error}") from None
+    if wanted:
+        # The marker test can be fooled by a nested "type" key, the parsed type cannot.
+        events = [event for event in events if event.get("type") in wanted]
+    return events
+
+
+def benchmark(events=200000):
+    """Times emitting, reading and filtering a synthetic event log. Returns a report string."""
+    import tempfile
+
+    report = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "events.jsonl")
+        log = EventLog(path, episode="bench")
+        started = time.perf_counter()
+        for n in range(events // 4):  # Plus one drop-off per hundred events
+            log.emit("path_query", kind="alternative", start=f"gr{n % 7}", target="lr3", avoiding=["lr5", "d2"],
+                     path=["gr6", "gr1", "lr1", "lr3"])
+            log.emit("move", node=f"lr{n % 5}", from_node=f"gr{n % 7}", speculative=False)
+            log.emit("blocked", node="lr5", from_node=f"lr{n % 5}", speculative=False)
+            log.emit("item_lookup", item="water", node="s4")
+            if n % 25 == 0:
+                log.emit("drop_off", item="water", node="li3")
+        emit_seconds = time.perf_counter() - started
+        log.close()
+        size = os.path.getsize(path)
+        report.append(f"{log._seq} events, {size / 1e6:.1f} MB: emit {emit_seconds / log._seq * 1e6:.2f} us per event")
+
+        def timed(label, read):
+            started = time.perf_counter()
+            count = sum(1 for _ in read())
+            seconds = time.perf_counter() - started
+            report.append(f"  {label}: {count} events in {seconds * 1000:.0f} ms, {size / seconds / 1e6:.0f} MB/s")
+
+        def line_by_line():
+            with open(path, "rb") as file:
+                for line in file:
+                    yield json.loads(line)
+
+        timed("json.loads per line", line_by_line)
+        timed("read_events", lambda: read_events(path))
+        timed("read_events, blocked only", lambda: read_events(path, types=("blocked",)))
+        timed("read_events, drop-offs only", lambda: read_events(path, types=("drop_off",)))
+    return "\n".join(report)
+
+
+if __name__ == "__main__":
+    print(benchmark())
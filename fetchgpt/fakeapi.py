@@ -0,0 +1,132 @@
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeModelEndpoint:
+    """Local OpenAI-compatible chat completions endpoint that throttles like the real one.
+
+    It enforces its own requests-per-minute window and answers anything over it with a
+    429 and a ``Retry-After`` header; ``error_rate`` adds random 429s on top. Every
+    accepted request gets a fixed assistant reply after ``latency`` seconds.
+
+    Args:
+        rpm (int): requests accepted per sliding minute, or None for no limit.
+        error_rate (float): probability of a synthetic 429 for an otherwise accepted request.
+        latency (float): seconds spent "generating" each reply.
+        reply (str): assistant message content.
+        seed: random seed for the synthetic errors.
+    """
+    def __init__(self, rpm=None, error_rate=0.0, latency=0.05, reply="TERMINATE", seed=None):
+        self.rpm = rpm
+        self.error_rate = error_rate
+        self.latency = latency
+        self.reply = reply
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.accepted_times = []
+        self.requests = 0
+        self.served = 0
+        self.throttled = 0
+        self.server = None
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def start(self):
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                status, payload, headers = endpoint.handle(body)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-model-endpoint", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def handle(self, body):
+        """Returns ``(status, payload, headers)`` for one chat completions request."""
+        with self.lock:
+            self.requests += 1
+            now = time.monotonic()
+            self.accepted_times = [t for t in self.accepted_times if now - t < 60]
+            over_limit = self.rpm is not None and len(self.accepted_times) >= self.rpm
+            if over_limit or self.random.random() < self.error_rate:
+                self.throttled += 1
+                retry_after = 60 - (now - self.accepted_times[0]) if over_limit else 1
+                error = {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}
+                return 429, error, {"Retry-After": f"{retry_after:.2f}"}
+            self.accepted_times.append(now)
+        time.sleep(self.latency)
+        with self.lock:
+            self.served += 1
+        prompt_tokens = len(json.dumps(body.get("messages", []))) // 4
+        return 200, {
+            "id": f"chatcmpl-fake{self.served}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": self.reply}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 1, "total_tokens": prompt_tokens + 1},
+        }, {}
+
+
+def stress(conversations=8, turns=5, rpm=120, error_rate=0.1, duplicate=True, seed=0):
+    """Runs concurrent conversations through RateLimitedModelClient against a FakeModelEndpoint.
+
+    With ``duplicate`` every other conversation sends the same messages as its neighbour,
+    so their requests can be coalesced. Returns a summary string.
+    """
+    from .ratelimit import Coalescer, RateLimitedModelClient, RateLimiter
+
+    endpoint = FakeModelEndpoint(rpm=rpm, error_rate=error_rate, latency=0.01, seed=seed).start()
+    limiter = RateLimiter(rpm=rpm)
+    coalescer = Coalescer()
+    config = {"model": "fake", "api_key": "fake", "base_url": endpoint.base_url, "max_retries": 10}
+    client = RateLimitedModelClient(config, limiter=limiter, coalescer=coalescer)
+
+    def converse(index):
+        name = index // 2 if duplicate else index
+        messages = [{"role": "system", "content": "You are a robot."},
+                    {"role": "user", "content": f"Command {name}"}]
+        for turn in range(turns):
+            client.create({"model": "fake", "messages": messages + [{"role": "user", "content": f"turn {turn}"}]})
+
+    start = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=conversations) as pool:
+            list(pool.map(converse, range(conversations)))
+    finally:
+        endpoint.stop()
+    elapsed = time.monotonic() - start
+    return (f"{conversations} conversations x {turns} turns in {elapsed:.1f}s: {endpoint.requests} requests sent, "
+            f"{endpoint.throttled} throttled, {coalescer.coalesced} coalesced. {limiter.report()}")
+
+
+if __name__ == "__main__":
+    print(stress())
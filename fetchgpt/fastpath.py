@@ -0,0 +1,135 @@
+import re
+import time
+
+# "Bring water to me", "Bring water to me then banana", "Bring comb to node k1 then broom"
+_BRING = re.compile(r"^\s*bring\s+(?P<item>[\w ]+?)\s+to\s+(?:(?P<me>me)|node\s+(?P<node>\w+))\s*(?P<rest>(?:then\b.*?)?)[.!]?\s*$", re.IGNORECASE)
+_THEN = re.compile(r"^then\s+(?:bring\s+)?(?P<item>[\w ]+?)(?:\s+to\s+(?:(?P<me>me)|node\s+(?P<node>\w+)))?\s*(?P<rest>(?:then\b.*)?)$", re.IGNORECASE)
+
+
+def parse_command(command, items):
+    """Parses a delivery command against the known items.
+
+    Returns a list of ``(item_id, destination)`` pairs, where destination is 'me' or a
+    node id, or None when the command does not follow the grammar or names an unknown
+    or repeated item. With ``items=None`` any item name is accepted.
+    """
+    known = {item_id.lower(): item_id for item_id in items} if items is not None else None
+    match = _BRING.match(command)
+    if not match:
+        return None
+    deliveries = []
+    while match:
+        name = " ".join(match.group("item").lower().split())
+        item_id = known.get(name) if known is not None else name
+        if item_id is None or any(item_id == other for other, _ in deliveries):
+            return None
+        if match.group("node"):
+            destination = match.group("node")
+        elif match.group("me") or not deliveries:
+            destination = "me"
+        else:
+            # "then <item>" with no destination goes where the previous item went.
+            destination = deliveries[-1][1]
+        deliveries.append((item_id, destination))
+        rest = match.group("rest").strip()
+        if not rest:
+            return deliveries
+        match = _THEN.match(rest)
+    return None
+
+
+class LocalPlanner:
+    """Carries out deliveries directly with breadth-first paths, replanning around blocked nodes.
+
+    Blocked nodes are only known once the robot bumps into them; the robot remembers them
+    in ``robot.blocked_nodes`` so later commands route around them from the start.
+
+    Args:
+        robot (Robot): robot to drive.
+        graph (Graph): navigation graph.
+        item_manager (ItemLocationManager): item locations.
+        user_node: callable returning the user's current node.
+        move: callable moving the robot one hop, defaults to ``robot.move_to_node``.
+        logger (Logger): optional simulation logger.
+    """
+    def __init__(self, robot, graph, item_manager, user_node, move=None, logger=None):
+        self.robot = robot
+        self.graph = graph
+        self.item_manager = item_manager
+        self.user_node = user_node
+        self.move = move or robot.move_to_node
+        self.logger = logger
+
+    def travel_to(self, target_node):
+        """Moves the robot to target_node. Returns False if every route is blocked."""
+        while self.robot.current_node != target_node:
+            path = self.graph.find_path_avoiding_blocked_nodes(self.robot.current_node, target_node, self.robot.blocked_nodes)
+            if not path:
+                return False
+            for node in path[1:]:
+                result = self.move(node)
+                if result != f"Moved to {node}":
+                    break
+        return True
+
+    def knows(self, destination):
+        """True if destination is 'me' or a node of the graph."""
+        return destination == "me" or destination in self.graph.get_all_nodes()
+
+    def deliver(self, item_id, destination="me"):
+        """Fetches one item and drops it at destination. Returns True on success.
+
+        An unknown destination fails before the robot moves, and an unreachable one puts the
+        item down where the robot got stuck, so the tier that takes over finds it there.
+        """
+        if not self.knows(destination):
+            return False
+        location = self.item_manager.get_item_location(item_id)
+        if location is None or not self.travel_to(location):
+            return False
+        if not self.robot.pick_up_item(self.item_manager, item_id).startswith("Picked up"):
+            return False
+        target_node = self.user_node() if destination == "me" else destination
+        if not self.travel_to(target_node):
+            self.robot.drop_off_item(self.item_manager, item_id, self.robot.current_node)
+            return False
+        self.robot.drop_off_item(self.item_manager, item_id, target_node)
+        return True
+
+
+class CommandFastPath:
+    """Handles commands that match the delivery grammar with the local planner, skipping the LLM."""
+    def __init__(self, items, planner, logger=None, enabled=True):
+        self.items = items
+        self.planner = planner
+        self.logger = logger
+        self.enabled = enabled
+
+    def try_execute(self, command):
+        """Executes command locally if possible.
+
+        Returns a short response string when the command was handled, or None when it
+        should go to the LLM instead (unrecognized, ambiguous, or the plan got stuck).
+        """
+        if not self.enabled:
+            return None
+        deliveries = parse_command(command, self.items)
+        if deliveries is None:
+            self._log(f"Fast path: '{command}' not recognized, using the LLM")
+            return None
+        unknown = [destination for _, destination in deliveries if not self.planner.knows(destination)]
+        if unknown:
+            self._log(f"Fast path: unknown node {unknown[0]} in '{command}', using the LLM")
+            return None
+        start = time.perf_counter()
+        for item_id, destination in deliveries:
+            if not self.planner.deliver(item_id, destination):
+                self._log(f"Fast path: could not deliver {item_id}, handing '{command}' to the LLM")
+                return None
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self._log(f"Fast path: handled '{command}' in {elapsed_ms:.2f} ms")
+        return "Delivered " + ", ".join(item_id for item_id, _ in deliveries) + ". TERMINATE"
+
+    def _log(self, message):
+        if self.logger:
+            self.logger.log_info(message, category="planning")
@@ -0,0 +1,371 @@
+import atexit
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+
+# Queue markers for the writer thread
+_FLUSH = object()
+_CLOSE = object()
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+# Categories of the frequent messages; everything else is logged as "general"
+CATEGORIES = ("general", "movement", "planning", "items", "model")
+
+
+def new_episode_id():
+    """A unique episode id that sorts by start time, e.g. ``20240312-141503-9f2c1a``."""
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+class Rotation:
+    """When a BufferedWriter starts a new segment file, and what happens to the closed ones.
+
+    With a rotation, ``log_file`` names a series of segments: ``run.log`` is written as
+    ``run.000.log``, ``run.001.log``, ... A segment is closed once it holds ``max_bytes``
+    characters or is ``max_seconds`` old, at the next record written. A closed segment
+    is gzipped to ``run.000.log.gz`` if ``compress`` is set, and gets one line in
+    ``index_file``. The index is shared by any number of writers and processes; each
+    entry is appended with a single write.
+
+    Args:
+        max_bytes (int): segment size limit in characters, None for no limit.
+        max_seconds (float): segment age limit, None for no limit.
+        compress (bool): gzip closed segments, removing the plain file.
+        index_file (str): JSONL index of closed segments, None for no index.
+    """
+    def __init__(self, max_bytes=None, max_seconds=None, compress=False, index_file=None):
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.compress = compress
+        self.index_file = index_file
+
+    def due(self, written, opened_at):
+        """True if a segment with written characters, opened at monotonic time opened_at, is full."""
+        return ((self.max_bytes is not None and written >= self.max_bytes)
+                or (self.max_seconds is not None and time.monotonic() - opened_at >= self.max_seconds))
+
+
+def indexed_segments(index_file, log_file):
+    """The closed segment files of log_file listed in index_file, oldest first."""
+    try:
+        with open(index_file) as file:
+            entries = [json.loads(line) for line in file if line.strip()]
+    except FileNotFoundError:
+        return []
+    log_file = os.path.abspath(log_file)
+    return [entry["file"] for entry in sorted((entry for entry in entries if entry["log"] == log_file),
+                                              key=lambda entry: entry["segment"])]
+
+
+class BufferedWriter:
+    """Appends records to log_file from a background thread.
+
+    ``_put`` only puts a record on a queue, so it is cheap and safe to call from any
+    thread. A writer thread turns records into text with ``_encode``, keeps log_file
+    open with a buffered handle and flushes it once ``flush_bytes`` have been written,
+    ``flush_interval`` seconds after the first unflushed record, on ``flush`` and on
+    ``close``. Records reach the file in the order they were put. ``close`` runs at
+    interpreter exit if nobody called it; records put after it are appended directly
+    to log_file, or with a Rotation written to a segment of their own that is closed
+    straight away, since the last one may already be compressed. With a Rotation the
+    writer spreads the records over segment files; rotating and compressing happen on
+    the writer thread too.
+
+    Args:
+        log_file (str): path of the file, truncated on creation; its directory is created if needed.
+        flush_bytes (int): buffered characters that trigger a flush.
+        flush_interval (float): most seconds a record waits before being flushed.
+        header (str): first line of the file (the first segment), None for none.
+        rotation (Rotation): segment the file, None to write log_file itself.
+    """
+    def __init__(self, log_file, flush_bytes=64 * 1024, flush_interval=0.5, header=None, rotation=None):
+        self.log_file = log_file
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.rotation = rotation
+        self.segments = []  # Closed segment files, after compression
+        self._segment = -1
+        os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+        self._open_segment()
+        if header is not None:
+            self._file.write(f"{header}\n")
+            self._segment_bytes += len(header) + 1
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._writer = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _put(self, record):
+        """Queues record for the writer, or appends it straight away once the log is closed."""
+        with self._lock:
+            if not self._closed:
+                self._queue.put(record)
+                return
+            # Let the writer finish closing the last segment before touching the files.
+            self._writer.join()
+            line = self._encode(record)
+            if not self.rotation:
+                with open(self.segment_file, "a") as file:
+                    file.write(line)
+                return
+            self._open_segment()
+            self._write(line)
+            self._close_segment()
+
+    def _encode(self, record):
+        """The text written for a queued record; runs on the writer thread."""
+        return record
+
+    def flush(self, timeout=None):
+        """Blocks until every line logged so far is on disk; returns False on timeout."""
+        if self._closed:
+            return True
+        written = threading.Event()
+        self._queue.put(written)
+        return written.wait(timeout)
+
+    def close(self):
+        """Writes out everything still queued and stops the writer thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_CLOSE)
+        self._writer.join()
+        atexit.unregister(self.close)
+
+    def _run(self):
+        unflushed = 0
+        deadline = None
+        while True:
+            try:
+                item = self._queue.get(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = _FLUSH  # flush_interval has passed since the first unflushed line
+            if not (item is _FLUSH or item is _CLOSE or isinstance(item, threading.Event)):
+                line = self._encode(item)
+                if self.rotation and self.rotation.due(self._segment_bytes, self._segment_opened):
+                    self._close_segment()
+                    self._open_segment()
+                    unflushed = 0
+                self._write(line)
+                unflushed += len(line)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if unflushed < self.flush_bytes:
+                    continue
+            self._file.flush()
+            unflushed = 0
+            deadline = None
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is _CLOSE:
+                self._close_segment()
+                return
+
+    def _write(self, line):
+        self._file.write(line)
+        self._segment_bytes += len(line)
+        self._segment_records += 1
+
+    def _open_segment(self):
+        self._segment += 1
+        if self.rotation:
+            stem, extension = os.path.splitext(self.log_file)
+            self.segment_file = f"{stem}.{self._segment:03d}{extension}"
+        else:
+            self.segment_file = self.log_file
+        self._file = open(self.segment_file, "w", buffering=max(self.flush_bytes, 8192))
+        self._segment_opened = time.monotonic()
+        self._segment_started = time.time()
+        self._segment_bytes = 0
+        self._segment_records = 0
+
+    def _close_segment(self):
+        self._file.close()
+        path = self.segment_file
+        if self.rotation and self.rotation.compress:
+            with open(path, "rb") as source, gzip.open(f"{path}.gz", "wb") as target:
+                shutil.copyfileobj(source, target)
+            os.remove(path)
+            path = f"{path}.gz"
+        self.segments.append(path)
+        if self.rotation and self.rotation.index_file:
+            entry = {"log": os.path.abspath(self.log_file), "segment": self._segment, "file": os.path.abspath(path),
+                     "opened": round(self._segment_started, 3), "closed": round(time.time(), 3),
+                     "bytes": self._segment_bytes, "records": self._segment_records,
+                     "compressed": bool(self.rotation.compress)}
+            os.makedirs(os.path.dirname(self.rotation.index_file) or ".", exist_ok=True)
+            with open(self.rotation.index_file, "a") as index:
+                index.write(json.dumps(entry) + "\n")
+
+
+class Logger(BufferedWriter):
+    """Plain-text simulation log; every message is appended to log_file as one line.
+
+    Logging never touches the disk in the calling thread, see BufferedWriter; an error
+    is flushed, with everything logged before it, as soon as the writer gets to it.
+
+    Every message has a level and a category (see CATEGORIES). A message is written only
+    if its level is at least the category's threshold, ``categories[category]`` or else
+    ``level``. Pass arguments instead of an f-string, ``debug("planning", "Path %s: %s",
+    key, path)``, and a message that is filtered out is never formatted; ``enabled``
+    guards anything more expensive.
+
+    Args:
+        level (int): threshold for categories without their own, e.g. INFO.
+        categories (dict): thresholds by category, e.g. ``{"planning": DEBUG}``.
+    """
+    def __init__(self, log_file="simulation_log.txt", flush_bytes=64 * 1024, flush_interval=0.5, rotation=None,
+                 level=DEBUG, categories=None):
+        super().__init__(log_file, flush_bytes, flush_interval, header="Simulation Log", rotation=rotation)
+        self.level = level
+        self._thresholds = dict(categories or {})
+
+    def set_level(self, level, category=None):
+        """Sets the threshold of one category, or the default one if category is None."""
+        if category is None:
+            self.level = level
+        else:
+            self._thresholds[category] = level
+
+    def enabled(self, level, category="general"):
+        return level >= self._thresholds.get(category, self.level)
+
+    def log(self, message, *args, level=INFO, category="general"):
+        """Logs ``message % args`` (message itself without args) as one line if it passes the filter."""
+        if level >= self._thresholds.get(category, self.level):
+            self._put(f"{message % args if args else message}\n")
+
+    def debug(self, category, message, *args):
+        """``log`` at DEBUG level, for per-hop and per-lookup detail."""
+        if DEBUG >= self._thresholds.get(category, self.level):
+            self._put(f"{message % args if args else message}\n")
+
+    def log_action(self, action, details=""):
+        """Logs an action with an optional detailed description."""
+        action_message = f"Action: {action}"
+        if details:
+            action_message += f", Details: {details}"
+        self.log(action_message)
+
+    def log_error(self, error_message):
+        """Logs an error message and flushes it, and everything before it, without waiting."""
+        self.log(f"ERROR: {error_message}", level=ERROR)
+        self._queue.put(_FLUSH)
+
+    def log_info(self, info_message, category="general"):
+        """Logs an informational message."""
+        self.log(f"INFO: {info_message}", category=category)
+
+
+class UnbufferedLogger(Logger):
+    """The previous Logger: opens, appends to and closes log_file on every call.
+
+    Every line is on disk as soon as ``log`` returns, at the cost of a file open per
+    line. Lines from concurrent calls are not guaranteed to keep their call order.
+    """
+    def __init__(self, log_file="simulation_log.txt"):
+        self.log_file = log_file
+        self.level = DEBUG
+        self._thresholds = {}
+        with open(self.log_file, "w") as file:
+            file.write("Simulation Log\n")
+
+    def _put(self, record):
+        with open(self.log_file, "a") as file:
+            file.write(record)
+
+    def log_error(self, error_message):
+        self.log(f"ERROR: {error_message}", level=ERROR)
+
+    def flush(self, timeout=None):
+        return True
+
+    def close(self):
+        pass
+
+
+def benchmark(lines=20000, threads=4):
+    """Times ``log_info`` calls from several threads for Logger and UnbufferedLogger. Returns a report.
+
+    Per-call time is what a caller waits for inside ``log_info``; the total runs until
+    every line is on disk. Both loggers must produce the same lines.
+    """
+    import tempfile
+
+    report = [f"{lines} lines from {threads} threads:"]
+    per_thread = lines // threads
+    with tempfile.TemporaryDirectory() as directory:
+        contents = {}
+        for logger_cls in (UnbufferedLogger, Logger):
+            path = os.path.join(directory, f"{logger_cls.__name__}.txt")
+            logger = logger_cls(path)
+            call_seconds = [0.0] * threads
+
+            def worker(index):
+                for n in range(per_thread):
+                    started = time.perf_counter()
+                    logger.log_info(f"Robot moved to node n{n} in thread {index}")
+                    call_seconds[index] += time.perf_counter() - started
+
+            started = time.perf_counter()
+            workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+            logger.close()
+            total = time.perf_counter() - started
+            with open(path) as file:
+                contents[logger_cls] = sorted(file)
+            per_call = sum(call_seconds) / (per_thread * threads) * 1e6
+            report.append(f"  {logger_cls.__name__}: {per_call:.2f} us per call, {total * 1000:.0f} ms until all on disk")
+        if contents[Logger] != contents[UnbufferedLogger]:
+            raise AssertionError("Logger and UnbufferedLogger wrote different lines")
+    return "\n".join(report)
+
+
+def benchmark_levels(calls=200000):
+    """Times a per-hop planning message with the planning category on and off. Returns a report.
+
+    Compares the old always-formatted f-string with ``debug`` and deferred formatting,
+    against an empty loop as the floor; with verbose logging off a ``debug`` call should
+    cost little more than the loop itself.
+    """
+    import tempfile
+
+    start, target, path = "gr6", "lr3", ["gr6", "gr1", "lr1", "lr3"]
+    report = [f"{calls} per-hop messages:"]
+    with tempfile.TemporaryDirectory() as directory:
+        def timed(label, level, call):
+            logger = Logger(os.path.join(directory, "levels.txt"), level=level)
+            started = time.perf_counter()
+            for _ in range(calls):
+                call(logger)
+            seconds = time.perf_counter() - started
+            logger.close()
+            report.append(f"  {label}: {seconds / calls * 1e9:.0f} ns per call")
+
+        timed("no logging (loop only)", INFO, lambda logger: None)
+        timed("f-string, always written", DEBUG,
+              lambda logger: logger.log(f"get_path: Path from {start} to {target}: {path}"))
+        timed("debug(), planning on", DEBUG,
+              lambda logger: logger.debug("planning", "get_path: Path from %s to %s: %s", start, target, path))
+        timed("debug(), planning off", INFO,
+              lambda logger: logger.debug("planning", "get_path: Path from %s to %s: %s", start, target, path))
+        timed("enabled() guard, planning off", INFO,
+              lambda logger: logger.enabled(DEBUG, "planning") and logger.debug("planning", "%s", path))
+    return "\n".join(report)
+
+
+if __name__ == "__main__":
+    print(benchmark())
+    print(benchmark_levels())
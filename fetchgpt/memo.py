@@ -0,0 +1,71 @@
+import json
+
+# Returned instead of a result the model already has from earlier in the conversation.
+UNCHANGED = "unchanged since last call"
+
+MEMOIZED_TOOLS = ("get_item_location", "get_user_node", "get_current_position", "get_path")
+
+
+class ToolMemo:
+    """Per-conversation memo for read-only tools, invalidated by the world state version
+    and by any change to the floorplan's blocked nodes.
+
+    A repeat call with the same arguments while the version is unchanged returns
+    ``UNCHANGED`` at once without running the tool. After the version moves on, the tool
+    runs again, and if its result is the same as the one the model already has it still
+    answers ``UNCHANGED``.
+
+    Args:
+        version: callable returning the world state version, e.g. ``lambda: robot.state_version``.
+        blocked_nodes: callable returning the floorplan's blocked nodes, e.g. ``lambda: graph.blocked_nodes``;
+            they change without the robot noticing, so they are part of the memo key.
+        logger (Logger): optional simulation logger.
+        enabled (bool): with False, ``wrap`` is a no-op.
+    """
+    def __init__(self, version, blocked_nodes=None, logger=None, enabled=True):
+        self.version = version
+        self.blocked_nodes = blocked_nodes
+        self.logger = logger
+        self.enabled = enabled
+        self._results = {}
+        self.hits = 0
+        self.repeats = 0
+        self.misses = 0
+
+    def new_conversation(self):
+        """Forgets every result, since a new conversation has not seen any of them."""
+        self._results = {}
+
+    def wrap(self, function_map, names=MEMOIZED_TOOLS):
+        """Returns a copy of an async tool map with the named tools memoized."""
+        if not self.enabled:
+            return function_map
+        wrapped = dict(function_map)
+        for name in names:
+            if name in function_map:
+                wrapped[name] = self._memoized(name, function_map[name])
+        return wrapped
+
+    def _memoized(self, name, func):
+        async def call(*args, **kwargs):
+            key = (name, json.dumps([args, kwargs], sort_keys=True, default=str))
+            version = self.version()
+            state = (version, tuple(self.blocked_nodes()) if self.blocked_nodes else None)
+            cached = self._results.get(key)
+            if cached and cached[0] == state:
+                self.hits += 1
+                if self.logger:
+                    self.logger.debug("model", "%s%s: %s (v%s)", name, list(args) or kwargs, UNCHANGED, version)
+                return UNCHANGED
+            result = await func(*args, **kwargs)
+            self._results[key] = (state, result)
+            if cached and cached[1] == result:
+                self.repeats += 1
+                return UNCHANGED
+            self.misses += 1
+            return result
+        return call
+
+    def report(self):
+        return (f"Tool memo: {self.hits} calls answered from memo, {self.repeats} re-run with an unchanged result, "
+                f"{self.misses} new results")
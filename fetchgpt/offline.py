@@ -0,0 +1,345 @@
+import ast
+import asyncio
+import itertools
+import json
+from types import SimpleNamespace
+
+from .fastpath import parse_command
+from .memo import UNCHANGED
+
+
+class OfflinePolicy:
+    """Deterministic stand-in for the model that plays the delivery agent from tool results alone.
+
+    It knows nothing about the world beyond what the tools tell it, so its turn count is a
+    fair proxy for how many round trips a real model needs with a given tool set. With
+    ``parallel`` it batches independent calls into one assistant message the way a
+    parallel-tool-calling model would; without it, it makes one call per turn. With
+    ``give_up_on_blocked`` it stands in for a weaker model that stops at the first
+    blocked node instead of replanning.
+    """
+    def __init__(self, command, tool_names, parallel=True, give_up_on_blocked=False):
+        self.tool_names = set(tool_names)
+        self.parallel = parallel
+        self.give_up_on_blocked = give_up_on_blocked
+        self.deliveries = parse_command(command, None) or []
+        self.index = 0
+        self.position = None
+        self.user = None
+        self.locations = {}
+        self.blocked = []
+        self.route = None
+        self.holding = False
+        self.failure = None
+        self.pending = {}
+        self.answers = {}  # Last result of each (tool, arguments)
+        self._ids = itertools.count(1)
+
+    @property
+    def delivery(self):
+        return self.deliveries[self.index] if self.index < len(self.deliveries) else None
+
+    def respond(self, tool_results):
+        """Takes ``{tool_call_id: content}`` for the previous turn and returns the next assistant message."""
+        for call_id, content in tool_results.items():
+            name, arguments = self.pending.pop(call_id, (None, None))
+            if name:
+                self._observe(name, arguments, content)
+        if not self.deliveries:
+            return {"role": "assistant", "content": "I can only carry out delivery commands offline. TERMINATE"}
+        calls = self._next_calls() if not self.failure else []
+        if self.failure:
+            return {"role": "assistant", "content": f"{self.failure} TERMINATE"}
+        if not calls:
+            delivered = ", ".join(item_id for item_id, _ in self.deliveries)
+            return {"role": "assistant", "content": f"Delivered {delivered}. TERMINATE"}
+        tool_calls = []
+        for name, arguments in calls:
+            call_id = f"call_{next(self._ids)}"
+            self.pending[call_id] = (name, arguments)
+            tool_calls.append({"id": call_id, "type": "function",
+                               "function": {"name": name, "arguments": json.dumps(arguments)}})
+        return {"role": "assistant", "content": None, "tool_calls": tool_calls}
+
+    def _observe(self, name, arguments, content):
+        key = (name, json.dumps(arguments, sort_keys=True))
+        if content == UNCHANGED:
+            # The memo's way of saying the answer is the one this call got last time.
+            content = self.answers.get(key)
+            if content is None:
+                return
+        self.answers[key] = content
+        if content.startswith("Error:"):
+            self.failure = f"{name} failed: {content}"
+        elif name == "get_current_position":
+            self.position = content
+        elif name == "get_user_node":
+            self.user = content
+        elif name == "get_item_location":
+            self.locations[arguments["item_id"]] = None if content == "None" else content
+        elif name == "get_world_snapshot":
+            self._observe_snapshot(content)
+        elif name in ("get_path", "get_alternative_path"):
+            path = _literal(content)
+            if not path:
+                self.failure = f"No route from {arguments['start_node']} to {arguments['target_node']}."
+                return
+            self.route = path[1:]
+        elif name == "move_robot":
+            node = arguments["next_node"]
+            if content == f"Moved to {node}":
+                self.position = node
+                if self.route and self.route[0] == node:
+                    self.route.pop(0)
+            else:
+                self._blocked(node)
+        elif name == "execute_path":
+            words = content.split()
+            if words[0] in ("Arrived", "Stopped"):
+                self.position = words[2]
+                self.route = None
+                if words[0] == "Stopped":
+                    self._blocked(words[-2])
+            else:
+                self.failure = f"execute_path failed: {content}"
+        elif name == "pick_up_item_robot":
+            if content.startswith("Picked up"):
+                self.holding = True
+            else:
+                self.locations.pop(arguments["item_id"], None)
+        elif name == "drop_off_item_robot":
+            self.holding = False
+            self.locations[arguments["item_id"]] = arguments["node_id"]
+            self.index += 1
+            self.route = None
+
+    def _blocked(self, node):
+        self.blocked.append(node)
+        self.route = None
+        if self.give_up_on_blocked:
+            self.failure = f"Node {node} is blocked."
+
+    def _observe_snapshot(self, content):
+        fields = dict(part.split("=", 1) for part in content.split()[1:] if "=" in part)
+        if "robot" in fields:
+            self.position = fields["robot"].split("(")[0]
+        if "user" in fields:
+            self.user = fields["user"]
+        if "held" in fields:
+            # The robot may already carry the item, e.g. when an earlier tier gave up halfway
+            self.holding = self.delivery is not None and fields["held"] == self.delivery[0]
+        for entry in fields.get("items", "-").split(","):
+            if ":" in entry:
+                item_id, node = entry.split(":", 1)
+                if node == "held":
+                    self.locations[item_id] = self.position
+                else:
+                    self.locations[item_id] = None if node == "?" else node
+        if fields.get("blocked", "-") != "-":
+            self.blocked = fields["blocked"].split(",")
+
+    def _next_calls(self):
+        delivery = self.delivery
+        if delivery is None:
+            return []
+        item_id, destination = delivery
+        lookups = self._lookups(item_id, destination)
+        if lookups:
+            if "get_world_snapshot" in self.tool_names:
+                remaining = [item for item, _ in self.deliveries[self.index:]]
+                return [("get_world_snapshot", {"item_ids": remaining})]
+            return lookups if self.parallel else lookups[:1]
+        target = self._target(item_id, destination)
+        if target is None:
+            self.failure = f"Could not find {item_id}."
+            return []
+        if self.position == target:
+            if self.holding:
+                calls = [("drop_off_item_robot", {"item_id": item_id, "node_id": target})]
+                following = self.deliveries[self.index + 1] if self.index + 1 < len(self.deliveries) else None
+                if self.parallel and following and self.locations.get(following[0]):
+                    calls.append(self._path_call(self.locations[following[0]]))
+                return calls
+            calls = [("pick_up_item_robot", {"item_id": item_id})]
+            if self.parallel:
+                calls.append(self._path_call(self._target(item_id, destination, holding=True)))
+            return calls
+        if not self.route or self.route[-1] != target:
+            return [self._path_call(target)]
+        if "execute_path" in self.tool_names:
+            return [("execute_path", {"nodes": list(self.route)})]
+        return [("move_robot", {"next_node": self.route[0]})]
+
+    def _lookups(self, item_id, destination):
+        lookups = []
+        if self.position is None:
+            lookups.append(("get_current_position", {}))
+        if self.user is None and destination == "me":
+            lookups.append(("get_user_node", {}))
+        if not self.holding:
+            wanted = [item_id]
+            if self.parallel:
+                wanted += [item for item, _ in self.deliveries[self.index + 1:]]
+            for item in wanted:
+                if item not in self.locations:
+                    lookups.append(("get_item_location", {"item_id": item}))
+        return lookups
+
+    def _target(self, item_id, destination, holding=None):
+        holding = self.holding if holding is None else holding
+        if holding:
+            return self.user if destination == "me" else destination
+        return self.locations.get(item_id)
+
+    def _path_call(self, target):
+        if self.blocked:
+            return ("get_alternative_path", {"start_node": self.position, "target_node": target,
+                                             "blocked_nodes": list(self.blocked)})
+        return ("get_path", {"start_node": self.position, "target_node": target})
+
+
+def _literal(content):
+    try:
+        return ast.literal_eval(content)
+    except (ValueError, SyntaxError):
+        return None
+
+
+def _trailing_tool_results(messages):
+    trailing = []
+    for message in reversed(messages):
+        if message.get("role") != "tool":
+            break
+        trailing.append(message)
+    results = {}
+    for message in reversed(trailing):
+        results[message["tool_call_id"]] = message.get("content", "")
+    return results
+
+
+class OfflineModelClient:
+    """autogen model client backed by OfflinePolicy, so the simulator runs without an API key.
+
+    Register it on the assistant with ``robot_agent.register_model_client(model_client_cls=OfflineModelClient)``
+    after configuring ``{"model": "offline", "model_client_cls": "OfflineModelClient"}``.
+    An optional ``"parallel_tool_calls": False`` entry makes it call one tool per turn, and
+    ``"give_up_on_blocked": True`` makes it stop at the first blocked node.
+    ``turns`` counts the model calls made so far.
+    """
+    def __init__(self, config, **kwargs):
+        self.model = config.get("model", "offline")
+        self.parallel = config.get("parallel_tool_calls", True)
+        self.give_up_on_blocked = config.get("give_up_on_blocked", False)
+        self.policy = None
+        self.turns = 0
+
+    def create(self, params):
+        messages = params["messages"]
+        if not any(message.get("role") == "assistant" for message in messages):
+            command = next(message["content"] for message in messages if message.get("role") == "user")
+            tool_names = [tool["function"]["name"] for tool in params.get("tools", [])]
+            tool_names += [function["name"] for function in params.get("functions", [])]
+            self.policy = OfflinePolicy(command, tool_names, self.parallel, self.give_up_on_blocked)
+        message = self.policy.respond(_trailing_tool_results(messages))
+        self.turns += 1
+        return SimpleNamespace(model=self.model, choices=[SimpleNamespace(message=message)], cost=0.0)
+
+    def message_retrieval(self, response):
+        message = response.choices[0].message
+        return [message if message.get("tool_calls") else message["content"]]
+
+    def cost(self, response):
+        return 0.0
+
+    @staticmethod
+    def get_usage(response):
+        return {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cost": 0.0, "model": response.model}
+
+
+async def run_offline(command, function_map, tool_names=None, parallel=True, max_turns=200):
+    """Plays one command against an async tool map without autogen. Returns the number of model turns.
+
+    Tool calls of one turn are gathered concurrently, as autogen does for tool calls.
+    """
+    policy = OfflinePolicy(command, tool_names or function_map, parallel)
+    results = {}
+    for turn in range(1, max_turns + 1):
+        message = policy.respond(results)
+        tool_calls = message.get("tool_calls")
+        if not tool_calls:
+            return turn
+        outputs = await asyncio.gather(*(function_map[call["function"]["name"]](**json.loads(call["function"]["arguments"]))
+                                         for call in tool_calls))
+        results = {call["id"]: str(output) for call, output in zip(tool_calls, outputs)}
+    return max_turns
+
+
+# Tool sets compared by ``benchmark``, from the original function set to the current one
+_BASE_TOOLS = ("move_robot", "get_current_position", "get_path", "get_alternative_path", "pick_up_item_robot",
+               "drop_off_item_robot", "get_item_location", "get_user_node")
+BENCHMARK_TOOL_SETS = {
+    "one call per turn": (_BASE_TOOLS, False),
+    "parallel calls": (_BASE_TOOLS, True),
+    "parallel calls + execute_path": (_BASE_TOOLS + ("execute_path",), True),
+    "parallel calls + execute_path + get_world_snapshot": (_BASE_TOOLS + ("execute_path", "get_world_snapshot"), True),
+}
+
+
+def benchmark(commands=50, floorplan=None, seed=7):
+    """Plays random two-item commands with each tool set in BENCHMARK_TOOL_SETS. Returns a report.
+
+    floorplan is ``{node: [adjacent nodes]}``, e.g. ``analysis.load_floorplan("8-rm.py")``,
+    and an 8x8 grid if omitted. Every tool set gets the same worlds and commands.
+    """
+    import random
+
+    from .runtime import make_async_tools
+    from .tools import READ_ONLY_TOOLS
+    from .world import Graph, World
+
+    graph = Graph()
+    if floorplan is None:
+        floorplan = {f"n{row}{column}": [] for row in range(8) for column in range(8)}
+        for row in range(8):
+            for column in range(8):
+                if column:
+                    floorplan[f"n{row}{column}"].append(f"n{row}{column - 1}")
+                if row:
+                    floorplan[f"n{row}{column}"].append(f"n{row - 1}{column}")
+    for node in floorplan:
+        graph.add_node(node.rstrip("0123456789") or node, node, (0, 0))  # Rooms are named by the node prefix
+    for node, adjacent in floorplan.items():
+        for other in adjacent:
+            graph.add_edge(node, other)
+    item_ids = ["water", "banana", "toothbrush", "comb", "toothpaste", "sunglasses", "burger", "broom"]
+
+    async def play(tool_names, parallel):
+        rng = random.Random(seed)
+        turns = delivered = 0
+        for _ in range(commands):
+            world = World.random(graph, item_ids, rng=rng)
+            wanted = rng.sample(item_ids, 2)
+            tools = make_async_tools(world.function_map(), read_only=READ_ONLY_TOOLS)
+            turns += await run_offline(f"Bring {wanted[0]} to me then {wanted[1]}", tools, tool_names, parallel)
+            delivered += all(world.item_manager.get_item_location(item_id) == world.user.node_id for item_id in wanted)
+        return turns, delivered
+
+    report = [f"{commands} two-item commands on {len(floorplan)} nodes:"]
+    for name, (tool_names, parallel) in BENCHMARK_TOOL_SETS.items():
+        turns, delivered = asyncio.run(play(tool_names, parallel))
+        report.append(f"  {name}: {turns / commands:.1f} model turns per command, {delivered} delivered")
+    return "\n".join(report)
+
+
+if __name__ == "__main__":
+    # python -m fetchgpt.offline [--floorplan 8-rm.py] [commands]
+    import sys
+
+    from .analysis import load_floorplan
+
+    arguments = sys.argv[1:]
+    floorplan = None
+    if arguments[:1] == ["--floorplan"]:
+        floorplan = load_floorplan(arguments[1])
+        arguments = arguments[2:]
+    print(benchmark(int(arguments[0]) if arguments else 50, floorplan))
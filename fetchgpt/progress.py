@@ -0,0 +1,123 @@
+import collections
+import json
+
+
+class ProgressFeed:
+    """Carries agent progress from the agent threads to the render loop without a lock.
+
+    Producers on any thread call ``push`` for whole lines and ``stream`` for model tokens;
+    ``collections.deque`` appends and pops are atomic, so neither side ever waits for the
+    other. The render loop calls ``drain`` once per frame, which moves everything pending
+    into ``lines``, a ring buffer holding the last ``max_lines`` display lines. If the
+    render loop falls behind, the oldest pending events are dropped rather than queued
+    without bound.
+
+    Args:
+        max_lines (int): lines kept for display, e.g. MAX_MESSAGES.
+        width (int): characters per display line; longer text wraps.
+        max_pending (int): events buffered between two drains.
+    """
+    def __init__(self, max_lines=5, width=70, max_pending=1000):
+        self.lines = collections.deque(maxlen=max_lines)
+        self.width = width
+        self._pending = collections.deque(maxlen=max_pending)
+        self._streaming = False
+
+    def push(self, text):
+        self._pending.append(("line", text))
+
+    def stream(self, token):
+        self._pending.append(("token", token))
+
+    def end_stream(self, text=None):
+        """Ends the streamed message; text is shown instead if nothing was streamed for it."""
+        self._pending.append(("end", text))
+
+    def drain(self):
+        """Applies pending events to ``lines``. Returns True if anything changed. Render thread only."""
+        changed = False
+        while True:
+            try:
+                kind, text = self._pending.popleft()
+            except IndexError:
+                return changed
+            changed = True
+            if kind == "token":
+                if not self._streaming:
+                    self.lines.append("")
+                    self._streaming = True
+                self._extend(text)
+            elif kind == "end":
+                if not self._streaming and text:
+                    self._add(text)
+                self._streaming = False
+            else:
+                self._streaming = False
+                self._add(text)
+
+    def _add(self, text):
+        self.lines.append("")
+        self._extend(text)
+
+    def _extend(self, text):
+        for i, part in enumerate(str(text).split("\n")):
+            if i:
+                self.lines.append("")
+            line = self.lines[-1] + part
+            while len(line) > self.width:
+                self.lines[-1] = line[:self.width]
+                self.lines.append("")
+                line = line[self.width:]
+            self.lines[-1] = line
+
+    def wrap(self, function_map):
+        """Returns a copy of an async tool map that reports each call and its result."""
+        wrapped = dict(function_map)
+        for name, func in function_map.items():
+            wrapped[name] = self._reporting(name, func)
+        return wrapped
+
+    def _reporting(self, name, func):
+        async def call(*args, **kwargs):
+            arguments = ", ".join([json.dumps(arg) for arg in args] + [f"{key}={json.dumps(value)}" for key, value in kwargs.items()])
+            result = await func(*args, **kwargs)
+            self.push(f"> {name}({arguments}) -> {result}")
+            return result
+        return call
+
+    def watch(self, agent):
+        """Shows the text of every message the agent sends, once it is complete."""
+        def show(sender, message, recipient, silent):
+            content = message.get("content") if isinstance(message, dict) else message
+            self.end_stream(f"{sender.name}: {content}" if content else None)
+            return message
+        agent.register_hook("process_message_before_send", show)
+
+
+class ProgressStream:
+    """autogen output stream that also feeds streamed model tokens into a ProgressFeed.
+
+    Everything is passed on to ``console`` (autogen's ``IOConsole``). Install it with
+    ``install_progress_stream``, which sets it as the global default; the global default
+    is used because autogen runs model calls on executor threads.
+    """
+    def __init__(self, feed, console):
+        self.feed = feed
+        self.console = console
+
+    def input(self, prompt="", *, password=False):
+        return self.console.input(prompt, password=password)
+
+    def print(self, *objects, sep=" ", end="\n", flush=False):
+        self.console.print(*objects, sep=sep, end=end, flush=flush)
+        # Streamed chunks are the only plain text autogen prints without a newline.
+        if end == "" and len(objects) == 1 and isinstance(objects[0], str) and not objects[0].startswith("\033"):
+            self.feed.stream(objects[0])
+
+
+def install_progress_stream(feed):
+    """Makes autogen's console output, and with it streamed model tokens, feed into feed as well."""
+    # Imported here so the module, and a headless run that never talks to a model, can do without autogen.
+    from autogen.io import IOConsole, IOStream
+
+    IOStream.set_global_default(ProgressStream(feed, IOConsole()))
@@ -0,0 +1,264 @@
+import collections
+import hashlib
+import json
+import random
+import threading
+import time
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0, retry_after=None, rng=random):
+    """Full-jitter exponential backoff: a random delay up to ``base * 2**attempt``, capped.
+
+    A server supplied ``retry_after`` is treated as a lower bound.
+    """
+    delay = rng.uniform(0, min(cap, base * 2 ** attempt))
+    if retry_after:
+        delay = max(delay, retry_after)
+    return delay
+
+
+class TokenBucket:
+    """Refills at ``per_minute / 60`` units per second up to ``capacity`` (a minute's worth by default).
+
+    Not thread-safe on its own; RateLimiter guards it.
+    """
+    def __init__(self, per_minute, capacity=None, clock=time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.clock = clock
+        self.level = self.capacity
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until ``amount`` can be taken; requests larger than the bucket wait for a full one."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self._refill()
+        self.level -= amount  # May go negative when usage is reconciled after the fact
+
+
+class RateLimiter:
+    """Process-wide requests-per-minute and tokens-per-minute limiter with fair queuing.
+
+    Waiting callers are served round-robin across conversations, so one long conversation
+    cannot starve the others; within a conversation requests keep their order. A 429 from
+    the server pauses every conversation, not just the one that hit it.
+
+    Args:
+        rpm (int): requests per minute, or None for no request limit.
+        tpm (int): tokens per minute, or None for no token limit.
+        clock: time source in seconds.
+    """
+    def __init__(self, rpm=None, tpm=None, clock=time.monotonic):
+        self.clock = clock
+        self.requests = TokenBucket(rpm, clock=clock) if rpm else None
+        self.tokens = TokenBucket(tpm, clock=clock) if tpm else None
+        self._condition = threading.Condition()
+        self._queues = {}
+        self._order = collections.deque()  # Conversations with waiters, next to be served first
+        self._paused_until = 0.0
+        # Report counters
+        self.granted = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def acquire(self, conversation, tokens=0):
+        """Blocks until this conversation's turn comes and both budgets allow the request. Returns the wait in seconds."""
+        start = self.clock()
+        ticket = object()
+        with self._condition:
+            queue = self._queues.setdefault(conversation, collections.deque())
+            if not queue:
+                self._order.append(conversation)
+            queue.append(ticket)
+            while True:
+                if self._order[0] == conversation and queue[0] is ticket:
+                    wait = self._wait_time(tokens)
+                    if wait <= 0:
+                        break
+                    self._condition.wait(wait)
+                else:
+                    self._condition.wait()
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(tokens)
+            queue.popleft()
+            self._order.popleft()
+            if queue:
+                self._order.append(conversation)
+            else:
+                del self._queues[conversation]
+            waited = self.clock() - start
+            self.granted += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            self._condition.notify_all()
+        return waited
+
+    def _wait_time(self, tokens):
+        waits = [self._paused_until - self.clock()]
+        if self.requests:
+            waits.append(self.requests.wait_time(1))
+        if self.tokens:
+            waits.append(self.tokens.wait_time(tokens))
+        return max(waits)
+
+    def pause(self, seconds):
+        """Holds back every conversation for ``seconds``, after the server said we are over the limit."""
+        with self._condition:
+            self.throttled += 1
+            self._paused_until = max(self._paused_until, self.clock() + seconds)
+            self._condition.notify_all()
+
+    def record_usage(self, estimated, actual):
+        """Charges the token budget for the difference between the estimate taken up front and the real usage."""
+        if self.tokens and actual is not None:
+            with self._condition:
+                self.tokens.take(actual - estimated)
+
+    def report(self):
+        average = self.total_wait / self.granted if self.granted else 0.0
+        return (f"Rate limiter: {self.granted} requests granted, {self.throttled} server throttles, "
+                f"average wait {average:.2f}s, longest wait {self.max_wait:.2f}s")
+
+
+class Coalescer:
+    """Runs identical concurrent calls once and hands every caller the same result or exception."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.coalesced = 0
+
+    def run(self, key, func):
+        with self._lock:
+            entry = self._inflight.get(key)
+            leader = entry is None
+            if leader:
+                entry = self._inflight[key] = {"event": threading.Event(), "result": None, "error": None}
+            else:
+                self.coalesced += 1
+        if not leader:
+            entry["event"].wait()
+            if entry["error"] is not None:
+                raise entry["error"]
+            return entry["result"]
+        try:
+            entry["result"] = func()
+            return entry["result"]
+        except BaseException as error:
+            entry["error"] = error
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            entry["event"].set()
+
+
+_shared_limiter = None
+_shared_coalescer = Coalescer()
+_shared_lock = threading.Lock()
+
+
+def configure_rate_limits(rpm=None, tpm=None):
+    """Replaces the process-wide limiter used by RateLimitedModelClient. Returns it."""
+    global _shared_limiter
+    with _shared_lock:
+        _shared_limiter = RateLimiter(rpm=rpm, tpm=tpm)
+        return _shared_limiter
+
+
+def shared_limiter():
+    """The process-wide limiter, unlimited until configure_rate_limits is called."""
+    global _shared_limiter
+    with _shared_lock:
+        if _shared_limiter is None:
+            _shared_limiter = RateLimiter()
+        return _shared_limiter
+
+
+def estimate_tokens(params):
+    """Rough token count for a request: about four characters per prompt token plus the completion budget."""
+    prompt = json.dumps([params.get("messages", []), params.get("tools", [])], default=str)
+    return len(prompt) // 4 + params.get("max_tokens", 512)
+
+
+def _conversation_key(params):
+    """Identifies a conversation by its system prompt and opening message, which never change within it."""
+    messages = params.get("messages", [])
+    return hashlib.sha1(json.dumps(messages[:2], sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after")) if response is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimitedModelClient:
+    """autogen model client that sends OpenAI requests through the process-wide limiter and coalescer.
+
+    Configure with ``"model_client_cls": "RateLimitedModelClient"`` in a config_list entry and
+    register it with ``agent.register_model_client(model_client_cls=RateLimitedModelClient)``.
+    The entry's ``max_retries`` is handled here with jittered backoff instead of by the
+    OpenAI client, so a throttled request also slows down every other conversation.
+    """
+    def __init__(self, config, limiter=None, coalescer=None, **kwargs):
+        # openai and autogen's client are only imported once a real model client is needed.
+        import openai
+        from autogen.oai.client import OpenAIClient
+
+        self._openai = openai
+        self.limiter = limiter or shared_limiter()
+        self.coalescer = coalescer or _shared_coalescer
+        self.max_retries = config.get("max_retries", 5)
+        self._client = OpenAIClient(openai.OpenAI(api_key=config.get("api_key"), base_url=config.get("base_url"),
+                                                  timeout=config.get("timeout"), max_retries=0))
+
+    def create(self, params):
+        params = {key: value for key, value in params.items() if key != "model_client_cls"}
+        key = json.dumps(params, sort_keys=True, default=str)
+        return self.coalescer.run(key, lambda: self._send(params))
+
+    def _send(self, params):
+        conversation = _conversation_key(params)
+        tokens = estimate_tokens(params)
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(conversation, tokens)
+            try:
+                response = self._client.create(params)
+            except self._openai.RateLimitError as error:
+                if attempt == self.max_retries:
+                    raise
+                self.limiter.pause(backoff_delay(attempt, retry_after=_retry_after(error)))
+            except (self._openai.APIConnectionError, self._openai.InternalServerError):
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(backoff_delay(attempt))
+            else:
+                usage = getattr(response, "usage", None)
+                self.limiter.record_usage(tokens, usage.total_tokens if usage else None)
+                return response
+
+    def message_retrieval(self, response):
+        return self._client.message_retrieval(response)
+
+    def cost(self, response):
+        return self._client.cost(response)
+
+    @staticmethod
+    def get_usage(response):
+        from autogen.oai.client import OpenAIClient
+
+        return OpenAIClient.get_usage(response)
@@ -0,0 +1,266 @@
+import collections
+import time
+
+import pygame
+
+NODE_COLOR = (192, 192, 192)
+BLOCKED_NODE_COLOR = (255, 0, 0)
+EDGE_COLOR = (0, 255, 0)
+ROOM_COLOR = (0, 0, 255)
+
+
+class StaticMapLayer:
+    """The floorplan (rooms, edges and nodes) pre-rendered to one Surface and reused every frame.
+
+    The layer is redrawn only when ``graph.topology_version`` or the blocked nodes
+    change, so a frame costs one full-screen blit however large the map is. Each
+    undirected edge is drawn once, with node coordinates looked up from a dict.
+
+    Args:
+        graph (Graph): navigation graph.
+        rooms (list): Room objects to outline.
+        size (tuple): layer size in pixels, normally the screen size.
+        background: fill colour behind the map.
+    """
+    def __init__(self, graph, rooms, size, background=(0, 0, 0)):
+        self.graph = graph
+        self.rooms = rooms
+        self.size = size
+        self.background = background
+        self.surface = None
+        self.redraws = 0
+        self._key = None
+
+    @property
+    def key(self):
+        """Changes whenever the layer needs redrawing."""
+        return (self.graph.topology_version, tuple(self.graph.blocked_nodes))
+
+    def render(self):
+        """Returns the layer, redrawing it first if the map changed since the last call."""
+        key = self.key
+        if key != self._key:
+            self._key = key
+            self._redraw()
+        return self.surface
+
+    def _redraw(self):
+        if self.surface is None:
+            self.surface = pygame.Surface(self.size).convert()
+        surface = self.surface
+        surface.fill(self.background)
+        coordinates = {node_id: position for nodes in self.graph.nodes.values() for node_id, position in nodes.items()}
+        blocked = set(self.graph.blocked_nodes)
+        # Same stacking as the old per-frame drawing: nodes, then edges over them, then room outlines.
+        for node_id, position in coordinates.items():
+            pygame.draw.circle(surface, BLOCKED_NODE_COLOR if node_id in blocked else NODE_COLOR, position, 5)
+        for start_node, connections in self.graph.edges.items():
+            for end_node in connections:
+                if start_node < end_node:
+                    pygame.draw.line(surface, EDGE_COLOR, coordinates[start_node], coordinates[end_node], 1)
+        for room in self.rooms:
+            x1, y1, x2, y2 = room.bounds
+            pygame.draw.rect(surface, ROOM_COLOR, [x1, y1, x2 - x1, y2 - y1], 1)
+        self.redraws += 1
+
+
+def sprite_anchors(graph, robot, user, item_manager):
+    """Screen points the robot, user and item sprites are drawn around, keyed by entity."""
+    anchors = {"robot": (robot.x, robot.y), "user": graph.get_node_coordinates(user.node_id)}
+    for item_id, node_id in item_manager.get_all_items().items():
+        anchors[item_id] = graph.get_node_coordinates(node_id)
+    return anchors
+
+
+class DirtyRects:
+    """Collects the screen areas that need redrawing this frame from changes in world state.
+
+    The main loop reports what changed (``changed``/``add``/``add_sprites``), draws only
+    inside the collected rectangles and presents them with ``pygame.display.update``. A
+    frame with nothing collected is skipped entirely. The first frame is drawn in full.
+
+    Args:
+        size (tuple): screen size in pixels.
+    """
+    def __init__(self, size):
+        self.screen_rect = pygame.Rect((0, 0), size)
+        self._rects = [self.screen_rect.copy()]
+        self._values = {}
+        self._anchors = {}
+        # Report counters
+        self.frames = 0
+        self.skipped = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.pixels = 0
+
+    def changed(self, name, value):
+        """True if value differs from the one reported under name last frame (or is new)."""
+        unchanged = name in self._values and self._values[name] == value
+        self._values[name] = value
+        return not unchanged
+
+    def add(self, rect):
+        self._rects.append(pygame.Rect(rect))
+
+    def add_full(self):
+        self.add(self.screen_rect)
+
+    def add_sprites(self, anchors, margin):
+        """Marks the old and new surroundings of every anchor that moved, appeared or disappeared."""
+        for key in set(anchors) | set(self._anchors):
+            old, new = self._anchors.get(key), anchors.get(key)
+            if old != new:
+                for point in (old, new):
+                    if point is not None:
+                        self.add((point[0] - margin, point[1] - margin, 2 * margin, 2 * margin))
+        self._anchors = dict(anchors)
+
+    def collect(self):
+        """Returns this frame's rectangles clipped to the screen; an empty list means skip the frame."""
+        rects = [rect.clip(self.screen_rect) for rect in self._rects]
+        self._rects = []
+        rects = [rect for rect in rects if rect.width and rect.height]
+        if self.screen_rect in rects:
+            rects = [self.screen_rect.copy()]
+        if not rects:
+            self.skipped += 1
+        return rects
+
+    def record(self, seconds, rects):
+        """Adds one drawn frame's render time and presented rectangles to the report."""
+        self.frames += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.pixels += sum(rect.width * rect.height for rect in rects)
+
+    def report(self):
+        average = self.seconds / self.frames * 1000 if self.frames else 0.0
+        coverage = self.pixels / (self.frames * self.screen_rect.width * self.screen_rect.height) if self.frames else 0.0
+        return (f"Rendering: {self.frames} frames drawn, {self.skipped} skipped, {average:.2f} ms average, "
+                f"{self.max_seconds * 1000:.2f} ms worst, {coverage:.1%} of the screen presented per drawn frame")
+
+
+class FrameClock:
+    """Fixed-rate main loop timing with separate simulation and render ticks.
+
+    ``tick`` paces the loop at ``tick_rate`` iterations per second with a
+    ``pygame.time.Clock``; events and world-state changes are handled on every tick.
+    ``render_due`` allows at most ``max_fps`` frames per second, so drawing never
+    holds up input. ``mark`` notes when something the user should see happened (an
+    input event, a world change) and ``presented`` turns every pending mark into an
+    X-to-screen latency once the frame showing it is on screen. pygame events carry no
+    timestamp, so a change first seen on a tick is dated from the previous tick, the
+    earliest it can have happened; latencies therefore include time spent queued and are
+    an upper bound.
+
+    Args:
+        tick_rate (int): simulation ticks per second.
+        max_fps (int): frame cap; 0 renders on every tick.
+        max_samples (int): latency samples kept per kind.
+    """
+    def __init__(self, tick_rate=60, max_fps=30, max_samples=1000):
+        self.clock = pygame.time.Clock()
+        self.tick_rate = tick_rate
+        self.render_interval = 1.0 / max_fps if max_fps else 0.0
+        self.ticks = 0
+        self.frames = 0
+        self.latencies = {}
+        self._max_samples = max_samples
+        self._marks = {}
+        self._next_render = 0.0
+        self._tick_started = self._previous_tick = time.perf_counter()
+
+    def tick(self):
+        """Waits out the rest of the tick and returns the seconds since the previous one."""
+        self.ticks += 1
+        elapsed = self.clock.tick(self.tick_rate) / 1000.0
+        self._previous_tick, self._tick_started = self._tick_started, time.perf_counter()
+        return elapsed
+
+    def render_due(self):
+        now = time.perf_counter()
+        if now < self._next_render:
+            return False
+        # Never schedule in the past, so a slow frame does not cause a burst of catch-up frames.
+        self._next_render = max(self._next_render + self.render_interval, now)
+        return True
+
+    def mark(self, kind):
+        """Records that a change of this kind is waiting to be shown; the earliest one counts."""
+        self._marks.setdefault(kind, self._previous_tick)
+
+    def presented(self):
+        """Call right after a frame reaches the screen."""
+        self.frames += 1
+        now = time.perf_counter()
+        for kind, marked_at in self._marks.items():
+            samples = self.latencies.setdefault(kind, collections.deque(maxlen=self._max_samples))
+            samples.append(now - marked_at)
+        self._marks.clear()
+
+    def discard(self):
+        """Drops pending marks when a render slot found nothing visible to draw."""
+        self._marks.clear()
+
+    def report(self):
+        lines = [f"Frame clock: {self.ticks} ticks at {self.clock.get_fps():.1f}/s, {self.frames} frames presented"]
+        for kind, samples in self.latencies.items():
+            ordered = sorted(samples)
+            p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+            lines.append(f"  {kind}-to-screen: {sum(ordered) / len(ordered) * 1000:.1f} ms average, "
+                         f"{p95 * 1000:.1f} ms p95, {ordered[-1] * 1000:.1f} ms worst over {len(ordered)} samples")
+        return "\n".join(lines)
+
+
+class TextCache:
+    """LRU cache of rendered text surfaces, so unchanged labels are rasterized once.
+
+    Entries are keyed on ``(font, text, antialias, color, background)`` and evicted
+    least recently used first once either limit is exceeded. Cached surfaces are shared:
+    blit them, never draw on them.
+
+    Args:
+        max_entries (int): most surfaces kept.
+        max_bytes (int): most pixel memory kept, in bytes.
+        enabled (bool): with False, ``render`` calls ``font.render`` every time.
+    """
+    def __init__(self, max_entries=512, max_bytes=8 * 1024 * 1024, enabled=True):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.bytes = 0
+        self._surfaces = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.seconds = 0.0
+
+    def render(self, font, text, antialias, color, background=None):
+        """Same arguments and result as ``font.render``."""
+        key = (font, text, antialias, tuple(color), tuple(background) if background is not None else None)
+        surface = self._surfaces.get(key) if self.enabled else None
+        if surface is not None:
+            self.hits += 1
+            self._surfaces.move_to_end(key)
+            return surface
+        self.misses += 1
+        started = time.perf_counter()
+        surface = font.render(text, antialias, color, background)
+        self.seconds += time.perf_counter() - started
+        if self.enabled:
+            self._surfaces[key] = surface
+            self.bytes += surface.get_pitch() * surface.get_height()
+            while len(self._surfaces) > self.max_entries or (self.bytes > self.max_bytes and len(self._surfaces) > 1):
+                _, evicted = self._surfaces.popitem(last=False)
+                self.bytes -= evicted.get_pitch() * evicted.get_height()
+                self.evictions += 1
+        return surface
+
+    def clear(self):
+        self._surfaces.clear()
+        self.bytes = 0
+
+    def report(self):
+        return (f"Text cache: {self.hits} hits, {self.misses} rendered in {self.seconds * 1000:.1f} ms, "
+                f"{self.evictions} evicted, {len(self._surfaces)} surfaces / {self.bytes / 1024:.0f} KiB held")
@@ -0,0 +1,159 @@
+import inspect
+import time
+
+from .fastpath import parse_command
+
+# Tiers from cheapest to most capable; a command escalates towards the end of this list.
+TIERS = ("local", "small", "large")
+
+
+def agent_cost(agent):
+    """Total model cost in dollars an autogen agent has run up so far; 0.0 before it exists."""
+    if agent is None:
+        return 0.0
+    usage = agent.get_total_usage()
+    return usage.get("total_cost", 0.0) if usage else 0.0
+
+
+class RouteTier:
+    """One way of executing a command, with latency and cost counters.
+
+    Args:
+        name (str): one of TIERS.
+        run: callable taking the command and returning a result, or None when it gave up; may be async.
+        cost: callable returning the tier's running cost in dollars, or None for a free tier.
+    """
+    def __init__(self, name, run, cost=None):
+        self.name = name
+        self.run = run
+        self.cost = cost or (lambda: 0.0)
+        self.routed = 0
+        self.attempts = 0
+        self.failures = 0
+        self.seconds = 0.0
+        self.dollars = 0.0
+
+
+class CommandClassifier:
+    """Judges how hard a command is from its text and what the robot knows about the world.
+
+    Plain delivery commands whose route is clear of known blocked nodes go to the local
+    planner; known blocked nodes on the route or many items call for a model, and
+    anything outside the delivery grammar goes straight to the large model.
+
+    Args:
+        items (dict): known items.
+        robot (Robot): the robot; ``robot.blocked_nodes`` holds the blocked nodes it has run into.
+        graph (Graph): navigation graph.
+        item_manager (ItemLocationManager): item locations.
+        user_node: callable returning the user's current node.
+        max_local_items (int): most items the local tier is trusted with in one command.
+    """
+    def __init__(self, items, robot, graph, item_manager, user_node, max_local_items=2):
+        self.items = items
+        self.robot = robot
+        self.graph = graph
+        self.item_manager = item_manager
+        self.user_node = user_node
+        self.max_local_items = max_local_items
+
+    def classify(self, command):
+        """Returns ``(tier, reason)``."""
+        deliveries = parse_command(command, self.items)
+        if deliveries is None:
+            return "large", "not a plain delivery command"
+        route = self.route(deliveries)
+        if route is None:
+            return "large", "no known route for every leg"
+        blocked = sorted(set(route) & set(self.robot.blocked_nodes))
+        if blocked:
+            return "small", f"known blocked nodes {blocked} on the route"
+        if len(deliveries) > self.max_local_items:
+            return "small", f"{len(deliveries)} items"
+        return "local", f"{len(deliveries)} item(s), {len(route) - 1} hops, no known blocked nodes"
+
+    def route(self, deliveries):
+        """Shortest route, ignoring blocked nodes, that fetches and delivers each item in order."""
+        position = self.robot.current_node
+        route = [position]
+        for item_id, destination in deliveries:
+            for target in (self.item_manager.get_item_location(item_id),
+                           self.user_node() if destination == "me" else destination):
+                path = self.graph.find_path(position, target) if target else None
+                if not path:
+                    return None
+                route += path[1:]
+                position = target
+        return route
+
+    def completed(self, command, result):
+        """Whether a tier's result finished the command; delivery commands are checked against the world."""
+        if result is None:
+            return False
+        deliveries = parse_command(command, self.items)
+        if deliveries is None:
+            return True
+        if self.robot.held_item is not None:
+            return False
+        return all(self.item_manager.get_item_location(item_id) == (self.user_node() if destination == "me" else destination)
+                   for item_id, destination in deliveries)
+
+
+class ModelRouter:
+    """Runs each command on the cheapest tier the classifier allows and escalates when it fails.
+
+    A tier fails when it gives up (returns None) or the classifier finds the command not
+    done afterwards, e.g. the small model stopped at a blocked node or a pick-up failed.
+    The next tier then continues from the current world state.
+
+    Args:
+        tiers (list): RouteTier objects in escalation order.
+        classifier (CommandClassifier): picks the starting tier and checks results.
+        logger (Logger): optional simulation logger.
+    """
+    def __init__(self, tiers, classifier, logger=None):
+        self.tiers = sorted(tiers, key=lambda tier: TIERS.index(tier.name))
+        self.classifier = classifier
+        self.logger = logger
+
+    async def run(self, command):
+        name, reason = self.classifier.classify(command)
+        start = next((i for i, tier in enumerate(self.tiers) if TIERS.index(tier.name) >= TIERS.index(name)),
+                     len(self.tiers) - 1)
+        if self.tiers[start].name != name:
+            # E.g. a plain delivery with the fast path turned off
+            reason = f"{name} tier disabled"
+        self.tiers[start].routed += 1
+        self._log(f"Routing '{command}' to {self.tiers[start].name} ({reason})")
+        result = None
+        for tier in self.tiers[start:]:
+            cost = tier.cost()
+            began = time.perf_counter()
+            result = tier.run(command)
+            if inspect.isawaitable(result):
+                result = await result
+            elapsed = time.perf_counter() - began
+            cost = tier.cost() - cost
+            tier.attempts += 1
+            tier.seconds += elapsed
+            tier.dollars += cost
+            done = self.classifier.completed(command, result)
+            self._log(f"Tier {tier.name} {'completed' if done else 'failed'} '{command}' in {elapsed:.2f}s at ${cost:.4f}")
+            if done:
+                return result
+            tier.failures += 1
+            if tier is not self.tiers[-1]:
+                self._log(f"Escalating '{command}' from {tier.name}")
+        return result
+
+    def report(self):
+        lines = ["Routing:"]
+        for tier in self.tiers:
+            average = tier.seconds / tier.attempts if tier.attempts else 0.0
+            lines.append(f"  {tier.name}: {tier.routed} routed, {tier.attempts} attempts, {tier.failures} failed, "
+                         f"{average:.2f}s average, ${tier.dollars:.4f} total")
+        return "\n".join(lines)
+
+    def _log(self, message):
+        if self.logger:
+            self.logger.log_info(message, category="model")
@@ -0,0 +1,307 @@
+import asyncio
+import functools
+import inspect
+import itertools
+import threading
+import time
+
+
+class EventLoopThread:
+    """Runs an asyncio event loop on a daemon thread so the pygame loop never blocks on it.
+
+    One loop can host any number of CommandRuntime instances, which is how several
+    simulated worlds share a process.
+    """
+    def __init__(self, name="command-runtime"):
+        self.name = name
+        self.loop = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._ready.set()
+        self.loop.run_forever()
+        self.loop.close()
+
+    def call_soon(self, callback, *args):
+        """Schedules a plain callback on the loop from any thread."""
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def run_coroutine(self, coro):
+        """Submits a coroutine from any thread and returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self, timeout=5):
+        if self._thread is None:
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
+        self._thread = None
+
+
+class CommandHandle:
+    """Tracks one submitted command through queued -> running -> done/failed/cancelled/timed_out."""
+    def __init__(self, command_id, command, timeout, kwargs):
+        self.command_id = command_id
+        self.command = command
+        self.timeout = timeout
+        self.kwargs = kwargs
+        self.state = "queued"
+        self.result = None
+        self.error = None
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self._task = None
+        self._runtime = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+
+    @property
+    def done(self):
+        return self._finished.is_set()
+
+    @property
+    def queue_latency(self):
+        """Seconds spent waiting in the queue before the command started, or None."""
+        if self.started_at is None:
+            return None
+        return self.started_at - self.submitted_at
+
+    @property
+    def run_time(self):
+        """Seconds spent executing, or None if the command has not finished."""
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    def cancel(self):
+        """Cancels the command whether it is still queued or already running."""
+        return self._runtime.cancel(self.command_id)
+
+    def add_done_callback(self, callback):
+        """Calls ``callback(handle)`` once the command finishes, immediately if it already has.
+
+        Callbacks run on the runtime's loop thread and must not block.
+        """
+        with self._lock:
+            if not self.done:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def wait(self, timeout=None):
+        """Blocks the calling thread until the command has finished; returns True if it did."""
+        return self._finished.wait(timeout)
+
+    def _finish(self, state, result=None, error=None):
+        self.state = state
+        self.result = result
+        self.error = error
+        self.finished_at = time.monotonic()
+        with self._lock:
+            self._finished.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+
+class CommandRuntime:
+    """Executes commands one at a time from a single queue on an asyncio event loop.
+
+    ``handles`` maps the ids of queued and running commands to their handles; a command is
+    dropped from it once it finishes, so keep the handle ``submit`` returns to read the outcome.
+
+    Args:
+        handler: coroutine function called as ``await handler(command, **kwargs)``.
+        timeout (float): default per-command timeout in seconds, None for no limit.
+        loop_thread (EventLoopThread): loop to run on; a private one is started if omitted.
+        logger (Logger): optional simulation logger for lifecycle messages.
+    """
+    def __init__(self, handler, timeout=None, loop_thread=None, logger=None):
+        self.handler = handler
+        self.timeout = timeout
+        self.logger = logger
+        self._owns_loop = loop_thread is None
+        self.loop_thread = loop_thread or EventLoopThread()
+        self.handles = {}
+        self._handles_lock = threading.Lock()  # submit and cancel may come from any thread
+        self._ids = itertools.count(1)
+        self._queue = None
+        self._worker = None
+
+    def start(self):
+        self.loop_thread.start()
+        self.loop_thread.run_coroutine(self._start_worker()).result()
+        return self
+
+    async def _start_worker(self):
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    def submit(self, command, timeout=None, **kwargs):
+        """Queues a command from any thread and returns its CommandHandle immediately."""
+        handle = CommandHandle(next(self._ids), command, timeout if timeout is not None else self.timeout, kwargs)
+        handle._runtime = self
+        with self._handles_lock:
+            self.handles[handle.command_id] = handle
+        handle.add_done_callback(self._forget)
+        self._log(f"Command {handle.command_id} queued: {command}")
+        self.loop_thread.call_soon(self._queue.put_nowait, handle)
+        return handle
+
+    def cancel(self, command_id):
+        """Cancels a queued or running command. Returns False if it had already finished."""
+        with self._handles_lock:
+            handle = self.handles.get(command_id)
+        if handle is None or handle.done:
+            return False
+        self.loop_thread.call_soon(self._cancel, handle)
+        return True
+
+    def _forget(self, handle):
+        with self._handles_lock:
+            self.handles.pop(handle.command_id, None)
+
+    def _cancel(self, handle):
+        if handle.done:
+            return
+        if handle._task is not None:
+            handle._task.cancel()
+        else:
+            # Still queued: the worker skips it when it comes up.
+            handle._finish("cancelled")
+            self._log(f"Command {handle.command_id} cancelled before start")
+
+    @property
+    def pending(self):
+        """Number of commands queued or running."""
+        with self._handles_lock:
+            handles = list(self.handles.values())
+        return sum(1 for handle in handles if not handle.done)
+
+    def is_idle(self):
+        return self.pending == 0
+
+    async def _run(self):
+        while True:
+            handle = await self._queue.get()
+            if handle.done:
+                continue
+            handle.state = "running"
+            handle.started_at = time.monotonic()
+            self._log(f"Command {handle.command_id} started after {handle.queue_latency:.3f}s in queue")
+            handle._task = asyncio.get_running_loop().create_task(self.handler(handle.command, **handle.kwargs))
+            # Each outcome is logged before waiters are released, so the log reads in order.
+            try:
+                result = await asyncio.wait_for(asyncio.shield(handle._task), handle.timeout)
+            except asyncio.TimeoutError:
+                handle._task.cancel()
+                self._log_error(f"Command {handle.command_id} timed out after {handle.timeout}s")
+                handle._finish("timed_out")
+            except asyncio.CancelledError:
+                handle._task.cancel()
+                self._log(f"Command {handle.command_id} cancelled")
+                handle._finish("cancelled")
+                if asyncio.current_task().cancelling():
+                    # The worker itself is being stopped, not just this command.
+                    raise
+            except Exception as e:
+                self._log_error(f"Command {handle.command_id} failed: {e}")
+                handle._finish("failed", error=e)
+            else:
+                self._log(f"Command {handle.command_id} finished in {time.monotonic() - handle.started_at:.3f}s")
+                handle._finish("done", result=result)
+
+    def stop(self, timeout=5):
+        """Cancels outstanding work and shuts down the loop if this runtime started it."""
+        with self._handles_lock:
+            command_ids = list(self.handles)
+        for command_id in command_ids:
+            self.cancel(command_id)
+        if self._worker is not None:
+            self.loop_thread.run_coroutine(self._stop_worker()).result(timeout)
+            self._worker = None
+        if self._owns_loop:
+            self.loop_thread.stop(timeout)
+
+    async def _stop_worker(self):
+        self._worker.cancel()
+        await asyncio.gather(self._worker, return_exceptions=True)
+
+    def _log(self, message):
+        if self.logger:
+            self.logger.log_info(message)
+
+    def _log_error(self, message):
+        if self.logger:
+            self.logger.log_error(message)
+
+
+def make_async_tools(function_map, read_only=(), gate=None):
+    """Wraps plain tool functions as coroutines so the agent awaits them on the runtime loop.
+
+    Tools named in ``read_only`` run in worker threads and overlap with each other when
+    the model asks for several in one message. All other tools run inline on the loop
+    thread, one at a time and in call order, after reads that were issued before them
+    have finished; a world is therefore only ever mutated by the command at the head of
+    its queue. Pass the ``gate`` that other code touching the same world goes through,
+    e.g. the local planner, to keep it in that order too.
+    """
+    if gate is None:
+        gate = ToolGate()
+    async_map = {}
+    for name, func in function_map.items():
+        if inspect.iscoroutinefunction(func):
+            async_map[name] = func
+        elif name in read_only:
+            async_map[name] = gate.reader(func)
+        else:
+            async_map[name] = gate.writer(func)
+    return async_map
+
+
+class ToolGate:
+    """Lets read-only tool calls overlap while mutating calls run alone, in call order."""
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self._readers = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def reader(self, func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            async with self._lock:
+                # Only waits for writes issued earlier in the batch.
+                self._readers += 1
+                self._idle.clear()
+            try:
+                return await asyncio.to_thread(func, *args, **kwargs)
+            finally:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._idle.set()
+        return wrapper
+
+    def writer(self, func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            async with self._lock:
+                await self._idle.wait()
+                result = func(*args, **kwargs)
+            # Yield once so cancellation and timeouts take effect between tool calls.
+            await asyncio.sleep(0)
+            return result
+        return wrapper
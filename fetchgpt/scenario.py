@@ -0,0 +1,211 @@
+import gzip
+import json
+import os
+import random
+import re
+import time
+
+from .events import read_events
+from .world import World, randomize_entities
+
+SCENARIO_FORMAT = "fetchgpt-scenarios"
+SCENARIO_VERSION = 1
+
+
+def requested_items(task, items):
+    """The items a task names, in the order it names them."""
+    found = []
+    for item_id in items:
+        match = re.search(rf"\b{re.escape(item_id)}\b", task or "", re.IGNORECASE)
+        if match:
+            found.append((match.start(), item_id))
+    return [item_id for _, item_id in sorted(found)]
+
+
+class Scenario:
+    """Everything that decides how an episode starts, so the episode can be replayed.
+
+    A scenario names its floorplan instead of holding it: the scripts set ``FLOORPLAN``
+    to the name of the house they build, and refuse a scenario made for another one.
+
+    Args:
+        floorplan (str): floorplan name, e.g. ``"8-rm"``; None if unknown, then only the nodes are checked.
+        robot (str): robot node.
+        user (str): user node.
+        items (dict): item node by item id.
+        blocked (list): blocked nodes.
+        seed (int): seed of the run's ``random``, None if it was not seeded.
+        command (str): command given to the robot, None to let the script make one up.
+    """
+    def __init__(self, floorplan, robot, user, items, blocked=(), seed=None, command=None):
+        self.floorplan = floorplan
+        self.robot = robot
+        self.user = user
+        self.items = dict(items)
+        self.blocked = list(blocked)
+        self.seed = seed
+        self.command = command
+
+    @classmethod
+    def random(cls, floorplan, graph, item_ids, num_blocked=4, seed=None, command=None):
+        """A scenario placed like the scripts place things; the same seed gives the same scenario."""
+        robot, user, items, blocked = randomize_entities(graph, item_ids, num_blocked, random.Random(seed))
+        return cls(floorplan, robot, user, items, blocked, seed, command)
+
+    @classmethod
+    def from_episode(cls, event, floorplan=None):
+        """The scenario of an ``episode`` event from an event log; floorplan names the house if the event does not."""
+        return cls(event.get("floorplan_name") or floorplan, event["robot"], event["user"], event["items"], event["blocked"], event["seed"],
+                   event["task"])
+
+    def to_dict(self):
+        return {"floorplan": self.floorplan, "robot": self.robot, "user": self.user, "items": self.items,
+                "blocked": self.blocked, "seed": self.seed, "command": self.command}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["floorplan"], data["robot"], data["user"], data["items"], data.get("blocked", ()),
+                   data.get("seed"), data.get("command"))
+
+    def check(self, graph, floorplan=None, item_ids=None):
+        """Raises ValueError unless the scenario fits graph, the floorplan named floorplan and item_ids."""
+        if floorplan and self.floorplan and self.floorplan != floorplan:
+            raise ValueError(f"Scenario is for floorplan {self.floorplan!r}, not {floorplan!r}")
+        nodes = graph.get_all_nodes()
+        unknown = [node for node in (self.robot, self.user, *self.items.values(), *self.blocked) if node not in nodes]
+        if unknown:
+            raise ValueError(f"Scenario nodes not in the floorplan: {', '.join(unknown)}")
+        if item_ids is not None:
+            unknown = [item_id for item_id in self.items if item_id not in item_ids]
+            if unknown:
+                raise ValueError(f"Scenario items not in the simulation: {', '.join(unknown)}")
+
+    def placements(self, graph, floorplan=None, item_ids=None):
+        """``(robot_node, user_node, item_nodes, blocked_nodes)`` like ``randomize_entities``, after ``check``."""
+        self.check(graph, floorplan, item_ids)
+        return self.robot, self.user, dict(self.items), list(self.blocked)
+
+    def world(self, graph, logger=None, events=None):
+        """A new World on a copy of graph set up as the scenario says."""
+        self.check(graph)
+        return World.spawn(graph, list(self.items), self.robot, self.user, self.items, self.blocked, logger, events)
+
+
+def save_scenarios(path, scenarios):
+    """Writes scenarios to one compact scenario file (gzipped if path ends in .gz); returns how many.
+
+    The first line is a header naming the format and the item ids; each scenario is
+    then one line, ``[floorplan, robot, user, item nodes, blocked, seed, command]``,
+    with the item nodes in header order and null for an item the scenario leaves out.
+    """
+    scenarios = list(scenarios)
+    item_ids = list(dict.fromkeys(item_id for scenario in scenarios for item_id in scenario.items))
+    with (gzip.open if path.endswith(".gz") else open)(path, "wt") as file:
+        file.write(json.dumps({"format": SCENARIO_FORMAT, "version": SCENARIO_VERSION, "items": item_ids},
+                              separators=(",", ":")) + "\n")
+        for scenario in scenarios:
+            row = [scenario.floorplan, scenario.robot, scenario.user,
+                   [scenario.items.get(item_id) for item_id in item_ids], scenario.blocked, scenario.seed,
+                   scenario.command]
+            file.write(json.dumps(row, separators=(",", ":")) + "\n")
+    return len(scenarios)
+
+
+def iter_scenarios(path, floorplan=None):
+    """Yields the scenarios in a scenario file, or the episodes of an event log, in file order.
+
+    floorplan names the house of event-log episodes that do not record it (schema 3 and older).
+    """
+    with (gzip.open if path.endswith(".gz") else open)(path, "rt") as file:
+        header = json.loads(file.readline() or "null")
+        if not isinstance(header, dict):
+            raise ValueError(f"{path}: not a scenario file or event log")
+        if header.get("format") == SCENARIO_FORMAT:
+            if header["version"] != SCENARIO_VERSION:
+                raise ValueError(f"{path}: scenario file version {header['version']}, expected {SCENARIO_VERSION}")
+            item_ids = header["items"]
+            for line in file:
+                if not line.strip():
+                    continue
+                plan, robot, user, item_nodes, blocked, seed, command = json.loads(line)
+                items = {item_id: node for item_id, node in zip(item_ids, item_nodes) if node is not None}
+                yield Scenario(plan, robot, user, items, blocked, seed, command)
+            return
+    if "type" not in header:
+        raise ValueError(f"{path}: not a scenario file or event log")
+    for event in read_events(path, types=("episode",)):
+        yield Scenario.from_episode(event, floorplan)
+
+
+def load_scenario(spec, floorplan=None):
+    """The scenario ``spec`` names: ``path`` for the first one in a file, ``path:N`` for the Nth from 0."""
+    path, _, index = spec.rpartition(":")
+    if not (path and index.isdigit()):
+        path, index = spec, "0"
+    for n, scenario in enumerate(iter_scenarios(path, floorplan)):
+        if n == int(index):
+            return scenario
+    raise ValueError(f"{path} has no scenario {index}")
+
+
+def benchmark(scenarios=10000):
+    """Saves, loads and spawns worlds from scenarios, one file for all vs one JSON file each. Returns a report."""
+    import tempfile
+
+    from .world import Graph
+
+    graph = Graph()
+    for row in range(8):
+        for column in range(8):
+            graph.add_node("grid", f"n{row}{column}", (column * 100, row * 100))
+            if column:
+                graph.add_edge(f"n{row}{column - 1}", f"n{row}{column}")
+            if row:
+                graph.add_edge(f"n{row - 1}{column}", f"n{row}{column}")
+    item_ids = ["water", "banana", "toothbrush", "comb", "toothpaste", "sunglasses", "burger", "broom"]
+    generated = [Scenario.random("grid", graph, item_ids, num_blocked=4, seed=seed, command="Bring water to me")
+                 for seed in range(scenarios)]
+    report = [f"{scenarios} scenarios:"]
+    with tempfile.TemporaryDirectory() as directory:
+        bulk = os.path.join(directory, "scenarios.jsonl")
+        started = time.perf_counter()
+        save_scenarios(bulk, generated)
+        save_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        loaded = list(iter_scenarios(bulk))
+        load_seconds = time.perf_counter() - started
+        if [scenario.to_dict() for scenario in loaded] != [scenario.to_dict() for scenario in generated]:
+            raise AssertionError("Scenarios changed on the way through the scenario file")
+        report.append(f"  one scenario file: {os.path.getsize(bulk) / scenarios:.0f} bytes each, saved in "
+                      f"{save_seconds * 1000:.0f} ms, loaded in {load_seconds * 1000:.0f} ms "
+                      f"({load_seconds / scenarios * 1e6:.1f} us each)")
+        compressed = os.path.join(directory, "scenarios.jsonl.gz")
+        save_scenarios(compressed, generated)
+        report.append(f"  gzipped: {os.path.getsize(compressed) / scenarios:.0f} bytes each")
+
+        separate = os.path.join(directory, "separate")
+        os.makedirs(separate)
+        started = time.perf_counter()
+        for n, scenario in enumerate(generated):
+            with open(os.path.join(separate, f"{n:06d}.json"), "w") as file:
+                json.dump(scenario.to_dict(), file, indent=2)
+        save_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        for name in sorted(os.listdir(separate)):
+            with open(os.path.join(separate, name)) as file:
+                Scenario.from_dict(json.load(file))
+        load_seconds = time.perf_counter() - started
+        size = sum(os.path.getsize(os.path.join(separate, name)) for name in os.listdir(separate))
+        report.append(f"  one JSON file each: {size / scenarios:.0f} bytes each, saved in {save_seconds * 1000:.0f} ms, "
+                      f"loaded in {load_seconds * 1000:.0f} ms ({load_seconds / scenarios * 1e6:.1f} us each)")
+
+        started = time.perf_counter()
+        for scenario in iter_scenarios(bulk):
+            scenario.world(graph)
+        seconds = time.perf_counter() - started
+        report.append(f"  loading and spawning a world for each: {seconds / scenarios * 1e6:.1f} us each")
+    return "\n".join(report)
+
+
+if __name__ == "__main__":
+    print(benchmark())
@@ -0,0 +1,276 @@
+import asyncio
+import inspect
+import itertools
+import math
+import threading
+import time
+
+QUEUED = "queued"
+DISPATCHED = "dispatched"
+PREEMPTED = "preempted"
+DELIVERED = "delivered"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class SimulatedClock:
+    """Simulated wall clock that advances by a fixed amount for every robot hop."""
+    def __init__(self, seconds_per_hop=3.0):
+        self.seconds_per_hop = seconds_per_hop
+        self.now = 0.0
+        self._lock = threading.Lock()
+
+    def tick(self, hops=1):
+        with self._lock:
+            self.now += hops * self.seconds_per_hop
+
+    def __call__(self):
+        return self.now
+
+
+class DeliveryJob:
+    """A request to bring one item to a destination node ('me' means the user's node)."""
+    def __init__(self, job_id, item_id, destination="me", priority=0, deadline=None, submitted_at=0.0):
+        self.job_id = job_id
+        self.item_id = item_id
+        self.destination = destination
+        self.priority = priority
+        self.deadline = deadline
+        self.state = QUEUED
+        self.submitted_at = submitted_at
+        self.dispatched_at = None
+        self.finished_at = None
+        self.preemptions = 0
+        self.history = [(QUEUED, submitted_at)]
+
+    @property
+    def late(self):
+        return self.deadline is not None and self.finished_at is not None and self.finished_at > self.deadline
+
+    @property
+    def queue_latency(self):
+        """Simulated seconds between submission and first dispatch, or None."""
+        if self.dispatched_at is None:
+            return None
+        return self.dispatched_at - self.submitted_at
+
+    def _set_state(self, state, now):
+        self.state = state
+        self.history.append((state, now))
+
+    def sort_key(self):
+        # Highest priority first, then earliest deadline, then first come first served.
+        deadline = self.deadline if self.deadline is not None else math.inf
+        return (-self.priority, deadline, self.submitted_at, self.job_id)
+
+    def __repr__(self):
+        return f"DeliveryJob({self.job_id}, {self.item_id!r} -> {self.destination!r}, p={self.priority}, {self.state})"
+
+
+class Trip:
+    """A group of compatible jobs sent to the agent as one command."""
+    def __init__(self, jobs, command):
+        self.jobs = jobs
+        self.command = command
+        self.handle = None
+        self.preempted = False
+
+    @property
+    def priority(self):
+        return max(job.priority for job in self.jobs)
+
+
+def trip_command(jobs):
+    """Builds the natural-language command for a trip, e.g. 'Bring water to me then banana'."""
+    destination = jobs[0].destination
+    target = "me" if destination == "me" else f"node {destination}"
+    command = f"Bring {jobs[0].item_id} to {target}"
+    for job in jobs[1:]:
+        command += f" then {job.item_id}"
+    return command
+
+
+class JobScheduler:
+    """Feeds structured delivery jobs to the agent through a CommandRuntime.
+
+    Pending jobs are ordered by priority, then deadline. Jobs with the same destination
+    are merged into one trip of up to ``max_batch`` items. A job whose priority is at
+    least ``urgent_priority`` preempts a running trip of lower priority; the jobs of the
+    preempted trip go back in the queue. ``submit_batch`` queues a task's jobs before
+    anything is dispatched, so they can share a trip.
+
+    Args:
+        runtime (CommandRuntime): runtime the trip commands are submitted to.
+        clock: callable returning the current (simulated) time in seconds.
+        is_delivered: optional ``is_delivered(job)`` check run after a trip finishes;
+            without it a trip whose command completed counts as delivered.
+        max_batch (int): maximum number of jobs merged into one trip.
+        urgent_priority (int): priority at which a job preempts a running trip.
+        on_preempted: optional callable or coroutine function run when a preempted trip has
+            stopped, before its jobs are queued again, e.g. to put down the item the robot was
+            carrying. It changes the world, so pass it through the tools' ToolGate.
+        logger (Logger): optional simulation logger.
+    """
+    def __init__(self, runtime, clock=time.monotonic, is_delivered=None, max_batch=2, urgent_priority=10,
+                 logger=None, on_preempted=None):
+        self.runtime = runtime
+        self.clock = clock
+        self.is_delivered = is_delivered
+        self.max_batch = max_batch
+        self.urgent_priority = urgent_priority
+        self.on_preempted = on_preempted
+        self.logger = logger
+        self.jobs = {}
+        self.active_trip = None
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+
+    def submit(self, item_id, destination="me", priority=0, deadline=None):
+        """Queues a delivery job and dispatches it as soon as the robot is free. Returns the job."""
+        return self.submit_batch([item_id], destination, priority, deadline)[0]
+
+    def submit_batch(self, item_ids, destination="me", priority=0, deadline=None):
+        """Queues one job per item, then dispatches, so the jobs of one task can be merged. Returns the jobs."""
+        with self._lock:
+            now = self.clock()
+            jobs = []
+            for item_id in item_ids:
+                job = DeliveryJob(next(self._ids), item_id, destination, priority, deadline, submitted_at=now)
+                self.jobs[job.job_id] = job
+                jobs.append(job)
+                self._log(f"Job {job.job_id} queued: {item_id} -> {destination} (priority {priority}, deadline {deadline})")
+            trip = self.active_trip
+            if jobs and trip and not trip.preempted and priority >= self.urgent_priority and priority > trip.priority:
+                trip.preempted = True
+                self._log(f"Job {jobs[0].job_id} preempts trip '{trip.command}'")
+                self.runtime.cancel(trip.handle.command_id)
+            else:
+                self._dispatch()
+            return jobs
+
+    def cancel(self, job_id):
+        """Withdraws a job that has not been dispatched yet."""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.state != QUEUED:
+                return False
+            job._set_state(CANCELLED, self.clock())
+            return True
+
+    def pending(self):
+        """Queued jobs in dispatch order."""
+        with self._lock:
+            return sorted((job for job in self.jobs.values() if job.state == QUEUED), key=DeliveryJob.sort_key)
+
+    def wait_idle(self, timeout=None):
+        """Blocks until no trip is running and no job is queued; returns True if that happened in time."""
+        with self._changed:
+            return self._changed.wait_for(lambda: self.active_trip is None and not self.pending(), timeout)
+
+    def _dispatch(self):
+        if self.active_trip is not None:
+            return
+        queue = self.pending()
+        if not queue:
+            return
+        head = queue[0]
+        batch = [head]
+        for job in queue[1:]:
+            if len(batch) >= self.max_batch:
+                break
+            if job.destination != head.destination or any(job.item_id == other.item_id for other in batch):
+                continue
+            if head.priority >= self.urgent_priority and job.priority < self.urgent_priority:
+                # Urgent trips are not slowed down by routine pick-ups.
+                continue
+            batch.append(job)
+        now = self.clock()
+        for job in batch:
+            if job.dispatched_at is None:
+                job.dispatched_at = now
+            job._set_state(DISPATCHED, now)
+        trip = Trip(batch, trip_command(batch))
+        self.active_trip = trip
+        self._log(f"Dispatching trip for jobs {[job.job_id for job in batch]}: {trip.command}")
+        trip.handle = self.runtime.submit(trip.command)
+        trip.handle.add_done_callback(lambda handle: self._on_trip_done(trip))
+
+    def _on_trip_done(self, trip):
+        if trip.preempted and self.on_preempted:
+            # Done callbacks run on the loop thread, so the gated clean-up gets its own task there.
+            asyncio.get_running_loop().create_task(self._clean_up_preempted(trip))
+        else:
+            self._settle(trip)
+
+    async def _clean_up_preempted(self, trip):
+        result = self.on_preempted()
+        if inspect.isawaitable(result):
+            await result
+        self._settle(trip)
+
+    def _settle(self, trip):
+        """Records how a finished trip's jobs ended and dispatches the next trip."""
+        with self._lock:
+            now = self.clock()
+            for job in trip.jobs:
+                if self.is_delivered is not None:
+                    delivered = self.is_delivered(job)
+                else:
+                    delivered = trip.handle.state == "done"
+                if delivered:
+                    job.finished_at = now
+                    job._set_state(DELIVERED, now)
+                elif trip.preempted:
+                    job.preemptions += 1
+                    job._set_state(PREEMPTED, now)
+                    job._set_state(QUEUED, now)
+                else:
+                    job.finished_at = now
+                    job._set_state(FAILED, now)
+            self._log(f"Trip '{trip.command}' finished ({trip.handle.state}): "
+                      + ", ".join(f"job {job.job_id} {job.state}" for job in trip.jobs))
+            self.active_trip = None
+            self._dispatch()
+            self._changed.notify_all()
+
+    def stats(self):
+        """Throughput in deliveries per simulated hour and queueing latency percentiles."""
+        with self._lock:
+            jobs = list(self.jobs.values())
+            delivered = [job for job in jobs if job.state == DELIVERED]
+            latencies = sorted(job.queue_latency for job in jobs if job.queue_latency is not None)
+            start = min((job.submitted_at for job in jobs), default=0.0)
+            end = max((job.finished_at for job in delivered), default=start)
+            elapsed_hours = (end - start) / 3600
+            return {
+                "submitted": len(jobs),
+                "delivered": len(delivered),
+                "failed": sum(1 for job in jobs if job.state == FAILED),
+                "late": sum(1 for job in delivered if job.late),
+                "preemptions": sum(job.preemptions for job in jobs),
+                "deliveries_per_hour": len(delivered) / elapsed_hours if elapsed_hours > 0 else 0.0,
+                "queue_latency_p50": percentile(latencies, 50),
+                "queue_latency_p90": percentile(latencies, 90),
+                "queue_latency_p99": percentile(latencies, 99),
+            }
+
+    def report(self):
+        stats = self.stats()
+        return (f"Scheduler: {stats['delivered']}/{stats['submitted']} delivered, {stats['failed']} failed, "
+                f"{stats['late']} late, {stats['preemptions']} preemptions, "
+                f"{stats['deliveries_per_hour']:.1f} deliveries/simulated hour, queue latency "
+                f"p50={stats['queue_latency_p50']:.1f}s p90={stats['queue_latency_p90']:.1f}s "
+                f"p99={stats['queue_latency_p99']:.1f}s")
+
+    def _log(self, message):
+        if self.logger:
+            self.logger.log_info(message, category="planning")
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list; 0.0 for an empty list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
@@ -0,0 +1,72 @@
+class WorldSnapshot:
+    """Compact, versioned summary of everything the agent needs to orient itself in one tool call.
+
+    The version increases whenever the robot's node, held item, the user's node, any item
+    location or the set of discovered blocked nodes changes. Within a conversation a
+    repeat request for a version that was already sent is answered with
+    ``v<n> unchanged`` instead of the full text.
+
+    Example result::
+
+        v3 robot=gr6(guest room) held=- user=gr4 items=water:of2,banana:of3 blocked=lr5
+
+    Args:
+        robot (Robot): the robot; ``robot.blocked_nodes`` holds the blocked nodes it has run into.
+        item_manager (ItemLocationManager): item locations.
+        user_node: callable returning the user's current node.
+        logger (Logger): optional simulation logger.
+    """
+    def __init__(self, robot, item_manager, user_node, logger=None):
+        self.robot = robot
+        self.item_manager = item_manager
+        self.user_node = user_node
+        self.logger = logger
+        self.version = 0
+        self._fingerprint = None
+        self._cache = {}
+        self._sent = set()
+
+    def new_conversation(self):
+        """Forgets what was sent, so the next snapshot is sent in full."""
+        self._sent = set()
+
+    def refresh(self):
+        """Bumps the version if the world changed since the last call. Returns the version."""
+        robot = self.robot
+        fingerprint = (
+            robot.current_node,
+            robot.held_item.item_id if robot.held_item else None,
+            self.user_node(),
+            tuple(sorted(self.item_manager.get_all_items().items())),
+            tuple(robot.blocked_nodes),
+        )
+        if fingerprint != self._fingerprint:
+            self._fingerprint = fingerprint
+            self.version += 1
+            self._cache = {}
+        return self.version
+
+    def __call__(self, item_ids=None):
+        version = self.refresh()
+        key = None if item_ids is None else tuple(item_ids)
+        if (version, key) in self._sent:
+            result = f"v{version} unchanged"
+        else:
+            if key not in self._cache:
+                self._cache[key] = self.encode(item_ids)
+            result = self._cache[key]
+            self._sent.add((version, key))
+        if self.logger:
+            self.logger.debug("planning", "get_world_snapshot: %s", result)
+        return result
+
+    def encode(self, item_ids=None):
+        robot = self.robot
+        locations = self.item_manager.get_all_items()
+        held = robot.held_item.item_id if robot.held_item else None
+        if item_ids is None:
+            item_ids = list(locations)
+        item_text = ",".join(f"{item_id}:{'held' if item_id == held else locations.get(item_id, '?')}"
+                             for item_id in item_ids)
+        return (f"v{self.version} robot={robot.current_node}({robot.current_room()}) held={held or '-'} "
+                f"user={self.user_node()} items={item_text or '-'} blocked={','.join(robot.blocked_nodes) or '-'}")
@@ -0,0 +1,322 @@
+import asyncio
+import contextlib
+import re
+
+from .fastpath import parse_command
+from .runtime import ToolGate
+
+
+class SpeculativeExecutor:
+    """Drives ahead along the path the model is most likely to take while it is still deliberating.
+
+    Once the next target is known (the next requested item, or the user once an item is
+    held) the executor predicts the ``get_path`` result from the node the model believes
+    the robot is at, and in the background moves the robot along it one hop every
+    ``hop_seconds``. When the model then asks for those hops they are confirmed without
+    waiting; if it asks for anything that contradicts the speculation the robot is driven
+    back to where the model thinks it is before the call is applied.
+
+    Args:
+        robot (Robot): robot being driven.
+        graph (Graph): navigation graph.
+        item_manager (ItemLocationManager): item locations.
+        user_node: callable returning the user's current node.
+        items (dict): known items, used to find targets in the command text.
+        move: callable moving the robot one hop, called as ``move(node, speculative=True)``;
+            defaults to ``robot.move_to_node``.
+        gate (ToolGate): gate the tools go through; each speculative hop takes its turn on it.
+        hop_seconds (float): simulated drive time per hop, for speculative moves and for real ones,
+            whether the model asks for them one at a time or with ``execute_path``.
+        premove (bool): drive ahead speculatively; with False paths are only pre-computed.
+        enabled (bool): with False, ``wrap`` and ``speculating`` are no-ops.
+        logger (Logger): optional simulation logger.
+    """
+    def __init__(self, robot, graph, item_manager, user_node, items, move=None, gate=None, hop_seconds=0.5,
+                 premove=True, enabled=True, logger=None):
+        self.robot = robot
+        self.graph = graph
+        self.item_manager = item_manager
+        self.user_node = user_node
+        self.items = items
+        self.move = move or robot.move_to_node
+        self.gate = gate if gate is not None else ToolGate()
+        self._hop_ahead = self.gate.writer(self._step_ahead)
+        self._hop_back = self.gate.writer(self._step_back)
+        self.hop_seconds = hop_seconds
+        self.premove = premove
+        self.enabled = enabled
+        self.logger = logger
+        self.targets = []
+        self.virtual_node = None  # Where the model believes the robot is
+        self.premoved = []  # Hops driven ahead of virtual_node that the model has not asked for yet
+        self.prediction = None
+        self._prediction_scored = True
+        self._task = None
+        # Report counters
+        self.predictions = 0
+        self.hits = 0
+        self.misses = 0
+        self.confirmed_hops = 0
+        self.rolled_back_hops = 0
+        self.deliveries = 0
+
+    @property
+    def saved_seconds(self):
+        """Drive time saved by confirmed speculative hops, minus time spent rolling back."""
+        return (self.confirmed_hops - self.rolled_back_hops) * self.hop_seconds
+
+    @property
+    def misspeculation_rate(self):
+        scored = self.hits + self.misses
+        return self.misses / scored if scored else 0.0
+
+    @contextlib.asynccontextmanager
+    async def speculating(self, command):
+        """Context for one command's conversation: speculation starts on entry and is settled on exit."""
+        if not self.enabled:
+            yield
+            return
+        self._begin(command)
+        try:
+            yield
+        finally:
+            await self._settle()
+            if self.premoved:
+                self._score(False)
+                await self._rollback()
+
+    def wrap(self, function_map):
+        """Returns a copy of an async tool map with the movement and planning tools intercepted.
+
+        ``execute_path`` runs from the node the model believes the robot is at, so any
+        drive-ahead is undone before it starts; so does ``get_world_snapshot``, which
+        reports the robot's real node.
+        """
+        if not self.enabled:
+            return function_map
+        wrapped = dict(function_map)
+        originals = dict(function_map)
+
+        async def get_item_location(item_id):
+            await self._settle()
+            location = await originals["get_item_location"](item_id)
+            if location and item_id in self.items and self.robot.held_item is None:
+                if item_id in self.targets:
+                    self.targets.remove(item_id)
+                self.targets.insert(0, item_id)
+                self._predict(self.graph.find_path(self.virtual_node, location))
+            return location
+
+        async def get_current_position():
+            await self._settle()
+            if not self.premoved:
+                return await originals["get_current_position"]()
+            if self.logger:
+                self.logger.debug("planning", "Current position retrieved: %s", self.virtual_node)
+            return self.virtual_node
+
+        async def get_path(start_node, target_node):
+            await self._settle()
+            path = await originals["get_path"](start_node, target_node)
+            if start_node == self.virtual_node:
+                self._score(self.prediction == path)
+                self._predict(path)
+            return path
+
+        async def get_alternative_path(start_node, target_node, blocked_nodes):
+            # The tool plans from the robot's real node, so it must be where the model thinks.
+            await self._settle()
+            await self._rollback()
+            path = await originals["get_alternative_path"](start_node, target_node, blocked_nodes)
+            if path:
+                self._predict(path)
+            return path
+
+        async def move_robot(next_node):
+            await self._settle()
+            if self.premoved and self.premoved[0] == next_node:
+                self.premoved.pop(0)
+                self.robot.confirm_move(self.virtual_node, next_node)
+                self._advance(next_node)
+                self.confirmed_hops += 1
+                self._score(True)
+                self._schedule()
+                return f"Moved to {next_node}"
+            if self.premoved:
+                self._score(False)
+                await self._rollback()
+            await asyncio.sleep(self.hop_seconds)
+            result = await originals["move_robot"](next_node)
+            if result == f"Moved to {next_node}":
+                if not (self.prediction and next_node in self.prediction):
+                    self._score(False)
+                    self.prediction = None
+                self._advance(next_node)
+            self._schedule()
+            return result
+
+        def settled(name, on_success=None):
+            async def call(*args, **kwargs):
+                await self._settle()
+                await self._rollback()
+                result = await originals[name](*args, **kwargs)
+                if on_success:
+                    on_success(*args, **kwargs)
+                return result
+            return call
+
+        async def execute_path(nodes):
+            result = await settled("execute_path", path_followed)(nodes)
+            # Charged after the walk, so a path costs the same drive time as its single hops
+            hops = re.search(r"after (\d+) hops", result)
+            if hops:
+                await asyncio.sleep(self.hop_seconds * int(hops.group(1)))
+            return result
+
+        def path_followed(nodes):
+            self._advance(self.robot.current_node)
+            self.prediction = None
+
+        def picked_up(item_id):
+            if self.robot.held_item is not None:
+                self._predict(self.graph.find_path(self.virtual_node, self.user_node()))
+
+        def dropped_off(item_id, node_id):
+            if self.robot.held_item is None:
+                self.deliveries += 1
+                if item_id in self.targets:
+                    self.targets.remove(item_id)
+                self._predict_next()
+
+        overrides = {
+            "get_item_location": get_item_location,
+            "get_current_position": get_current_position,
+            "get_path": get_path,
+            "get_alternative_path": get_alternative_path,
+            "move_robot": move_robot,
+            "execute_path": execute_path,
+            "pick_up_item_robot": settled("pick_up_item_robot", picked_up),
+            "drop_off_item_robot": settled("drop_off_item_robot", dropped_off),
+            "get_world_snapshot": settled("get_world_snapshot"),
+        }
+        for name, func in overrides.items():
+            if name in originals:
+                wrapped[name] = func
+        return wrapped
+
+    def report(self):
+        per_delivery = self.saved_seconds / self.deliveries if self.deliveries else 0.0
+        return (f"Speculation: {self.predictions} predictions, {self.hits} confirmed, {self.misses} mis-speculated "
+                f"({self.misspeculation_rate:.0%}), {self.confirmed_hops} hops driven ahead, "
+                f"{self.rolled_back_hops} rolled back, {self.saved_seconds:.1f}s saved over {self.deliveries} "
+                f"deliveries ({per_delivery:.1f}s per delivery)")
+
+    def _begin(self, command):
+        deliveries = parse_command(command, self.items)
+        if deliveries is not None:
+            self.targets = [item_id for item_id, _ in deliveries]
+        else:
+            words = command.lower().replace(",", " ").split()
+            self.targets = [item_id for item_id in self.items if item_id.lower() in words]
+            self.targets.sort(key=lambda item_id: words.index(item_id.lower()))
+        self.virtual_node = self.robot.current_node
+        self.premoved = []
+        self.prediction = None
+        self._prediction_scored = True
+        self._predict_next()
+
+    def _predict_next(self):
+        if self.robot.held_item is not None:
+            target = self.user_node()
+        else:
+            target = next((self.item_manager.get_all_items().get(item_id) for item_id in self.targets
+                           if self.item_manager.get_all_items().get(item_id)), None)
+        if target is None or target == self.virtual_node:
+            self.prediction = None
+            return
+        self._predict(self.graph.find_path(self.virtual_node, target))
+
+    def _predict(self, path):
+        """Adopts path as the expected route, keeping speculative hops that lie along it."""
+        if not path or path[0] != self.virtual_node:
+            self.prediction = None
+            return
+        if path != self.prediction:
+            self.predictions += 1
+            self._prediction_scored = False
+        self.prediction = path
+        if self._agreed_hops() < len(self.premoved):
+            # The drive-ahead went the wrong way; the extra hops are undone in the background.
+            self._score(False)
+        self._schedule()
+
+    def _advance(self, node):
+        """Records that the model now believes the robot is at node."""
+        self.virtual_node = node
+        if self.prediction and node in self.prediction:
+            self.prediction = self.prediction[self.prediction.index(node):]
+
+    def _score(self, hit):
+        if self._prediction_scored:
+            return
+        self._prediction_scored = True
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def _schedule(self):
+        if not self.premove or not self.prediction or self._task is not None:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._drive_ahead())
+
+    def _agreed_hops(self):
+        """Number of speculative hops that still lie along the current prediction."""
+        path = self.prediction or [self.virtual_node]
+        agreed = 0
+        for node, expected in zip(self.premoved, path[1:]):
+            if node != expected:
+                break
+            agreed += 1
+        return agreed
+
+    async def _drive_ahead(self):
+        try:
+            await self._rollback(keep=self._agreed_hops())
+            for node in self.prediction[len(self.premoved) + 1:]:
+                if node in self.robot.blocked_nodes:
+                    return
+                await asyncio.sleep(self.hop_seconds)
+                if not await self._hop_ahead(node):
+                    return
+        finally:
+            # Done driving, so the next prediction may start another drive-ahead.
+            if self._task is asyncio.current_task():
+                self._task = None
+
+    def _step_ahead(self, node):
+        """One speculative hop towards node; True if the robot got there."""
+        if self.move(node, speculative=True) != f"Moved to {node}":
+            return False
+        self.premoved.append(node)
+        return True
+
+    def _step_back(self):
+        """Undoes the last speculative hop."""
+        self.premoved.pop()
+        self.move(self.premoved[-1] if self.premoved else self.virtual_node, speculative=True)
+        self.rolled_back_hops += 1
+
+    async def _settle(self):
+        """Stops any drive-ahead in progress so the world is stable for a tool call."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self._rollback(keep=self._agreed_hops())
+
+    async def _rollback(self, keep=0):
+        """Drives back along the speculative hops until only ``keep`` of them remain."""
+        while len(self.premoved) > keep:
+            await asyncio.sleep(self.hop_seconds)
+            await self._hop_back()
@@ -0,0 +1,128 @@
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+MARKS_ENV = "FETCHGPT_STARTUP_MARKS"
+MARK_PREFIX = "startup-mark:"
+# Command-line flags a simulation script is started with in each benchmarked mode
+MODES = {
+    "headless": ["--headless"],
+    "offline": ["--headless", "--offline"],
+    "windowed": ["--frames", "1"],
+}
+# The mark each mode waits for: the task being submitted, or the first frame being on screen
+FIRST_COMMAND_MARK = {"headless": "command", "offline": "command", "windowed": "frame"}
+
+
+def mark(event):
+    """Tells a running startup benchmark that event has happened; does nothing otherwise."""
+    if os.environ.get(MARKS_ENV):
+        print(f"{MARK_PREFIX} {event}", file=sys.stderr, flush=True)
+
+
+def parse_importtime(line):
+    """``(module, depth, self_us, cumulative_us)`` for one ``-X importtime`` line, None for anything else."""
+    if not line.startswith("import time:"):
+        return None
+    fields = line[len("import time:"):].split("|", 2)
+    try:
+        self_us, cumulative_us = int(fields[0]), int(fields[1])
+    except (IndexError, ValueError):
+        return None  # The header line
+    name = fields[2].rstrip("\n")
+    depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+    return name.strip(), depth, self_us, cumulative_us
+
+
+class StartupRun:
+    """One launch of a simulation script under ``-X importtime``.
+
+    Attributes:
+        marks (dict): seconds from launch to each ``mark`` the script made.
+        imports (list): ``(module, cumulative_us, before_first_command)`` for every top-level import.
+        wall (float): seconds from launch to exit.
+    """
+    def __init__(self, mode):
+        self.mode = mode
+        self.marks = {}
+        self.imports = []
+        self.wall = None
+        self.returncode = None
+        self.stderr_tail = []
+
+    @property
+    def first_command(self):
+        return self.marks.get(FIRST_COMMAND_MARK[self.mode])
+
+    def import_ms(self, before_first_command=False):
+        return sum(us for _, us, before in self.imports if before or not before_first_command) / 1000
+
+
+def run_once(script, mode, extra_args=(), timeout=120):
+    """Launches script in mode and returns its StartupRun once it has exited."""
+    run = StartupRun(mode)
+    command = [sys.executable, "-X", "importtime", script, *MODES[mode], *extra_args]
+    env = dict(os.environ, **{MARKS_ENV: "1"})
+    started = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, env=env)
+
+    def read_stderr():
+        for line in process.stderr:
+            now = time.perf_counter() - started
+            if line.startswith(MARK_PREFIX):
+                run.marks.setdefault(line[len(MARK_PREFIX):].strip(), now)
+                continue
+            parsed = parse_importtime(line)
+            if parsed is None:
+                run.stderr_tail = (run.stderr_tail + [line.rstrip()])[-20:]
+            elif parsed[1] == 0:
+                run.imports.append((parsed[0], parsed[3], run.first_command is None))
+
+    reader = threading.Thread(target=read_stderr, daemon=True)
+    reader.start()
+    try:
+        run.returncode = process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        run.returncode = process.wait()
+    run.wall = time.perf_counter() - started
+    reader.join()
+    return run
+
+
+def benchmark(script, modes=tuple(MODES), runs=3, seed=7, top=8):
+    """Times script's startup in each mode over several launches. Returns a report string.
+
+    Reports the median time from launch to the first command (``headless``/``offline``:
+    the generated task being submitted; ``windowed``: the first frame on screen, i.e.
+    the window accepting input), how much of that was spent importing, and the slowest
+    top-level imports that happened before it. The windowed mode opens a real window
+    unless ``SDL_VIDEODRIVER=dummy`` is set.
+    """
+    lines = [f"Startup of {script}, median of {runs} runs:"]
+    for mode in modes:
+        results = [run_once(script, mode, ("--seed", str(seed))) for _ in range(runs)]
+        failed = [run for run in results if run.returncode != 0 or run.first_command is None]
+        if failed:
+            tail = "\n    ".join(failed[0].stderr_tail)
+            lines.append(f"  {mode}: failed with exit code {failed[0].returncode}\n    {tail}")
+            continue
+        first = statistics.median(run.first_command for run in results) * 1000
+        before = statistics.median(run.import_ms(before_first_command=True) for run in results)
+        total = statistics.median(run.import_ms() for run in results)
+        wall = statistics.median(run.wall for run in results) * 1000
+        lines.append(f"  {mode}: ready for the first command after {first:.0f} ms ({before:.0f} ms of it importing), "
+                     f"{total:.0f} ms importing in total, exited after {wall:.0f} ms")
+        slowest = sorted((entry for entry in results[-1].imports if entry[2]), key=lambda entry: -entry[1])[:top]
+        lines.append("    slowest imports before it: " + ", ".join(f"{name} {us / 1000:.0f} ms" for name, us, _ in slowest))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # python -m fetchgpt.startup 8-rm.py [runs] [mode ...]
+    script = sys.argv[1] if len(sys.argv) > 1 else "8-rm.py"
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    print(benchmark(script, modes=tuple(sys.argv[3:]) or tuple(MODES), runs=runs))
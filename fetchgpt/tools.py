@@ -0,0 +1,74 @@
+import copy
+
+# Tools that only read world state. Several of these in one assistant message run
+# concurrently; everything else runs alone, in the order the model asked for it.
+READ_ONLY_TOOLS = frozenset({
+    "get_current_position",
+    "get_path",
+    "get_alternative_path",
+    "get_user_node",
+    "get_item_location",
+})
+
+
+def as_tools(functions):
+    """Converts legacy ``"functions"`` schemas into the ``"tools"`` format.
+
+    The tools interface lets the model return several tool calls in one assistant
+    message instead of one function call per turn.
+    """
+    tools = []
+    for function in functions:
+        function = copy.deepcopy(function)
+        if not function.get("parameters"):
+            function["parameters"] = {"type": "object", "properties": {}}
+        tools.append({"type": "function", "function": function})
+    return tools
+
+
+def count_model_turns(chat_result):
+    """Number of assistant messages in an autogen ChatResult, i.e. model round trips."""
+    return sum(1 for message in chat_result.chat_history if message.get("role") == "assistant")
+
+
+def follow_path(graph, robot, nodes, move=None, logger=None):
+    """Drives the robot along nodes, one ``move_to_node`` hop at a time, as a single tool call.
+
+    A leading node equal to the robot's position is skipped, so a ``get_path`` result can
+    be passed as is. The whole path is checked against ``graph.edges`` before the robot
+    moves; an invalid path leaves the robot where it is. The walk stops at the first
+    blocked node.
+
+    Args:
+        graph (Graph): navigation graph.
+        robot (Robot): robot to drive.
+        nodes (list): node ids to visit in order.
+        move: callable moving the robot one hop, defaults to ``robot.move_to_node``.
+        logger (Logger): optional simulation logger; every hop is logged by the move itself.
+
+    Returns:
+        str: ``Arrived at <node> after <n> hops``, ``Stopped at <node> after <n> hops: node <id> blocked``
+        or ``Invalid path: ...``.
+    """
+    move = move or robot.move_to_node
+    nodes = list(nodes)
+    if nodes and nodes[0] == robot.current_node:
+        nodes = nodes[1:]
+    previous = robot.current_node
+    for node in nodes:
+        if node not in graph.edges.get(previous, {}):
+            result = f"Invalid path: {node} is not adjacent to {previous}; robot stays at {robot.current_node}"
+            break
+        previous = node
+    else:
+        hops = 0
+        result = f"Arrived at {robot.current_node} after 0 hops"
+        for node in nodes:
+            if move(node) != f"Moved to {node}":
+                result = f"Stopped at {robot.current_node} after {hops} hops: node {node} blocked"
+                break
+            hops += 1
+            result = f"Arrived at {node} after {hops} hops"
+    if logger:
+        logger.log("execute_path: %s: %s", nodes, result, category="movement")
+    return result
@@ -0,0 +1,461 @@
+import random
+
+from .snapshot import WorldSnapshot
+from .tools import follow_path
+
+
+class User:
+    def __init__(self, node_id, preferred_side='left'):
+        self.node_id = node_id
+        self.preferred_side = preferred_side  # 'left' or 'right'
+
+
+class Item:
+    def __init__(self, item_id):
+        self.item_id = item_id
+
+
+class ItemLocationManager:
+    def __init__(self, logger=None):
+        self.item_locations = {}  # Key: item_id, Value: node_id
+        self.logger = logger
+
+    def update_item_location(self, item_id, node_id):
+        self.item_locations[item_id] = node_id
+
+    def remove_item(self, item_id):
+        if item_id in self.item_locations:
+            del self.item_locations[item_id]
+
+    def get_item_location(self, item_id):
+        # Retrieve the item's location
+        location = self.item_locations.get(item_id, None)
+
+        # Log the retrieval action
+        if self.logger:
+            if location:
+                self.logger.debug("items", "Retrieved location for item '%s': %s", item_id, location)
+            else:
+                self.logger.debug("items", "Location for item '%s' not found.", item_id)
+
+        return location
+
+    def get_all_items(self):
+        """Returns a dictionary of all item IDs and their locations."""
+        return self.item_locations
+
+
+class Robot:
+    """The delivery robot.
+
+    Args:
+        start_node (str): node the robot starts at.
+        graph (Graph): navigation graph.
+        logger (Logger): optional simulation logger.
+        items (dict): Item objects by id; ``held_item`` is taken from here on pick-up.
+        events (EventLog): optional event log for moves, blocked attempts, pick-ups and drop-offs.
+    """
+    def __init__(self, start_node, graph, logger=None, items=None, events=None):
+        self.current_node = start_node
+        self.graph = graph
+        self.logger = logger
+        self.events = events
+        self.items = {} if items is None else items
+        self.x, self.y = self.graph.get_node_coordinates(start_node)
+        self.path = []
+        self.blocked_nodes = []
+        self.blockage_encountered = False
+        self.state_version = 0  # Bumped whenever the robot, the items or the known blocked nodes change
+        self.held_item = None  # Initialize held_item as None
+
+    def move_to_node(self, target_node, speculative=False):
+        """Moves one hop to target_node. Speculative hops are driven ahead of the model and are
+        logged and emitted as such; ``confirm_move`` records one once the model asks for it."""
+        # No need to find a path; just check if the next node is blocked or not.
+        if target_node in self.graph.blocked_nodes:
+            # If trying to move to a blocked node, log the event and do not update position.
+            if target_node not in self.blocked_nodes:
+                self.blocked_nodes.append(target_node)  # Remember the blocked nodes discovered so far
+                self.state_version += 1
+            if self.logger:
+                self.logger.log("%s to move to blocked node %s.", "Speculatively attempted" if speculative else "Attempted",
+                                target_node, category="movement")
+            if self.events:
+                self.events.emit("blocked", node=target_node, from_node=self.current_node, speculative=speculative)
+            return f"Node {target_node} blocked"
+        elif target_node in self.graph.get_all_nodes():
+            # Update the robot's current position to the target node if it is not blocked.
+            from_node, self.current_node = self.current_node, target_node
+            self.x, self.y = self.graph.get_node_coordinates(target_node)
+            self.state_version += 1
+            if self.logger:
+                self.logger.debug("movement", "%s to node %s.", "Speculatively moved" if speculative else "Moved",
+                                  target_node)
+            if self.events:
+                self.events.emit("move", node=target_node, from_node=from_node, speculative=speculative)
+            return f"Moved to {target_node}"
+
+    def confirm_move(self, from_node, target_node):
+        """Records the speculative hop from_node -> target_node as taken; the robot is already there."""
+        if self.logger:
+            self.logger.debug("movement", "Moved to node %s.", target_node)
+        if self.events:
+            self.events.emit("move", node=target_node, from_node=from_node, speculative=False)
+
+    def move_to_coordinates(self, x, y):
+        """Updates the robot's position based on coordinates. Not typically used with graph navigation."""
+        self.x, self.x = x, y
+        if self.logger:
+            self.logger.debug("movement", "Robot moved to new coordinates: (%s, %s)", x, y)
+
+    def current_position(self):
+        """Returns the current position of the robot."""
+        return self.current_node
+
+    def current_room(self):
+        """Determines the current room based on the robot's node."""
+        for room_name, room_nodes in self.graph.nodes.items():
+            if self.current_node in room_nodes:
+                return room_name
+        return "Unknown room"
+
+    def pick_up_item(self, item_manager, item_id):
+        """Attempts to pick up a specified item.
+
+        Args:
+            item_manager (ItemLocationManager): The manager controlling item locations.
+            item_id (str): The ID of the item to pick up.
+
+        Returns:
+            str: A message indicating the result of the pick-up attempt.
+        """
+        if self.held_item is not None:
+            # One item at a time: picking up another would lose the one being carried
+            if self.logger:
+                self.logger.log("Failed to pick up item %s at %s: holding %s", item_id, self.current_node,
+                                self.held_item.item_id, category="items")
+            if self.events:
+                self.events.emit("pick_up", item=item_id, node=self.current_node, ok=False)
+            return f"Failed to pick up item {item_id}. Already holding {self.held_item.item_id}."
+        if item_manager.get_item_location(item_id) == self.current_node:
+            self.held_item = self.items[item_id]  # Assume item is identified by its ID for simplicity
+            item_manager.remove_item(item_id)
+            self.state_version += 1
+            if self.logger:
+                self.logger.log("Picked up item %s at %s", item_id, self.current_node, category="items")
+            if self.events:
+                self.events.emit("pick_up", item=item_id, node=self.current_node, ok=True)
+            return f"Picked up item {item_id}"
+        else:
+            if self.logger:
+                self.logger.log("Failed to pick up item %s at %s", item_id, self.current_node, category="items")
+            if self.events:
+                self.events.emit("pick_up", item=item_id, node=self.current_node, ok=False)
+            return f"Failed to pick up item {item_id}. Item not at robot's current location."
+
+    def drop_off_item(self, item_manager, item_id, node_id):
+        if self.held_item == self.items[item_id]:
+            self.held_item = None  # The robot is no longer holding the item
+            item_manager.update_item_location(item_id, node_id)
+            self.state_version += 1
+            if self.logger:
+                self.logger.log("Dropped off item %s at %s", item_id, node_id, category="items")
+            if self.events:
+                self.events.emit("drop_off", item=item_id, node=node_id)
+
+
+class Graph:
+    def __init__(self, blocked_nodes=None):
+        self.nodes = {}
+        self.edges = {}
+        self.blocked_nodes = blocked_nodes if blocked_nodes else []
+        self.topology_version = 0  # Bumped whenever a node or edge is added, so cached map layers know to redraw
+
+    def copy(self):
+        """An independent graph with the same nodes, edges and blocked nodes, for spawning another world."""
+        graph = Graph(list(self.blocked_nodes))
+        graph.nodes = {room_name: dict(nodes) for room_name, nodes in self.nodes.items()}
+        graph.edges = {node_id: dict(connections) for node_id, connections in self.edges.items()}
+        graph.topology_version = self.topology_version
+        return graph
+
+    def add_blocked_node(self, node_id):
+        if node_id not in self.blocked_nodes:
+            self.blocked_nodes.append(node_id)
+
+    def add_node(self, room_name, node_id, coordinates):
+        if room_name not in self.nodes:
+            self.nodes[room_name] = {}
+        self.nodes[room_name][node_id] = coordinates
+        self.topology_version += 1
+
+    def add_edge(self, node1, node2, weight=1):
+        if node1 not in self.edges:
+            self.edges[node1] = {}
+        if node2 not in self.edges:
+            self.edges[node2] = {}
+        self.edges[node1][node2] = weight
+        self.edges[node2][node1] = weight
+        self.topology_version += 1
+
+    def find_path(self, start, end):
+        if start == end:
+            return [start]
+        visited = {start}
+        queue = [[start]]
+        while queue:
+            path = queue.pop(0)
+            node = path[-1]
+            for adjacent in self.edges.get(node, {}):
+                if adjacent not in visited:
+                    new_path = list(path)
+                    new_path.append(adjacent)
+                    queue.append(new_path)
+                    if adjacent == end:
+                        return new_path
+                    visited.add(adjacent)
+        return []
+
+    def find_path_avoiding_blocked_nodes(self, start, end, blocked_nodes):
+        if start == end:
+            return [start]
+        visited = {start}
+        queue = [[start]]
+        while queue:
+            path = queue.pop(0)
+            node = path[-1]
+            if node in blocked_nodes:
+                continue  # Skip this node as it's blocked, but continue searching other paths
+            for adjacent in self.edges.get(node, {}):
+                if adjacent not in visited and adjacent not in blocked_nodes:
+                    new_path = list(path)
+                    new_path.append(adjacent)
+                    queue.append(new_path)
+                    if adjacent == end:
+                        return new_path  # Return this path as soon as end node is reached
+                    visited.add(adjacent)
+        return None  # Return None if no path is found avoiding the blocked nodes
+
+    def get_node_coordinates(self, node_id):
+        for room, nodes in self.nodes.items():
+            if node_id in nodes:
+                return nodes[node_id]
+        return None
+
+    def get_all_nodes(self):
+        """Retrieves all nodes from the graph."""
+        return {node for room_nodes in self.nodes.values() for node in room_nodes}
+
+
+class Room:
+    def __init__(self, name, x1, y1, x2, y2, graph):
+        self.name = name
+        self.bounds = (x1, y1, x2, y2)
+        self.graph = graph
+        self.nodes = []
+
+    def is_inside(self, x, y, margin=0):
+        """Check if a given point is inside the room considering an optional margin."""
+        x1, y1, x2, y2 = self.bounds
+        return (x1 - margin) <= x <= (x2 + margin) and (y1 - margin) <= y <= (y2 + margin)
+
+    def add_node(self, node_id, coordinates):
+        """Adds a node to the room and the associated graph."""
+        self.nodes.append(node_id)
+        self.graph.add_node(self.name, node_id, coordinates)
+
+    def add_edge(self, node1, node2, weight=1):
+        """Adds an edge between two nodes within the room in the graph."""
+        if node1 in self.nodes and node2 in self.nodes:
+            self.graph.add_edge(node1, node2, weight)
+
+    def get_node_coordinates(self, node_id):
+        """Get the coordinates of a specific node within the room."""
+        return self.graph.get_node_coordinates(node_id)
+
+
+def randomize_entities(graph, items, num_blocked, rng=random):
+    """Picks blocked nodes, then robot, user and item nodes among the rest. Returns them in that order."""
+    all_nodes = sorted(graph.get_all_nodes())  # Sorted so a seeded run picks the same nodes every time
+
+    # Initialize the list for blocked nodes
+    blocked_nodes = []
+
+    # Assign blocked nodes using random integers
+    while len(blocked_nodes) < num_blocked:
+        index = rng.randint(0, len(all_nodes) - 1)
+        blocked_node = all_nodes.pop(index)
+        blocked_nodes.append(blocked_node)
+
+    # Filter out nodes ending with '5' or '6' for other entities
+    eligible_nodes = [node for node in all_nodes if not node.endswith('5') and not node.endswith('6')]
+
+    # Assign the robot node using a random integer
+    robot_index = rng.randint(0, len(eligible_nodes) - 1)
+    robot_node = eligible_nodes.pop(robot_index)
+
+    # Assign the user node using a random integer
+    user_index = rng.randint(0, len(eligible_nodes) - 1)
+    user_node = eligible_nodes.pop(user_index)
+
+    # Assign item nodes using random integers
+    item_nodes = {}
+    for item_id in items:
+        item_index = rng.randint(0, len(eligible_nodes) - 1)
+        item_node = eligible_nodes.pop(item_index)
+        item_nodes[item_id] = item_node
+
+    # Return the assigned nodes
+    return robot_node, user_node, item_nodes, blocked_nodes
+
+
+class World:
+    """One simulated house and everything in it, with the robot's tools as methods.
+
+    Holds what the scripts keep in the module globals ``graph``, ``robot``,
+    ``item_manager`` and ``me``; ``function_map()`` gives the tools to register with an
+    agent. Worlds share nothing, so any number of them can run in one process, and this
+    module imports neither pygame nor autogen. The scripts subclass ``User``, ``Item``
+    and ``Robot`` to attach sprites.
+
+    Args:
+        graph (Graph): navigation graph, including this world's blocked nodes.
+        robot (Robot): the robot.
+        user (User): the user the robot delivers to.
+        item_manager (ItemLocationManager): item locations.
+        items (dict): Item objects by id.
+        logger (Logger): optional simulation logger.
+        events (EventLog): optional event log; the robot's own events are emitted by the robot.
+        on_move: optional callable run with the target node after every hop attempt, e.g. to
+            advance a simulated clock.
+    """
+    def __init__(self, graph, robot, user, item_manager, items, logger=None, on_move=None, events=None):
+        self.graph = graph
+        self.robot = robot
+        self.user = user
+        self.item_manager = item_manager
+        self.items = items
+        self.logger = logger
+        self.events = events
+        self.on_move = on_move
+        self.snapshot = WorldSnapshot(robot, item_manager, lambda: self.user.node_id, logger=logger)
+
+    @classmethod
+    def spawn(cls, graph, item_ids, robot_node, user_node, item_nodes, blocked_nodes=(), logger=None, events=None):
+        """A new world on a copy of graph, so one floorplan can seed many worlds."""
+        graph = graph.copy()
+        graph.blocked_nodes = list(blocked_nodes)
+        items = {item_id: Item(item_id) for item_id in item_ids}
+        item_manager = ItemLocationManager(logger)
+        for item_id, node_id in item_nodes.items():
+            item_manager.update_item_location(item_id, node_id)
+        robot = Robot(robot_node, graph, logger, items, events)
+        return cls(graph, robot, User(user_node), item_manager, items, logger, events=events)
+
+    @classmethod
+    def random(cls, graph, item_ids, num_blocked=4, rng=random, logger=None, events=None):
+        """A new world with blocked nodes, robot, user and items placed like the scripts place them."""
+        robot_node, user_node, item_nodes, blocked_nodes = randomize_entities(graph, item_ids, num_blocked, rng)
+        return cls.spawn(graph, item_ids, robot_node, user_node, item_nodes, blocked_nodes, logger, events)
+
+    def function_map(self):
+        """The robot's tools by name, bound to this world."""
+        return {
+            "move_robot": self.move_robot,
+            "execute_path": self.execute_path,
+            "get_current_position": self.get_current_position,
+            "get_path": self.get_path,
+            "get_alternative_path": self.get_alternative_path,
+            "pick_up_item_robot": self.pick_up_item_robot,
+            "drop_off_item_robot": self.drop_off_item_robot,
+            "get_item_location": self.get_item_location,
+            "get_user_node": self.get_user_node,
+            "get_world_snapshot": self.get_world_snapshot,
+        }
+
+    def move_robot(self, next_node, speculative=False):
+        """Moves the robot to the next node."""
+        result = self.robot.move_to_node(next_node, speculative)
+        if self.on_move:
+            self.on_move(next_node)
+        return result
+
+    def execute_path(self, nodes):
+        """Moves the robot along a whole path in one call, stopping at the first blocked node."""
+        return follow_path(self.graph, self.robot, nodes, move=self.move_robot, logger=self.logger)
+
+    def get_current_position(self):
+        position = self.robot.current_position()
+        self._debug("Current position retrieved: %s", position)
+        return position
+
+    def get_robot_current_room(self):
+        """Get the name of the room where the robot currently is."""
+        return self.robot.current_room()
+
+    def get_path(self, start_node, target_node):
+        """Finds a path from the start node to the target node."""
+        assert start_node in self.graph.get_all_nodes(), "Start must be a valid node identifier."
+        assert target_node in self.graph.get_all_nodes(), "Target must be a valid node identifier."
+        path = self.graph.find_path(start_node, target_node)
+        self._debug("get_path: Path from %s to %s: %s", start_node, target_node, path)
+        if self.events:
+            self.events.emit("path_query", kind="path", start=start_node, target=target_node, avoiding=None, path=path)
+        return path
+
+    def get_alternative_path(self, start_node, target_node, blocked_nodes):
+        """Finds an alternative path from the robot's node avoiding certain nodes; start_node is ignored."""
+        start_node = self.robot.current_node
+        path = self.graph.find_path_avoiding_blocked_nodes(start_node, target_node, blocked_nodes)
+        self._debug("get_alternative_path: Alternative path from %s to %s avoiding %s: %s",
+                    start_node, target_node, blocked_nodes, path)
+        if self.events:
+            self.events.emit("path_query", kind="alternative", start=start_node, target=target_node,
+                             avoiding=blocked_nodes, path=path or [])
+        return path
+
+    def get_node_info(self, room_name):
+        """The nodes of a room and the edges between them, or an empty dict for an unknown room."""
+        if room_name not in self.graph.nodes:
+            return {}
+        node_names = list(self.graph.nodes[room_name].keys())
+        edges = {}
+        for node in node_names:
+            if node in self.graph.edges:
+                # Only include edges that are within the same room
+                edges[node] = {edge: weight for edge, weight in self.graph.edges[node].items() if edge in node_names}
+        return {'nodes': node_names, 'edges': edges}
+
+    def pick_up_item_robot(self, item_id):
+        """Commands the robot to pick up an item."""
+        return self.robot.pick_up_item(self.item_manager, item_id)
+
+    def drop_off_item_robot(self, item_id, node_id):
+        """Commands the robot to drop off an item."""
+        return self.robot.drop_off_item(self.item_manager, item_id, node_id)
+
+    def get_item_location(self, item_id):
+        location = self.item_manager.get_item_location(item_id)
+        if self.events:
+            self.events.emit("item_lookup", item=item_id, node=location)
+        return location
+
+    def put_down_held_item(self):
+        """Drops whatever the robot carries at its current node, e.g. when its trip is preempted; returns the item id."""
+        held_item = self.robot.held_item
+        if held_item is None:
+            return None
+        self.robot.drop_off_item(self.item_manager, held_item.item_id, self.robot.current_node)
+        return held_item.item_id
+
+    def get_user_node(self):
+        """Retrieves the node at which the user is currently located."""
+        return self.user.node_id
+
+    def get_world_snapshot(self, item_ids=None):
+        """The robot, user, item and known blocked-node state in one compact string."""
+        return self.snapshot(item_ids)
+
+    def _debug(self, message, *args):
+        if self.logger:
+            self.logger.debug("planning", message, *args)